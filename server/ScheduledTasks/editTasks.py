@@ -15,7 +15,10 @@ def test_proc():
 
 def edits_take_effect():
     if settings.APPLY_APPROVED_EDITS:
-        views_edits.apply_edits()
+        report = views_edits.apply_edits()
+        seconds = report['seconds']
+        print('apply_edits: {0} edits applied to {1} rows in {2:.1f}s ({3:.1f} edits/s), {4} edits of missing rows'.format(
+            report['edits'], report['rows'], seconds, report['edits'] / seconds if seconds > 0 else 0, report['missing']))
 
 
 def deactivate_expired_api_tokens():
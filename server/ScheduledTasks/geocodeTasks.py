@@ -0,0 +1,10 @@
+# geocodeTasks.py
+# The AHJ Registry
+# October, 2026
+import sys
+sys.path.append('..')
+from ahj_app import geocode_jobs
+
+
+def process_geocode_jobs():
+    geocode_jobs.process_all_geocode_jobs()
@@ -4,7 +4,7 @@
 
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
-from ScheduledTasks import editTasks
+from ScheduledTasks import editTasks, geocodeTasks
 from django.conf import settings
 
 
@@ -14,4 +14,5 @@ def start():
         scheduler.add_job(editTasks.test_proc, 'interval', seconds=60)
     scheduler.add_job(editTasks.edits_take_effect, 'cron', hour=3, jitter=10)
     scheduler.add_job(editTasks.deactivate_expired_api_tokens, 'cron', hour=3, jitter=10)
+    scheduler.add_job(geocodeTasks.process_geocode_jobs, 'interval', seconds=settings.GEOCODE_JOB_INTERVAL_SECONDS, max_instances=1)
     scheduler.start()
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'ahj_app.middleware.MetricsMiddleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -159,6 +160,13 @@ LOGGING = {
             'when': 'midnight',
             'backupCount': 14,
             'formatter': 'verbose'
+        },
+        'slow_requests_file': {
+            'level': 'WARNING',
+            'class': 'logging.handlers.TimedRotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs/slow_requests.log'),
+            'when': 'midnight',
+            'backupCount': 14
         }
     },
     'loggers': {
@@ -167,6 +175,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'ahj_app.slow_requests': {
+            'handlers': ['slow_requests_file'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
 
@@ -206,6 +219,85 @@ ADMIN_ACCOUNT_EMAIL = ''
 ADMIN_ACCOUNT_PASSWORD = ''
 APPLY_APPROVED_EDITS = True
 
+# Load the jurisdiction polygons into memory when a worker starts
+# so location searches do not query the polygon tables.
+SPATIAL_INDEX_ENABLED = False
+# How often a process checks whether the polygons changed since its spatial index was loaded
+SPATIAL_INDEX_CHECK_INTERVAL_SECONDS = 300
+
+# Find the polygons containing a location by descending from its state to its counties and the polygons
+# within them, when the spatial index is not loaded (see ahj_app/polygon_hierarchy.py).
+# `manage.py rebuild_polygon_hierarchy` builds the hierarchy; translate_polygons rebuilds it.
+POLYGON_HIERARCHY_ENABLED = False
+
+# Find the polygons containing a location from the geohash cell containing it, testing only the polygons
+# crossing the cell, when the spatial index is not loaded (see ahj_app/geo_grid.py).
+# `manage.py rebuild_geo_grid` builds the grid; translate_polygons rebuilds it.
+GEO_GRID_ENABLED = False
+# Number of geohash characters of the grid cells; 5 characters is about 4.9 km by 4.9 km
+GEO_GRID_PRECISION = 5
+
+# Load the AHJ names into an in-memory trigram index when a worker starts, so name searches
+# and ahj-private/autocomplete/ do not scan the AHJ table (see ahj_app/name_index.py).
+NAME_INDEX_ENABLED = False
+# How often a process checks whether the AHJs changed since its name index was loaded
+NAME_INDEX_CHECK_INTERVAL_SECONDS = 300
+
+# Maximum number of Locations accepted by one request to geo/location/batch/
+GEO_LOCATION_BATCH_MAX_SIZE = 10000
+
+# Serve AHJs from their stored serialized documents (see ahj_app/documents.py).
+# `manage.py rebuild_ahj_documents` builds every document ahead of the first requests.
+AHJ_DOCUMENTS_ENABLED = False
+
+# How often a process checks whether other processes changed the enum tables (see ahj_app/enum_registry.py)
+ENUM_REGISTRY_CHECK_INTERVAL_SECONDS = 60
+
+# Levels of replies and newest replies per comment serialized under an AHJ or comment (see ahj_app/prefetch.py).
+# Replies past either limit are read a page at a time from ahj/comment/replies/.
+COMMENT_THREAD_MAX_DEPTH = 10
+COMMENT_THREAD_MAX_REPLIES = 50
+
+# Default detail level of the polygons returned by the AHJ and data map endpoints (see ahj_app/polygon_detail.py).
+# Endpoints take a ?detail= parameter of 'none', 'low', 'medium', 'high', or 'full'.
+AHJ_POLYGON_DETAIL_DEFAULT = 'full'
+DATA_MAP_POLYGON_DETAIL_DEFAULT = 'medium'
+
+# Directory of the rendered vector tiles served by tiles/<z>/<x>/<y>.mvt (see ahj_app/vector_tiles.py).
+# Set to None to render every tile request.
+VECTOR_TILE_CACHE_DIR = os.path.join(BASE_DIR, 'tile_cache')
+
+# Cache the responses of ahj/, ahj-one/, geo/location/, and geo/address/ (see ahj_app/response_cache.py).
+# Cached responses are dropped when any AHJ data changes, or after the timeout.
+AHJ_RESPONSE_CACHE_ENABLED = False
+AHJ_RESPONSE_CACHE_TIMEOUT_SECONDS = 24 * 60 * 60
+
+# Record the SQL queries, time taken, and response size of each request per URL name,
+# served in the Prometheus text format by /metrics to superusers (see ahj_app/metrics.py).
+METRICS_ENABLED = False
+# Number of the latest requests of each URL name the quantiles are computed from
+METRICS_WINDOW_SIZE = 1000
+# Requests taking at least this many seconds are logged with their SQL to logs/slow_requests.log.
+# Set to None to not log requests or keep their SQL.
+METRICS_SLOW_REQUEST_SECONDS = None
+
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# The 'ahj_responses' cache may use any backend, for example
+# 'django.core.cache.backends.filebased.FileBasedCache' with a directory LOCATION to share it between processes,
+# or a Redis backend such as 'django_redis.cache.RedisCache' (requires django-redis) with a 'redis://...' LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ahj_responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ahj_responses',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -244,3 +336,23 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 GOOGLE_MAPS_KEY = ''
+
+# Geocoder called on geocode cache misses: 'google' or 'stub' (offline, see ahj_app/geocoding.py)
+GEOCODER = 'google'
+GEOCODE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+GEOCODE_CACHE_MAX_ENTRIES = 100000
+
+# Queued geocoding of added and edited addresses (see ahj_app/geocode_jobs.py)
+GEOCODE_JOB_INTERVAL_SECONDS = 30
+GEOCODE_JOB_BATCH_SIZE = 100
+GEOCODE_JOB_RATE_PER_SECOND = 10
+GEOCODE_JOB_MAX_ATTEMPTS = 5
+# Delay before the first retry of a failed job, doubled for each later retry
+GEOCODE_JOB_RETRY_SECONDS = 60
+
+# Async variants of the search endpoints, served by an ASGI server (see ahj_app/views_ahjsearch_async.py).
+# Geocoding awaits a pooled HTTP client, and at most ASYNC_DB_MAX_THREADS threads of the event loop's
+# executor, which the ASGI_THREADS environment variable sizes, run database work at once (see ahj_app/async_db.py).
+ASYNC_DB_MAX_THREADS = 10
+ASYNC_GEOCODER_MAX_CONNECTIONS = 20
+ASYNC_GEOCODER_TIMEOUT_SECONDS = 10
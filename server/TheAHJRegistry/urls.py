@@ -16,7 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from ahj_app import views_misc
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('ahj_app.urls')),
+    path('metrics', views_misc.metrics, name='metrics'),
 ]
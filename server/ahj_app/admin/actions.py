@@ -8,6 +8,7 @@ from django.shortcuts import render
 from django.utils import timezone
 
 from .form import UserResetPasswordForm, UserDeleteToggleAPITokenForm, EditApproveForm, UserGenerateAPITokenForm
+from .. import enum_registry
 from ..models import User, APIToken, Edit, AHJUserMaintains, Comment
 from ..usf import dict_filter_keys_start_with, ENUM_FIELDS
 from ..views_edits import apply_edits, reset_edit, edit_is_resettable
@@ -20,12 +21,13 @@ def get_value_or_primary_key(obj, field):
     If the field is an enum field, its value is returned.
     If the field is a related field, the its primary key is returned.
     """
+    if field in ENUM_FIELDS:
+        value = enum_registry.get_field_value(obj, field)
+        return value if value is not None else ''
     value = getattr(obj, field)
     field_class_name = obj._meta.get_field(field).__class__.__name__
     if value is None:
         value = ''
-    elif field in ENUM_FIELDS:
-        value = value.Value
     elif field_class_name == 'ForeignKey' or field_class_name == 'OneToOneField':
         value = value.pk
     return value
@@ -18,6 +18,25 @@ class AhjConfig(AppConfig):
         # Start the updater for db procedures
         from ScheduledTasks import updater
         updater.start()
-
-
-
+        # Load the spatial index of the polygons if enabled, and reload it when they change
+        from . import spatial_index
+        spatial_index.start()
+        spatial_index.connect_signals()
+        # Load the name index of the AHJs if enabled
+        from . import name_index
+        name_index.start()
+        # Invalidate stored AHJ documents when their rows change
+        from . import documents
+        documents.connect_signals()
+        # Clear the enum registry when enum rows change
+        from . import enum_registry
+        enum_registry.connect_signals()
+        # Delete the simplified geometries of polygons when they change
+        from . import polygon_detail
+        polygon_detail.connect_signals()
+        # Recount the data map's code coverage when AHJs and polygons change
+        from . import coverage
+        coverage.connect_signals()
+        # Delete the cached vector tiles drawing polygons and AHJs when they change
+        from . import vector_tiles
+        vector_tiles.connect_signals()
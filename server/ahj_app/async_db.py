@@ -0,0 +1,55 @@
+"""
+Database work of async views.
+
+Django's ORM is synchronous, so async views run their queries in threads
+with run_sync. The threads are those of the event loop's default executor,
+which the ASGI_THREADS environment variable sizes, and at most
+settings.ASYNC_DB_MAX_THREADS of them run database work at once, which also
+bounds the number of database connections an ASGI worker keeps open.
+
+Like Django does at the start and end of a request, each call closes the
+thread's connection if it is unusable or older than CONN_MAX_AGE, since
+requests no longer start and finish on the threads running their queries.
+The queries are counted in the metrics of the request awaiting them.
+"""
+import asyncio
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import metrics
+
+"""
+A semaphore of each event loop; asyncio semaphores cannot be shared between loops
+"""
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_semaphore():
+    loop = asyncio.get_event_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(settings.ASYNC_DB_MAX_THREADS)
+    return semaphore
+
+
+def call_with_connection(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        request_metrics = metrics.get_request_metrics()
+        if request_metrics is None:
+            return func(*args, **kwargs)
+        with connection.execute_wrapper(request_metrics.record_query):
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Calls a function running database queries in a thread, and returns its result.
+    """
+    async with get_semaphore():
+        return await sync_to_async(call_with_connection, thread_sensitive=False)(func, *args, **kwargs)
@@ -0,0 +1,322 @@
+"""
+Micro-benchmarks and a load driver for the search and edit code paths.
+
+The micro-benchmarks call filter_ahjs, AHJSerializer, apply_edits,
+order_ahj_list_AHJLevelCode_PolygonLandArea, and build_field_val_dict
+directly, with inputs taken from the data of benchmark_data.py. The load
+driver sends concurrent requests to ahj/, geo/location/, and
+data-vis/data-map/, through the Django test client in this process or with
+HTTP to a running server.
+
+Each benchmark reports the percentiles and mean of its latency in seconds,
+the mean number of SQL queries per call or request, and the memory it
+allocated at most (micro-benchmarks) or the peak resident memory of the
+process (load). compare_results compares the results with a baseline saved
+by an earlier run, and reports the benchmarks whose median latency grew by
+more than a tolerance or that run more queries, so the run_benchmarks
+management command can fail a deploy on a regression.
+"""
+import concurrent.futures
+import resource
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from faker import Faker
+from rest_framework.test import APIClient
+
+from .benchmark_data import BENCHMARK_AHJ_CODE_PREFIX, get_benchmark_user
+from .metrics import get_quantile
+from .models import AHJ, APIToken, Edit
+from .serializers import AHJSerializer
+from .usf import build_field_val_dict
+from .utils import filter_ahjs, get_public_api_serializer_context, get_str_location, order_ahj_list_AHJLevelCode_PolygonLandArea
+from .views_edits import apply_edits
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+"""
+Number of AHJs serialized or sorted per call, like a page of search results
+"""
+SERIALIZER_BENCHMARK_SIZE = 20
+ORDER_BENCHMARK_SIZE = 500
+
+"""
+Number of flattened CSV rows built per call of build_field_val_dict
+"""
+FIELD_VAL_DICT_BENCHMARK_ROWS = 100
+
+class RollBack(Exception):
+    pass
+
+
+def summarize(name, seconds, queries, memory_bytes):
+    """
+    Returns the result of a benchmark given the seconds and queries of each call or request.
+    """
+    seconds = sorted(seconds)
+    result = OrderedDict([('name', name), ('calls', len(seconds))])
+    for percentile in PERCENTILES:
+        result[f'p{int(percentile * 100)}_seconds'] = get_quantile(seconds, percentile) if seconds else None
+    result['mean_seconds'] = sum(seconds) / len(seconds) if seconds else None
+    result['queries'] = sum(queries) / len(queries) if queries else None
+    result['memory_bytes'] = memory_bytes
+    return result
+
+
+def run_benchmark(name, func, repeat, rollback=False):
+    """
+    Calls func repeat times, and once more to measure the memory it allocates.
+    If rollback is True, each call is made in a transaction that is rolled back,
+    so calls that change the data see the same data every time.
+    """
+    def call():
+        if not rollback:
+            return func()
+        try:
+            with transaction.atomic():
+                func()
+                raise RollBack()
+        except RollBack:
+            pass
+
+    call()  # Warm up the enum registry, caches, and connection
+    seconds = []
+    queries = []
+    for i in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            call()
+            seconds.append(time.perf_counter() - start)
+        queries.append(len(captured.captured_queries))
+    tracemalloc.start()
+    try:
+        call()
+        memory_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize(name, seconds, queries, memory_bytes)
+
+
+"""
+Inputs of the benchmarks
+"""
+
+
+def get_benchmark_ahjs():
+    ahjs = AHJ.objects.filter(AHJCode__startswith=BENCHMARK_AHJ_CODE_PREFIX).select_related('PolygonID')
+    return list(ahjs.order_by('AHJPK')[:ORDER_BENCHMARK_SIZE])
+
+
+def get_sample_location(ahjs):
+    """
+    Returns the middle of the polygon of a generated city, which is inside its county and state.
+    """
+    ahj = next((ahj for ahj in reversed(ahjs) if ahj.PolygonID is not None), None)
+    if ahj is None:
+        return None
+    return {'Latitude': {'Value': float(ahj.PolygonID.InternalPLatitude)},
+            'Longitude': {'Value': float(ahj.PolygonID.InternalPLongitude)}}
+
+
+def get_flattened_rows(count, seed=0):
+    """
+    Returns rows like those of the AHJ data CSV that build_field_val_dict reads.
+    """
+    fake = Faker('en_US')
+    fake.seed_instance(seed)
+    rows = []
+    for i in range(count):
+        row = {
+            'AHJName.Value': fake.city(),
+            'AHJCode.Value': fake.bothify('??-#####'),
+            'AHJLevelCode.Value': '50',
+            'BuildingCode.Value': '2018IBC',
+            'Description.Value': fake.sentence(),
+            'Address.AddrLine1.Value': fake.street_address(),
+            'Address.City.Value': fake.city(),
+            'Address.StateProvince.Value': fake.state_abbr(),
+            'Address.ZipPostalCode.Value': fake.zipcode()
+        }
+        for j in range(3):
+            row[f'Contacts[{j}].FirstName.Value'] = fake.first_name()
+            row[f'Contacts[{j}].LastName.Value'] = fake.last_name()
+            row[f'Contacts[{j}].Email.Value'] = fake.email()
+            row[f'Contacts[{j}].Address.City.Value'] = fake.city()
+        rows.append(row)
+    return rows
+
+
+def get_micro_benchmarks():
+    """
+    Returns an OrderedDict of the name of each micro-benchmark to
+    its function and whether its changes must be rolled back.
+    """
+    ahjs = get_benchmark_ahjs()
+    if len(ahjs) == 0:
+        raise ValueError('No benchmark data; run the generate_benchmark_data management command first')
+    str_location = get_str_location(get_sample_location(ahjs))
+    name = ahjs[-1].AHJName
+    state = AHJ.objects.filter(AHJPK=ahjs[0].AHJPK).values_list('AddressID__StateProvince', flat=True).first()
+    page_ahjpks = [ahj.AHJPK for ahj in ahjs[:SERIALIZER_BENCHMARK_SIZE]]
+
+    def get_page():
+        # Freshly read, since the serializer keeps the rows it loads on the instances
+        return list(AHJ.objects.filter(AHJPK__in=page_ahjpks).order_by('AHJPK'))
+    edits = list(Edit.objects.filter(AHJPK__AHJCode__startswith=BENCHMARK_AHJ_CODE_PREFIX, ReviewStatus='A')
+                             .select_related('ApprovedBy').order_by('EditID')[:ORDER_BENCHMARK_SIZE])
+    rows = get_flattened_rows(FIELD_VAL_DICT_BENCHMARK_ROWS)
+    return OrderedDict([
+        ('filter_ahjs_name', (lambda: list(filter_ahjs(AHJName=name)), False)),
+        ('filter_ahjs_location', (lambda: list(filter_ahjs(location=str_location)), False)),
+        ('filter_ahjs_state', (lambda: list(filter_ahjs(StateProvince=state)), False)),
+        ('ahj_serializer_public', (lambda: AHJSerializer(get_page(), many=True, context=get_public_api_serializer_context()).data, False)),
+        ('ahj_serializer_private', (lambda: AHJSerializer(get_page(), many=True, context={'is_public_view': False}).data, False)),
+        ('apply_edits', (lambda: apply_edits(ready_edits=edits), True)),
+        ('order_ahj_list_AHJLevelCode_PolygonLandArea', (lambda: order_ahj_list_AHJLevelCode_PolygonLandArea(list(ahjs)), False)),
+        ('build_field_val_dict', (lambda: [build_field_val_dict(row) for row in rows], False))
+    ])
+
+
+def run_micro_benchmarks(repeat=20, names=None):
+    return [run_benchmark(name, func, repeat, rollback=rollback)
+            for name, (func, rollback) in get_micro_benchmarks().items() if names is None or name in names]
+
+
+"""
+Load driver
+"""
+
+
+def get_api_token():
+    """
+    Returns an active API token of the benchmark user.
+    """
+    user = get_benchmark_user()
+    token = APIToken.objects.filter(user=user).first()
+    if token is None:
+        token = APIToken.objects.create(user=user)
+    if not token.is_active or token.expires is not None:
+        APIToken.objects.filter(pk=token.pk).update(is_active=True, expires=None)
+    return token.key
+
+
+def get_load_requests(location):
+    """
+    Returns an OrderedDict of each load endpoint to its method, URL path, and request body.
+    """
+    return OrderedDict([
+        ('ahj', ('post', reverse('ahj-public'), {'Location': location})),
+        ('geo-location', ('post', reverse('ahj-geo-location'), location)),
+        ('data-map', ('get', reverse('data-map'), None))
+    ])
+
+
+def get_server_name():
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def send_requests_in_process(method, path, data, token, count):
+    """
+    Sends requests through the Django test client, counting the queries of each.
+    Runs on a thread of the load driver, with its own database connection.
+    """
+    client = APIClient(SERVER_NAME=get_server_name())
+    client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+    seconds, queries, errors = [], [], 0
+    try:
+        for i in range(count):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(client, method)(path, data, format='json') if data is not None else getattr(client, method)(path)
+                seconds.append(time.perf_counter() - start)
+            queries.append(len(captured.captured_queries))
+            errors += response.status_code >= 400
+    finally:
+        connection.close()
+    return seconds, queries, errors
+
+
+def send_requests_over_http(base_url, method, path, data, token, count):
+    # NOTE: Imported here because only the load driver sending HTTP requests needs it
+    import requests
+    session = requests.Session()
+    session.headers['Authorization'] = 'Token ' + token
+    seconds, errors = [], 0
+    for i in range(count):
+        start = time.perf_counter()
+        response = session.request(method, base_url.rstrip('/') + path, json=data)
+        seconds.append(time.perf_counter() - start)
+        errors += response.status_code >= 400
+    return seconds, [], errors
+
+
+def get_max_rss_bytes():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def run_load(requests_per_endpoint=200, concurrency=4, base_url=None, token=None, names=None):
+    """
+    Sends requests_per_endpoint requests to each endpoint from concurrency threads at once.
+    Requests go through the Django test client, or to the server at base_url if given.
+    Queries and memory are only measured in this process.
+    """
+    ahjs = get_benchmark_ahjs()
+    if len(ahjs) == 0:
+        raise ValueError('No benchmark data; run the generate_benchmark_data management command first')
+    token = token if token is not None else get_api_token()
+    results = []
+    for name, (method, path, data) in get_load_requests(get_sample_location(ahjs)).items():
+        if names is not None and name not in names:
+            continue
+        counts = [requests_per_endpoint // concurrency + (i < requests_per_endpoint % concurrency) for i in range(concurrency)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if base_url is None:
+                futures = [executor.submit(send_requests_in_process, method, path, data, token, count) for count in counts]
+            else:
+                futures = [executor.submit(send_requests_over_http, base_url, method, path, data, token, count) for count in counts]
+            start = time.perf_counter()
+            outcomes = [future.result() for future in futures]
+            wall_seconds = time.perf_counter() - start
+        result = summarize('load_' + name, [s for seconds, queries, errors in outcomes for s in seconds],
+                           [q for seconds, queries, errors in outcomes for q in queries],
+                           get_max_rss_bytes() if base_url is None else None)
+        result['errors'] = sum(errors for seconds, queries, errors in outcomes)
+        result['requests_per_second'] = requests_per_endpoint / wall_seconds if wall_seconds > 0 else None
+        results.append(result)
+    return results
+
+
+"""
+Baseline comparison
+"""
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    Returns a list of the regressions of results from a baseline, both lists of benchmark results.
+    A benchmark regressed if its median latency grew by more than tolerance, as a fraction,
+    if it runs more queries, or if it has errors the baseline did not.
+    """
+    baseline = {result['name']: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = baseline.get(result['name'])
+        if before is None:
+            continue
+        if before['p50_seconds'] and result['p50_seconds'] > before['p50_seconds'] * (1 + tolerance):
+            regressions.append('{0}: median {1:.3f} ms, was {2:.3f} ms'.format(
+                result['name'], result['p50_seconds'] * 1000, before['p50_seconds'] * 1000))
+        if before['queries'] is not None and result['queries'] is not None and result['queries'] > before['queries']:
+            regressions.append('{0}: {1:g} queries, was {2:g}'.format(result['name'], result['queries'], before['queries']))
+        if result.get('errors', 0) > before.get('errors', 0):
+            regressions.append('{0}: {1} errors, was {2}'.format(result['name'], result['errors'], before.get('errors', 0)))
+    return regressions
@@ -0,0 +1,230 @@
+"""
+Synthetic registry data for the benchmarks (see benchmark.py).
+
+generate_benchmark_data creates states laid out on a grid of squares, each
+divided into county squares with a smaller city square inside each county,
+and an AHJ paired with every polygon, with an address, contacts, and
+approved edits taking effect today. Names, addresses, and contacts are made
+up with Faker, seeded so every run with the same arguments creates the same
+data. The rows are written with bulk_create, so no history rows are written
+and no signals are sent; the coverage tables, polygon simplifications,
+polygon hierarchy, stored documents, and vector tiles are rebuilt or cleared
+afterwards.
+
+Generated AHJs have an AHJCode starting with BENCHMARK_AHJ_CODE_PREFIX, and
+delete_benchmark_data removes them and everything created with them. The
+data should be generated in a database used only for benchmarking.
+"""
+import math
+import random
+import uuid
+
+from django.contrib.gis.geos import MultiPolygon, Polygon as GEOSPolygon
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from faker import Faker
+
+from .coverage import CODE_FIELDS, rebuild_coverage
+from .documents import invalidate_all_ahj_documents
+from .geo_grid import rebuild_geo_grid
+from .models import AHJ, AHJDocument, AHJLevelCode, Address, CityPolygon, Contact, CountyPolygon, Edit, GeocodeJob, \
+    GeoGridCell, Polygon, PolygonCoverage, PolygonHierarchy, PolygonSimplification, StateCoverage, StatePolygon, User
+from .polygon_detail import build_polygon_simplifications
+from .polygon_hierarchy import rebuild_polygon_hierarchy
+from .spatial_index import bump_polygon_version
+from .vector_tiles import clear_tile_cache
+
+BENCHMARK_AHJ_CODE_PREFIX = 'BENCH-'
+
+BENCHMARK_USERNAME = 'benchmark'
+
+"""
+Corner and size in degrees of the grid the states are laid out on
+"""
+STATE_GRID_ORIGIN = (-124.0, 25.0)
+STATE_GRID_COLUMNS = 10
+STATE_SIZE = 4.0
+
+"""
+Approximate square meters in a square degree, for the LandArea of the polygons
+"""
+SQUARE_METERS_PER_SQUARE_DEGREE = 1.0e10
+
+"""
+String columns of the AHJ changed by the generated edits
+"""
+EDITED_AHJ_COLUMNS = ['Description', 'BuildingCodeNotes', 'ElectricCodeNotes', 'FireCodeNotes', 'WindCodeNotes']
+
+AHJ_LEVEL_CODES = {'state': '040', 'county': '050', 'city': '162'}
+
+
+def get_benchmark_user():
+    user = User.objects.filter(Username=BENCHMARK_USERNAME).first()
+    if user is None:
+        user = User.objects.create_user(Username=BENCHMARK_USERNAME, Email=BENCHMARK_USERNAME + '@example.com',
+                                        password=uuid.uuid4().hex)
+        User.objects.filter(UserID=user.UserID).update(is_active=True)
+    return user
+
+
+def get_enum_rows(model):
+    """
+    Returns the rows of every choice of an enum table, creating the missing ones.
+    """
+    return [model.objects.get_or_create(Value=value)[0] for value, label in model._meta.get_field('Value').choices]
+
+
+def get_square(min_lng, min_lat, size):
+    return MultiPolygon(GEOSPolygon.from_bbox((min_lng, min_lat, min_lng + size, min_lat + size)))
+
+
+def get_next_pk(model):
+    return (model.objects.aggregate(max_pk=Max(model._meta.pk.name))['max_pk'] or 0) + 1
+
+
+class BenchmarkDataBuilder:
+    """
+    Collects the rows of the generated data with their primary keys
+    assigned, since MySQL does not return the keys of bulk created rows.
+    """
+    def __init__(self, fake, rng, user, contacts_per_ahj, edits_per_ahj):
+        self.fake = fake
+        self.rng = rng
+        self.user = user
+        self.contacts_per_ahj = contacts_per_ahj
+        self.edits_per_ahj = edits_per_ahj
+        self.now = timezone.now()
+        self.level_codes = {level.Value: level for level in get_enum_rows(AHJLevelCode)}
+        self.code_rows = {field: get_enum_rows(AHJ._meta.get_field(field).related_model) for field in CODE_FIELDS}
+        self.next_pks = {model: get_next_pk(model) for model in (Polygon, Address, AHJ, Contact, Edit)}
+        self.rows = {model: [] for model in (Polygon, StatePolygon, CountyPolygon, CityPolygon, Address, AHJ, Contact, Edit)}
+
+    def add(self, model, **fields):
+        if model in self.next_pks:
+            fields[model._meta.pk.attname] = self.next_pks[model]
+            self.next_pks[model] += 1
+        row = model(**fields)
+        self.rows[model].append(row)
+        return row
+
+    def add_address(self, state_abbr):
+        return self.add(Address, AddrLine1=self.fake.street_address(), City=self.fake.city(), Country='US',
+                        StateProvince=state_abbr, ZipPostalCode=self.fake.zipcode())
+
+    def add_polygon(self, name, geoid, min_lng, min_lat, size):
+        return self.add(Polygon, Name=name[:100], GEOID=geoid, Polygon=get_square(min_lng, min_lat, size),
+                        LandArea=int(size * size * SQUARE_METERS_PER_SQUARE_DEGREE), WaterArea=0,
+                        InternalPLatitude=round(min_lat + size / 2, 8), InternalPLongitude=round(min_lng + size / 2, 8))
+
+    def add_ahj(self, level, name, polygon, state_abbr):
+        fields = {}
+        for field in CODE_FIELDS:
+            # Some AHJs have no code, so the data map shows partial coverage
+            if self.rng.random() < 0.7:
+                fields[field] = self.rng.choice(self.code_rows[field])
+                fields[field + 'Notes'] = self.fake.sentence()
+        ahj = self.add(AHJ, AHJID=str(uuid.UUID(int=self.rng.getrandbits(128))),
+                       AHJCode=BENCHMARK_AHJ_CODE_PREFIX + str(self.next_pks[AHJ]),
+                       AHJLevelCode=self.level_codes[AHJ_LEVEL_CODES[level]], PolygonID=polygon,
+                       AddressID=self.add_address(state_abbr), AHJName=name[:100],
+                       Description=self.fake.sentence(), URL=self.fake.url(), **fields)
+        for i in range(self.contacts_per_ahj):
+            self.add(Contact, ParentTable='AHJ', ParentID=ahj.AHJPK, ContactStatus=True,
+                     AddressID=self.add_address(state_abbr), FirstName=self.fake.first_name(),
+                     LastName=self.fake.last_name(), WorkPhone=self.fake.numerify('###-###-####'),
+                     Email=self.fake.email()[:50], Title=self.fake.job()[:255])
+        for i in range(self.edits_per_ahj):
+            column = self.rng.choice(EDITED_AHJ_COLUMNS)
+            self.add(Edit, ChangedBy=self.user, ApprovedBy=self.user, AHJPK=ahj, SourceTable='AHJ',
+                     SourceColumn=column, SourceRow=ahj.AHJPK, ReviewStatus='A', OldValue=getattr(ahj, column),
+                     NewValue=self.fake.sentence(), DateRequested=self.now, DateEffective=self.now, EditType='U')
+        return ahj
+
+
+def generate_benchmark_data(states=2, counties_per_state=10, contacts_per_ahj=2, edits_per_ahj=1, seed=0,
+                            batch_size=500):
+    """
+    Creates the polygons, AHJs, contacts, and edits of the given number of states.
+    Returns a dict of the number of rows created of each model.
+    """
+    fake = Faker('en_US')
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+    builder = BenchmarkDataBuilder(fake, rng, get_benchmark_user(), contacts_per_ahj, edits_per_ahj)
+    state_abbrs = [fake.unique.state_abbr(include_territories=False) if i < 50 else f'S{i}' for i in range(states)]
+    counties_per_row = math.ceil(math.sqrt(counties_per_state))
+    county_size = STATE_SIZE / counties_per_row
+    for i in range(states):
+        state_abbr = state_abbrs[i]
+        state_lng = STATE_GRID_ORIGIN[0] + (i % STATE_GRID_COLUMNS) * STATE_SIZE
+        state_lat = STATE_GRID_ORIGIN[1] + (i // STATE_GRID_COLUMNS) * STATE_SIZE
+        state_geoid = f'{i + 1:02d}'
+        state_name = f'{fake.state()} {i + 1}'
+        state_polygon = builder.add_polygon(state_name, state_geoid, state_lng, state_lat, STATE_SIZE)
+        state = builder.add(StatePolygon, PolygonID=state_polygon, FIPSCode=state_geoid[-2:])
+        builder.add_ahj('state', state_name, state_polygon, state_abbr)
+        for j in range(counties_per_state):
+            county_lng = state_lng + (j % counties_per_row) * county_size
+            county_lat = state_lat + (j // counties_per_row) * county_size
+            county_name = f'{fake.last_name()} County'
+            county_polygon = builder.add_polygon(county_name, f'{state_geoid}{j + 1:03d}', county_lng, county_lat, county_size)
+            builder.add(CountyPolygon, PolygonID=county_polygon, StatePolygonID=state, LSAreaCodeName='county')
+            builder.add_ahj('county', county_name, county_polygon, state_abbr)
+            # A city in the middle of each county, so locations in it are in three polygons
+            city_name = fake.city()
+            city_polygon = builder.add_polygon(city_name, f'{state_geoid}{j + 1:05d}', county_lng + county_size / 4,
+                                               county_lat + county_size / 4, county_size / 2)
+            builder.add(CityPolygon, PolygonID=city_polygon, StatePolygonID=state, LSAreaCodeName='city')
+            builder.add_ahj('city', city_name, city_polygon, state_abbr)
+    with transaction.atomic():
+        for model, rows in builder.rows.items():
+            model.objects.bulk_create(rows, batch_size=batch_size)
+    update_derived_data(polygon_ids=[polygon.PolygonID for polygon in builder.rows[Polygon]])
+    return {model.__name__: len(rows) for model, rows in builder.rows.items()}
+
+
+def update_derived_data(polygon_ids=None):
+    """
+    Updates the tables and caches derived from the polygons and AHJs after they were changed in bulk.
+    """
+    if polygon_ids:
+        for i in range(0, len(polygon_ids), 100):
+            build_polygon_simplifications(Polygon.objects.filter(PolygonID__in=polygon_ids[i:i + 100]))
+    rebuild_coverage()
+    rebuild_polygon_hierarchy()
+    rebuild_geo_grid()
+    bump_polygon_version()
+    invalidate_all_ahj_documents()
+    clear_tile_cache()
+
+
+def delete_benchmark_data():
+    """
+    Deletes the AHJs created by generate_benchmark_data and the rows created with them.
+    Returns the number of AHJs deleted.
+    """
+    with transaction.atomic():
+        ahjs = list(AHJ.objects.filter(AHJCode__startswith=BENCHMARK_AHJ_CODE_PREFIX).values_list('AHJPK', 'AddressID', 'PolygonID'))
+        ahjpks = [ahjpk for ahjpk, address_id, polygon_id in ahjs]
+        polygon_ids = [polygon_id for ahjpk, address_id, polygon_id in ahjs if polygon_id is not None]
+        contacts = Contact.objects.filter(ParentTable='AHJ', ParentID__in=ahjpks)
+        address_ids = [address_id for ahjpk, address_id, polygon_id in ahjs if address_id is not None] + \
+                      [address_id for address_id in contacts.values_list('AddressID', flat=True) if address_id is not None]
+        Edit.objects.filter(AHJPK__in=ahjpks).delete()
+        contacts.delete()
+        AHJDocument.objects.filter(AHJPK__in=ahjpks).delete()
+        AHJ.objects.filter(AHJPK__in=ahjpks).delete()
+        GeocodeJob.objects.filter(AddressID__in=address_ids).delete()
+        Address.objects.filter(AddressID__in=address_ids).delete()
+        PolygonHierarchy.objects.filter(Q(ParentPolygonID__in=polygon_ids) | Q(ChildPolygonID__in=polygon_ids)).delete()
+        GeoGridCell.objects.filter(PolygonID__in=polygon_ids).delete()
+        StateCoverage.objects.filter(StatePolygonID__in=polygon_ids).delete()
+        PolygonCoverage.objects.filter(PolygonID__in=polygon_ids).delete()
+        PolygonSimplification.objects.filter(PolygonID__in=polygon_ids).delete()
+        CityPolygon.objects.filter(PolygonID__in=polygon_ids).delete()
+        CountyPolygon.objects.filter(PolygonID__in=polygon_ids).delete()
+        StatePolygon.objects.filter(PolygonID__in=polygon_ids).delete()
+        Polygon.objects.filter(PolygonID__in=polygon_ids).delete()
+    update_derived_data()
+    return len(ahjpks)
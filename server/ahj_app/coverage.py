@@ -0,0 +1,154 @@
+"""
+Materialized code coverage statistics of the data map.
+
+PolygonCoverage holds the number of AHJs paired with each county, city, and
+county subdivision polygon and the number of them with each code, and
+StateCoverage holds the sums of the polygons of each state. data_map reads
+these tables instead of aggregating the polygon and AHJ tables.
+
+The rows of a polygon and its state are updated when an AHJ paired with it
+is saved or deleted, or when the polygon is added to or removed from a
+polygon table. Changes made in bulk call update_coverage or rebuild_coverage,
+which the rebuild_coverage management command runs.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import AHJ, CityPolygon, CountyPolygon, CountySubdivisionPolygon, PolygonCoverage, StateCoverage
+
+CODE_FIELDS = ['BuildingCode', 'ElectricCode', 'FireCode', 'ResidentialCode', 'WindCode']
+
+COVERAGE_FIELDS = ['NumAHJs'] + ['Num' + field + 's' for field in CODE_FIELDS]
+
+"""
+The polygon tables whose polygons are counted under their state
+"""
+STATE_SUBDIVISION_MODELS = [CountyPolygon, CityPolygon, CountySubdivisionPolygon]
+
+REBUILD_POLYGON_COVERAGE_QUERY = (
+    'INSERT INTO PolygonCoverage (PolygonID, StatePolygonID, NumAHJs, NumBuildingCodes, NumElectricCodes, '
+    'NumFireCodes, NumResidentialCodes, NumWindCodes) '
+    'SELECT polygons.PolygonID, MIN(polygons.StatePolygonID), COUNT(AHJ.AHJPK), COUNT(AHJ.BuildingCode), '
+    'COUNT(AHJ.ElectricCode), COUNT(AHJ.FireCode), COUNT(AHJ.ResidentialCode), COUNT(AHJ.WindCode) FROM '
+    '(SELECT PolygonID, StatePolygonID FROM CountyPolygon '
+    'UNION SELECT PolygonID, StatePolygonID FROM CityPolygon '
+    'UNION SELECT PolygonID, StatePolygonID FROM CountySubdivisionPolygon) as polygons '
+    'LEFT JOIN AHJ ON polygons.PolygonID=AHJ.PolygonID GROUP BY polygons.PolygonID;'
+)
+
+REBUILD_STATE_COVERAGE_QUERY = (
+    'INSERT INTO StateCoverage (StatePolygonID, NumAHJs, NumBuildingCodes, NumElectricCodes, '
+    'NumFireCodes, NumResidentialCodes, NumWindCodes) '
+    'SELECT StatePolygonID, SUM(GREATEST(NumAHJs, 1)), SUM(NumBuildingCodes), SUM(NumElectricCodes), '
+    'SUM(NumFireCodes), SUM(NumResidentialCodes), SUM(NumWindCodes) '
+    'FROM PolygonCoverage GROUP BY StatePolygonID;'
+)
+
+
+def rebuild_coverage():
+    """
+    Rebuilds both coverage tables from the polygon and AHJ tables.
+    Returns the number of polygons and states counted.
+    """
+    with transaction.atomic():
+        StateCoverage.objects.all().delete()
+        PolygonCoverage.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_POLYGON_COVERAGE_QUERY)
+            cursor.execute(REBUILD_STATE_COVERAGE_QUERY)
+    return PolygonCoverage.objects.count(), StateCoverage.objects.count()
+
+
+def get_polygon_states(polygon_ids):
+    """
+    Returns a dict of each of the polygons in a state subdivision table to its StatePolygonID.
+    """
+    polygon_states = {}
+    for model in STATE_SUBDIVISION_MODELS:
+        for polygon_id, state_id in model.objects.filter(PolygonID__in=polygon_ids).values_list('PolygonID', 'StatePolygonID'):
+            polygon_states[polygon_id] = min(state_id, polygon_states.get(polygon_id, state_id))
+    return polygon_states
+
+
+def update_state_coverage(state_ids):
+    """
+    Recounts the StateCoverage rows of the given states from their PolygonCoverage rows.
+    """
+    sums = (PolygonCoverage.objects.filter(StatePolygonID__in=state_ids).order_by().values('StatePolygonID')
+                                   .annotate(NumAHJs_sum=Sum(Greatest('NumAHJs', Value(1))),
+                                             **{field + '_sum': Sum(field) for field in COVERAGE_FIELDS[1:]}))
+    counted = set()
+    for row in sums:
+        counted.add(row['StatePolygonID'])
+        StateCoverage.objects.update_or_create(StatePolygonID_id=row['StatePolygonID'],
+                                               defaults={field: row[field + '_sum'] for field in COVERAGE_FIELDS})
+    StateCoverage.objects.filter(StatePolygonID__in=set(state_ids) - counted).delete()
+
+
+def update_coverage(polygon_ids):
+    """
+    Recounts the PolygonCoverage rows of the given polygons and the StateCoverage rows of their states.
+    """
+    polygon_ids = {polygon_id for polygon_id in polygon_ids if polygon_id is not None}
+    if len(polygon_ids) == 0:
+        return
+    with transaction.atomic():
+        state_ids = set(PolygonCoverage.objects.filter(PolygonID__in=polygon_ids).values_list('StatePolygonID', flat=True))
+        polygon_states = get_polygon_states(polygon_ids)
+        counts = {row['PolygonID']: row for row in
+                  AHJ.objects.filter(PolygonID__in=polygon_states).order_by().values('PolygonID')
+                             .annotate(NumAHJs=Count('AHJPK'), **{'Num' + field + 's': Count(field) for field in CODE_FIELDS})}
+        PolygonCoverage.objects.filter(PolygonID__in=polygon_ids - set(polygon_states)).delete()
+        for polygon_id, state_id in polygon_states.items():
+            row = counts.get(polygon_id, {})
+            PolygonCoverage.objects.update_or_create(PolygonID_id=polygon_id,
+                                                     defaults=dict({'StatePolygonID_id': state_id},
+                                                                   **{field: row.get(field, 0) for field in COVERAGE_FIELDS}))
+            state_ids.add(state_id)
+        update_state_coverage(state_ids)
+
+
+def get_ahj_coverage_values(ahj):
+    return [ahj.PolygonID_id] + [getattr(ahj, field + '_id') for field in CODE_FIELDS]
+
+
+def record_old_ahj_coverage(sender, instance, **kwargs):
+    """
+    Records the polygon and codes of an AHJ before it is saved,
+    so the coverage is only recounted when one of them changes.
+    """
+    if kwargs.get('raw', False) or instance.pk is None:
+        return
+    old = AHJ.objects.filter(AHJPK=instance.pk).values_list('PolygonID', *CODE_FIELDS).first()
+    instance._old_coverage_values = list(old) if old is not None else None
+
+
+def update_ahj_coverage(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    old_values = getattr(instance, '_old_coverage_values', None)
+    instance._old_coverage_values = None
+    if old_values is not None and old_values == get_ahj_coverage_values(instance):
+        return
+    update_coverage({instance.PolygonID_id, old_values[0] if old_values is not None else None})
+
+
+def delete_ahj_coverage(sender, instance, **kwargs):
+    update_coverage({instance.PolygonID_id})
+
+
+def update_polygon_coverage(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    update_coverage({instance.PolygonID_id})
+
+
+def connect_signals():
+    pre_save.connect(record_old_ahj_coverage, sender=AHJ, dispatch_uid='coverage_ahj_pre_save')
+    post_save.connect(update_ahj_coverage, sender=AHJ, dispatch_uid='coverage_ahj_save')
+    post_delete.connect(delete_ahj_coverage, sender=AHJ, dispatch_uid='coverage_ahj_delete')
+    for model in STATE_SUBDIVISION_MODELS:
+        post_save.connect(update_polygon_coverage, sender=model, dispatch_uid=f'coverage_{model.__name__}_save')
+        post_delete.connect(update_polygon_coverage, sender=model, dispatch_uid=f'coverage_{model.__name__}_delete')
@@ -0,0 +1,323 @@
+"""
+Stored AHJSerializer output of each AHJ.
+
+An AHJ's serialized JSON only changes when a row under it changes, so when
+settings.AHJ_DOCUMENTS_ENABLED is True, the search endpoints read the public
+and private views of each AHJ from the AHJDocument table instead of
+serializing it on every request. A missing document is built and stored the
+first time it is read. The signal receivers at the bottom of this module
+delete the documents of the AHJs a saved or deleted row is serialized under;
+they are only connected when documents, cached responses, or the name index
+are enabled when the app starts, so documents stored while they were enabled
+must be rebuilt after running without them.
+Code that changes rows without sending signals (QuerySet.update, bulk
+operations) must call invalidate_ahj_documents itself. The
+rebuild_ahj_documents management command rebuilds every document.
+Invalidating documents also invalidates the cached search responses
+(see response_cache.py).
+"""
+import json
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metrics import timed
+from .models import AHJ, AHJDocument, AHJInspection, Address, Comment, Contact, User
+from .response_cache import bump_data_version, get_data_version
+from .serializers import AHJSerializer
+from .utils import ENUM_FIELDS
+
+
+def serialize_ahjs(ahjs, context=None):
+    """
+    Returns the AHJSerializer output of a list of AHJs, read from
+    their stored documents if settings.AHJ_DOCUMENTS_ENABLED is True.
+    Only the 'is_public_view' and 'polygon_detail' of the serializer context
+    are supported. Documents hold full polygons, so AHJs serialized with
+    simplified polygons are not read from documents.
+    """
+    with timed('serializer'):
+        context = context if context is not None else {}
+        polygon_detail = context.get('polygon_detail', 'full')
+        if not settings.AHJ_DOCUMENTS_ENABLED or polygon_detail not in ('full', 'none'):
+            return AHJSerializer(ahjs, many=True, context=context).data
+        is_public_view = context.get('is_public_view', False)
+        documents = get_ahj_documents(ahjs, is_public_view=is_public_view)
+        if polygon_detail == 'none' and not is_public_view:
+            for document in documents:
+                document['Polygon'] = None
+        return documents
+
+
+def serialize_ahj(ahj, context=None):
+    return serialize_ahjs([ahj], context=context)[0]
+
+
+def dump_document(data):
+    """
+    Encodes serializer output the way the JSON renderer does.
+    """
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+
+
+def build_ahj_documents(ahjpks):
+    """
+    Serializes the public and private views of the given AHJs and stores them.
+    Returns a dict of AHJPK to (PublicDocument, PrivateDocument).
+
+    The data version is read before the AHJs' rows are. If it changed by the
+    time the documents are stored, a change may have been committed after the
+    rows were read, and its invalidation may have run before the documents
+    existed, so they are deleted again and rebuilt when next read.
+    """
+    ahjpks = list(ahjpks)
+    if len(ahjpks) == 0:
+        return {}
+    data_version = get_data_version()
+    ahjs = list(AHJ.objects.filter(AHJPK__in=ahjpks).order_by('AHJPK'))
+    private_data = AHJSerializer(ahjs, many=True, context={'is_public_view': False}).data
+    public_data = AHJSerializer(ahjs, many=True, context={'is_public_view': True}).data
+    now = timezone.now()
+    documents = [AHJDocument(AHJPK_id=ahj.AHJPK,
+                             PublicDocument=dump_document(public),
+                             PrivateDocument=dump_document(private),
+                             Updated=now)
+                 for ahj, public, private in zip(ahjs, public_data, private_data)]
+    stored_ahjpks = [ahj.AHJPK for ahj in ahjs]
+    AHJDocument.objects.filter(AHJPK__in=stored_ahjpks).delete()
+    # Another request may have stored a document at the same time
+    AHJDocument.objects.bulk_create(documents, ignore_conflicts=True)
+    if get_data_version() != data_version:
+        AHJDocument.objects.filter(AHJPK__in=stored_ahjpks).delete()
+    return {document.AHJPK_id: (document.PublicDocument, document.PrivateDocument) for document in documents}
+
+
+def get_ahj_documents(ahjs, is_public_view=False):
+    """
+    Returns the stored public or private view of a list of AHJs,
+    building the documents that are missing.
+    """
+    ahjs = list(ahjs)
+    field = 'PublicDocument' if is_public_view else 'PrivateDocument'
+    stored = dict(AHJDocument.objects.filter(AHJPK__in=[ahj.AHJPK for ahj in ahjs])
+                                     .exclude(**{field: None})
+                                     .values_list('AHJPK', field))
+    missing = [ahj.AHJPK for ahj in ahjs if ahj.AHJPK not in stored]
+    for ahjpk, (public_document, private_document) in build_ahj_documents(missing).items():
+        stored[ahjpk] = public_document if is_public_view else private_document
+    return [json.loads(stored[ahj.AHJPK]) for ahj in ahjs]
+
+
+def rebuild_ahj_documents(chunk_size=500):
+    """
+    Rebuilds the documents of every AHJ.
+    Returns the number of AHJs whose documents were built.
+    """
+    ahjpks = list(AHJ.objects.order_by('AHJPK').values_list('AHJPK', flat=True))
+    AHJDocument.objects.exclude(AHJPK__in=ahjpks).delete()
+    for i in range(0, len(ahjpks), chunk_size):
+        build_ahj_documents(ahjpks[i:i + chunk_size])
+    return len(ahjpks)
+
+
+"""
+Rows whose changes can change the public view of an AHJ.
+Comments, users, and polygons are only serialized in the private view.
+Enum rows are not listed because an AHJ's enum values change with the AHJ's row.
+"""
+PUBLIC_VIEW_ROW_MODELS = ['AHJ', 'AHJInspection', 'FeeStructure', 'EngineeringReviewRequirement',
+                          'AHJDocumentSubmissionMethodUse', 'AHJPermitIssueMethodUse', 'Contact', 'Address', 'Location']
+
+
+def invalidate_ahj_documents(ahjpks, public=True):
+    """
+    Deletes the documents of the given AHJs so they are rebuilt when next read,
+    and bumps the data version the cached search responses are keyed on.
+    public is False when only the private view of the AHJs changed, so the
+    cached responses of the public view are kept.
+    """
+    ahjpks = {ahjpk for ahjpk in ahjpks if ahjpk is not None}
+    if len(ahjpks) != 0:
+        AHJDocument.objects.filter(AHJPK__in=ahjpks).delete()
+        bump_data_version(public=public)
+        # Deleted again after the data version is incremented, in case a read stored a document
+        # built from the rows before the change without seeing the new version (see build_ahj_documents)
+        transaction.on_commit(lambda: AHJDocument.objects.filter(AHJPK__in=ahjpks).delete())
+
+
+def invalidate_all_ahj_documents():
+    AHJDocument.objects.all().delete()
+    bump_data_version()
+    transaction.on_commit(lambda: AHJDocument.objects.all().delete())
+
+
+"""
+Helpers to find the AHJs a row is serialized under
+"""
+
+
+def get_comment_ahjpks(comments):
+    """
+    Returns the AHJPKs of the comments the given comments are under.
+    Replies have no AHJPK, so the AHJPK of the comment they reply to is used.
+    """
+    ahjpks = set()
+    seen = set()
+    pending = set()
+    for comment in comments:
+        if comment.AHJPK is not None:
+            ahjpks.add(comment.AHJPK)
+        elif comment.ReplyingTo is not None:
+            pending.add(comment.ReplyingTo)
+    while pending:
+        seen |= pending
+        parents = Comment.objects.filter(CommentID__in=pending).values_list('AHJPK', 'ReplyingTo')
+        pending = set()
+        for ahjpk, replying_to in parents:
+            if ahjpk is not None:
+                ahjpks.add(ahjpk)
+            elif replying_to is not None and replying_to not in seen:
+                pending.add(replying_to)
+    return ahjpks
+
+
+def get_user_ahjpks(user_ids):
+    """
+    Returns the AHJPKs of the AHJs the given users commented on.
+    """
+    return get_comment_ahjpks(Comment.objects.filter(UserID__in=user_ids))
+
+
+def get_contact_ahjpks(contacts):
+    """
+    Returns the AHJPKs of the AHJs the given contacts are serialized under:
+    their parent AHJ or inspection's AHJ, or the AHJs their users commented on.
+    """
+    ahjpks = set()
+    inspection_ids = set()
+    contact_ids = set()
+    for contact in contacts:
+        if contact.ParentTable == 'AHJ':
+            ahjpks.add(contact.ParentID)
+        elif contact.ParentTable == 'AHJInspection':
+            inspection_ids.add(contact.ParentID)
+        else:
+            contact_ids.add(contact.ContactID)
+    if len(inspection_ids) != 0:
+        ahjpks.update(AHJInspection.objects.filter(InspectionID__in=inspection_ids).values_list('AHJPK', flat=True))
+    if len(contact_ids) != 0:
+        ahjpks |= get_user_ahjpks(User.objects.filter(ContactID__in=contact_ids).values_list('UserID', flat=True))
+    return ahjpks
+
+
+def get_address_ahjpks(address_ids):
+    return set(AHJ.objects.filter(AddressID__in=address_ids).values_list('AHJPK', flat=True)) | \
+           get_contact_ahjpks(Contact.objects.filter(AddressID__in=address_ids))
+
+
+ROW_AHJPKS = {
+    'AHJ': lambda row: {row.AHJPK},
+    'AHJInspection': lambda row: {row.AHJPK_id},
+    'FeeStructure': lambda row: {row.AHJPK_id},
+    'EngineeringReviewRequirement': lambda row: {row.AHJPK_id},
+    'AHJDocumentSubmissionMethodUse': lambda row: {row.AHJPK_id},
+    'AHJPermitIssueMethodUse': lambda row: {row.AHJPK_id},
+    'Contact': lambda row: get_contact_ahjpks([row]),
+    'Address': lambda row: get_address_ahjpks([row.AddressID]),
+    'Location': lambda row: get_address_ahjpks(Address.objects.filter(LocationID=row).values_list('AddressID', flat=True)),
+    'Polygon': lambda row: set(AHJ.objects.filter(PolygonID=row).values_list('AHJPK', flat=True)),
+    'Comment': lambda row: get_comment_ahjpks([row]),
+    'User': lambda row: get_user_ahjpks([row.UserID]),
+    'AHJUserMaintains': lambda row: get_user_ahjpks([row.UserID_id]),
+    'APIToken': lambda row: get_user_ahjpks([row.user_id])
+}
+
+
+def get_rows_ahjpks(model_name, rows):
+    """
+    Returns the AHJPKs of the AHJs any of the given rows of a model is serialized under.
+    """
+    if model_name == 'Contact':
+        return get_contact_ahjpks(rows)
+    if model_name == 'Address':
+        return get_address_ahjpks([row.AddressID for row in rows])
+    ahjpks = set()
+    for row in rows:
+        ahjpks |= ROW_AHJPKS[model_name](row)
+    return ahjpks
+
+
+"""
+The User fields serialized under the AHJs a user commented on (see serializers.UserSerializer).
+Saves updating only other fields, such as the last_login a login updates, change no document.
+"""
+SERIALIZED_USER_FIELDS = {'ContactID', 'Username', 'Email', 'PersonalBio', 'CompanyAffiliation', 'Photo',
+                          'AcceptedEdits', 'SubmittedEdits', 'CommunityScore', 'SignUpDate', 'is_superuser'}
+
+
+def is_invalidation_enabled():
+    """
+    Returns whether anything reads what saved rows invalidate: the stored documents,
+    or the cached responses and name index keyed on the data version.
+    """
+    return settings.AHJ_DOCUMENTS_ENABLED or settings.AHJ_RESPONSE_CACHE_ENABLED or settings.NAME_INDEX_ENABLED
+
+
+def is_public_view_row(model_name, row):
+    """
+    Returns whether a row is serialized in the public view, or decides which AHJs a public
+    location search returns, as polygons do. The contacts of users are only in the private view.
+    """
+    if model_name == 'Contact':
+        return row.ParentTable in ('AHJ', 'AHJInspection')
+    return model_name in PUBLIC_VIEW_ROW_MODELS or model_name == 'Polygon'
+
+
+def invalidate_row_ahj_documents(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    update_fields = kwargs.get('update_fields', None)
+    if sender is User and update_fields is not None and SERIALIZED_USER_FIELDS.isdisjoint(update_fields):
+        return
+    invalidate_ahj_documents(ROW_AHJPKS[sender.__name__](instance), public=is_public_view_row(sender.__name__, instance))
+
+
+def invalidate_enum_ahj_documents(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    invalidate_all_ahj_documents()
+
+
+def get_signal_receivers():
+    """
+    Yields the signal, receiver, model, and dispatch_uid of each receiver invalidating documents.
+    Deletes are handled before the row is deleted, while the rows linking it to its AHJs still exist.
+    """
+    for model_name in ROW_AHJPKS:
+        model = apps.get_model('ahj_app', model_name)
+        yield post_save, invalidate_row_ahj_documents, model, f'ahj_documents_{model_name}_save'
+        yield pre_delete, invalidate_row_ahj_documents, model, f'ahj_documents_{model_name}_delete'
+    # Value tables are serialized under every AHJ that uses one of their values
+    for model_name in ENUM_FIELDS:
+        model = apps.get_model('ahj_app', model_name)
+        yield post_save, invalidate_enum_ahj_documents, model, f'ahj_documents_{model_name}_save'
+        yield pre_delete, invalidate_enum_ahj_documents, model, f'ahj_documents_{model_name}_delete'
+
+
+def connect_signals():
+    """
+    Connects the receivers invalidating documents, if anything reads what they invalidate.
+    """
+    if not is_invalidation_enabled():
+        return
+    for signal, receiver, model, dispatch_uid in get_signal_receivers():
+        signal.connect(receiver, sender=model, dispatch_uid=dispatch_uid)
+
+
+def disconnect_signals():
+    for signal, receiver, model, dispatch_uid in get_signal_receivers():
+        signal.disconnect(receiver, sender=model, dispatch_uid=dispatch_uid)
@@ -0,0 +1,142 @@
+"""
+In-memory registry of the rows of the enum tables (see utils.ENUM_FIELDS).
+
+The enum tables are small and almost never change, so each process loads
+every row once and maps values and primary keys to rows without querying.
+The registry is cleared when an enum row is saved or deleted in this process
+(see connect_signals) and by code that changes enum tables without sending
+signals (usf.add_enum_values). Changes made by other processes are noticed
+by comparing a fingerprint of the enum tables at most once every
+settings.ENUM_REGISTRY_CHECK_INTERVAL_SECONDS.
+"""
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+
+
+def get_enum_model_names():
+    # NOTE: Imported here because utils imports the serializers, which use the registry
+    from .utils import ENUM_FIELDS
+    return sorted(ENUM_FIELDS)
+
+
+class EnumTable:
+    """
+    The rows of one enum table, by value and by primary key.
+    """
+    def __init__(self, rows):
+        self.by_value = {row.Value: row for row in rows}
+        self.by_pk = {row.pk: row for row in rows}
+
+
+_tables = None
+_fingerprint = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_fingerprint():
+    """
+    Returns the row count and largest primary key of every enum table, read with one query.
+    Recreating the rows of a table always changes its largest primary key.
+    """
+    quote_name = connection.ops.quote_name
+    selects = []
+    for model_name in get_enum_model_names():
+        meta = apps.get_model('ahj_app', model_name)._meta
+        selects.append(f'SELECT COUNT(*), MAX({quote_name(meta.pk.column)}) FROM {quote_name(meta.db_table)}')
+    with connection.cursor() as cursor:
+        cursor.execute(' UNION ALL '.join(selects))
+        return tuple(tuple(row) for row in cursor.fetchall())
+
+
+def load():
+    """
+    Loads every enum table into the registry.
+    """
+    global _tables, _fingerprint, _checked_at
+    with _lock:
+        fingerprint = get_fingerprint()
+        tables = {model_name: EnumTable(list(apps.get_model('ahj_app', model_name).objects.all()))
+                  for model_name in get_enum_model_names()}
+        _tables, _fingerprint, _checked_at = tables, fingerprint, time.monotonic()
+    return tables
+
+
+def clear():
+    global _tables
+    _tables = None
+
+
+def get_tables():
+    """
+    Returns the loaded enum tables, loading them if the registry was
+    cleared or the enum tables changed since they were loaded.
+    """
+    global _checked_at
+    tables = _tables
+    if tables is None:
+        return load()
+    if time.monotonic() - _checked_at > settings.ENUM_REGISTRY_CHECK_INTERVAL_SECONDS:
+        _checked_at = time.monotonic()
+        if get_fingerprint() != _fingerprint:
+            return load()
+    return tables
+
+
+def get_row(model_name, value):
+    """
+    Returns the row of an enum table with the given value.
+    Raises the model's DoesNotExist if there is no such row.
+    """
+    row = get_tables()[model_name].by_value.get(value)
+    if row is None:
+        # Confirm with the database in case the row was added since the registry was loaded
+        row = apps.get_model('ahj_app', model_name).objects.get(Value=value)
+        clear()
+    return row
+
+
+def get_row_by_pk(model_name, pk):
+    """
+    Returns the row of an enum table with the given primary key, or None if there is no such row.
+    """
+    if pk is None:
+        return None
+    return get_tables()[model_name].by_pk.get(pk)
+
+
+def get_value(model_name, pk):
+    """
+    Returns the value of the row of an enum table with the given primary key,
+    or None if the primary key is None.
+    """
+    row = get_row_by_pk(model_name, pk)
+    if row is None and pk is not None:
+        row = apps.get_model('ahj_app', model_name).objects.get(pk=pk)
+        clear()
+    return row.Value if row is not None else None
+
+
+def get_field_value(instance, field_name):
+    """
+    Returns the value of the enum row an instance's enum field references,
+    or None if it does not reference one.
+    """
+    field = instance._meta.get_field(field_name)
+    return get_value(field.related_model.__name__, getattr(instance, field.attname))
+
+
+def clear_on_change(sender, **kwargs):
+    clear()
+
+
+def connect_signals():
+    for model_name in get_enum_model_names():
+        model = apps.get_model('ahj_app', model_name)
+        post_save.connect(clear_on_change, sender=model, dispatch_uid=f'enum_registry_{model_name}_save')
+        post_delete.connect(clear_on_change, sender=model, dispatch_uid=f'enum_registry_{model_name}_delete')
@@ -0,0 +1,98 @@
+"""
+Export of the public view of every AHJ as JSON Lines.
+
+The AHJs are read in chunks ordered by AHJPK, each chunk starting after the
+last AHJPK of the previous one, so the memory used by an export does not
+depend on the size of the registry. An export can be limited to the AHJs
+changed since a time, found from the history rows of the rows serialized
+under each AHJ. Such an export ends with a line for each AHJ deleted since
+then, holding its AHJID and "Deleted": true, so clients syncing with it can
+drop the AHJ.
+"""
+from django.apps import apps
+
+from .documents import PUBLIC_VIEW_ROW_MODELS, dump_document, get_address_ahjpks, get_contact_ahjpks, serialize_ahjs
+from .models import AHJ, Address
+from .utils import get_public_api_serializer_context
+
+"""
+Number of AHJs read and serialized at a time
+"""
+EXPORT_CHUNK_SIZE = 500
+
+
+def get_history_ahjpks(model_name, history):
+    """
+    Returns the AHJPKs of the AHJs the rows of a queryset of history rows are serialized under.
+    """
+    if model_name == 'Contact':
+        return get_contact_ahjpks(history.only('ContactID', 'ParentTable', 'ParentID'))
+    if model_name == 'Address':
+        return get_address_ahjpks(set(history.values_list('AddressID', flat=True)))
+    if model_name == 'Location':
+        location_ids = set(history.values_list('LocationID', flat=True))
+        return get_address_ahjpks(Address.objects.filter(LocationID__in=location_ids).values_list('AddressID', flat=True))
+    # The AHJ's own AHJPK, or the AHJPK foreign key of the rows under it
+    return set(history.values_list('AHJPK', flat=True))
+
+
+def get_ahjpks_changed_since(since):
+    """
+    Returns the AHJPKs of the AHJs whose serialized rows were created,
+    changed, or deleted since the given time. The AHJPKs of AHJs
+    deleted since then are included (see get_ahjs_deleted_since).
+    """
+    ahjpks = set()
+    for model_name in PUBLIC_VIEW_ROW_MODELS:
+        model = apps.get_model('ahj_app', model_name)
+        ahjpks |= get_history_ahjpks(model_name, model.history.filter(history_date__gte=since))
+    ahjpks.discard(None)
+    return ahjpks
+
+
+def get_ahjs_deleted_since(since):
+    """
+    Returns the (AHJPK, AHJID) of the AHJs deleted since the given time, ordered by AHJPK.
+    """
+    deleted = AHJ.history.filter(history_date__gte=since, history_type='-') \
+                         .exclude(AHJPK__in=AHJ.objects.values('AHJPK')) \
+                         .order_by('AHJPK').values_list('AHJPK', 'AHJID').distinct()
+    return list(deleted)
+
+
+def iter_ahj_chunks(ahjpks=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields lists of at most chunk_size AHJs ordered by AHJPK.
+    If ahjpks is given, only those AHJs are yielded.
+    """
+    if ahjpks is not None:
+        ahjpks = sorted(ahjpks)
+        for i in range(0, len(ahjpks), chunk_size):
+            yield list(AHJ.objects.filter(AHJPK__in=ahjpks[i:i + chunk_size]).order_by('AHJPK'))
+        return
+    after_AHJPK = None
+    while True:
+        ahjs = AHJ.objects.order_by('AHJPK')
+        if after_AHJPK is not None:
+            ahjs = ahjs.filter(AHJPK__gt=after_AHJPK)
+        chunk = list(ahjs[:chunk_size])
+        if len(chunk) == 0:
+            return
+        yield chunk
+        after_AHJPK = chunk[-1].AHJPK
+
+
+def iter_ahj_export_lines(since=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the public view of each AHJ as a line of JSON.
+    If since is given, only the AHJs changed since then are yielded,
+    followed by a line for each AHJ deleted since then.
+    """
+    ahjpks = get_ahjpks_changed_since(since) if since is not None else None
+    context = get_public_api_serializer_context()
+    for chunk in iter_ahj_chunks(ahjpks=ahjpks, chunk_size=chunk_size):
+        for data in serialize_ahjs(chunk, context=context):
+            yield dump_document(data) + '\n'
+    if since is not None:
+        for ahjpk, ahjid in get_ahjs_deleted_since(since):
+            yield dump_document({'AHJID': {'Value': ahjid}, 'Deleted': True}) + '\n'
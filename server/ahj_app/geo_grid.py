@@ -0,0 +1,176 @@
+"""
+Geohash grid of the polygons covering or crossing each cell.
+
+The GeoGridCell table maps each geohash cell of settings.GEO_GRID_PRECISION
+characters to the polygons of the polygon type tables that intersect it,
+and whether each one covers the whole cell. When settings.GEO_GRID_ENABLED
+is True, a location search reads the rows of the cell containing the
+location: the polygons covering the cell contain the location without being
+tested, and only the polygons crossing the cell, at their boundaries, are
+tested with ST_CONTAINS. A cell without rows is in no polygon.
+
+The cells of a polygon are found by descending from the coarsest cells:
+cells the polygon covers are recorded with all of their subcells, cells it
+does not intersect are skipped, and only cells crossing its boundary are
+divided further. The rebuild_geo_grid management command, which
+translate_polygons runs after translating polygons, rebuilds the table; it
+must also be run when the precision is changed.
+
+Geohashes are encoded here rather than with a geohash or H3 library, so the
+grid needs no extra dependency.
+"""
+from django.conf import settings
+from django.contrib.gis.geos import Point, Polygon as GEOSPolygon
+from django.db import transaction
+
+from .models import CityPolygon, CountyPolygon, CountySubdivisionPolygon, GeoGridCell, Polygon, StatePolygon
+from .spatial_index import get_polygon_ids_in_containing_states
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+"""
+The polygon type tables whose polygons are children of a state
+"""
+STATE_CHILD_MODELS = [CountyPolygon, CityPolygon, CountySubdivisionPolygon]
+
+
+def encode_geohash(lng, lat, precision):
+    """
+    Returns the geohash of the cell containing a point. Points on the edge
+    between two cells are in the cell to their north or east.
+    """
+    lng_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    is_lng_bit = True
+    while len(geohash) < precision:
+        value, value_range = (lng, lng_range) if is_lng_bit else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            value_range[0] = middle
+        else:
+            bits = bits * 2
+            value_range[1] = middle
+        is_lng_bit = not is_lng_bit
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def get_geohash_extent(geohash):
+    """
+    Returns the (xmin, ymin, xmax, ymax) of a geohash cell.
+    """
+    lng_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    is_lng_bit = True
+    for char in geohash:
+        bits = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lng_range if is_lng_bit else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if (bits >> shift) & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            is_lng_bit = not is_lng_bit
+    return lng_range[0], lat_range[0], lng_range[1], lat_range[1]
+
+
+def iter_subcells(geohash, precision):
+    """
+    Yields the cells of precision characters within a cell.
+    """
+    if len(geohash) >= precision:
+        yield geohash
+        return
+    for char in GEOHASH_BASE32:
+        yield from iter_subcells(geohash + char, precision)
+
+
+def extents_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def get_polygon_cells(geometry, precision):
+    """
+    Returns a list of the (geohash, covered) of the cells of precision characters the geometry
+    intersects, where covered is True if the geometry covers the whole cell.
+    """
+    prepared = geometry.prepared
+    extent = geometry.extent
+    cells = []
+    stack = list(GEOHASH_BASE32)
+    while stack:
+        geohash = stack.pop()
+        cell_extent = get_geohash_extent(geohash)
+        if not extents_overlap(cell_extent, extent):
+            continue
+        cell = GEOSPolygon.from_bbox(cell_extent)
+        if prepared.contains(cell):
+            cells.extend((subcell, True) for subcell in iter_subcells(geohash, precision))
+        elif not prepared.intersects(cell):
+            continue
+        elif len(geohash) == precision:
+            cells.append((geohash, False))
+        else:
+            stack.extend(geohash + char for char in GEOHASH_BASE32)
+    return cells
+
+
+def iter_grid_polygons():
+    """
+    Yields the (PolygonID, StatePolygonID, geometry) of the polygons of the polygon type tables.
+    StatePolygonID is None for state polygons.
+    """
+    for state in StatePolygon.objects.select_related('PolygonID').only('PolygonID__Polygon').iterator():
+        yield state.PolygonID_id, None, state.PolygonID.Polygon
+    for model in STATE_CHILD_MODELS:
+        for row in model.objects.select_related('PolygonID').only('PolygonID__Polygon', 'StatePolygonID').iterator():
+            yield row.PolygonID_id, row.StatePolygonID_id, row.PolygonID.Polygon
+
+
+def rebuild_geo_grid(precision=None, batch_size=5000):
+    """
+    Rebuilds the GeoGridCell table at the given precision, or settings.GEO_GRID_PRECISION.
+    Returns the number of rows written.
+    The table is replaced in one transaction, so searches read the previous
+    cells until it commits, rather than finding no polygons in cells not yet written.
+    """
+    precision = precision if precision is not None else settings.GEO_GRID_PRECISION
+    count = 0
+    with transaction.atomic():
+        GeoGridCell.objects.all().delete()
+        for polygon_id, state_id, geometry in iter_grid_polygons():
+            rows = [GeoGridCell(Geohash=geohash, PolygonID_id=polygon_id, StatePolygonID_id=state_id, IsCovered=covered)
+                    for geohash, covered in get_polygon_cells(geometry, precision)]
+            GeoGridCell.objects.bulk_create(rows, batch_size=batch_size)
+            count += len(rows)
+    return count
+
+
+def get_polygon_ids_containing(lng, lat):
+    """
+    Returns the PolygonIDs filter_ahjs searches for AHJs located at a point, and whether
+    any polygon had to be tested because the point's cell is on its boundary.
+    """
+    geohash = encode_geohash(lng, lat, settings.GEO_GRID_PRECISION)
+    rows = GeoGridCell.objects.filter(Geohash=geohash).values_list('PolygonID', 'StatePolygonID', 'IsCovered')
+    containing = []
+    crossing = {}
+    for polygon_id, state_id, covered in rows:
+        if covered:
+            containing.append((polygon_id, state_id))
+        else:
+            crossing[polygon_id] = state_id
+    if len(crossing) != 0:
+        contained = Polygon.objects.filter(PolygonID__in=list(crossing), Polygon__contains=Point(lng, lat)) \
+                                   .values_list('PolygonID', flat=True)
+        containing += [(polygon_id, crossing[polygon_id]) for polygon_id in contained]
+    return get_polygon_ids_in_containing_states(containing), len(crossing) != 0
@@ -0,0 +1,151 @@
+"""
+Queue of addresses to geocode outside of the request that changed them.
+
+Adding or editing an Address queues a GeocodeJob instead of calling the
+geocoder, and process_geocode_jobs geocodes the queued addresses later and
+sets the Latitude, Longitude, and Elevation of their Locations. It runs every
+GEOCODE_JOB_INTERVAL_SECONDS in the scheduler of each process, and can also
+run as `manage.py process_geocode_jobs`.
+
+Each run claims a batch of due jobs with SELECT ... FOR UPDATE SKIP LOCKED, so
+processes running at the same time claim different jobs, and leases them for
+GEOCODE_JOB_LEASE so the jobs of a process that dies are retried. Each distinct
+address string of a batch is geocoded once, at most GEOCODE_JOB_RATE_PER_SECOND
+times a second. A failed job is retried with exponential backoff until it has
+failed GEOCODE_JOB_MAX_ATTEMPTS times.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_update_with_history
+
+from .documents import get_address_ahjpks, invalidate_ahj_documents
+from .models import Address, GeocodeJob, Location
+from .utils import create_addr_string, get_elevation
+
+"""
+How long a claimed job is left to its process before another may claim it
+"""
+GEOCODE_JOB_LEASE = datetime.timedelta(minutes=10)
+
+
+class RateLimiter:
+    """
+    Spaces calls to wait() at least 1 / rate_per_second seconds apart.
+    A rate of None or 0 does not wait.
+    """
+    def __init__(self, rate_per_second):
+        self.interval = 1 / rate_per_second if rate_per_second else 0
+        self.next_call = 0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next_call:
+            time.sleep(self.next_call - now)
+            now = self.next_call
+        self.next_call = now + self.interval
+
+
+def enqueue_geocode_jobs(addresses):
+    """
+    Queues the geocoding of the given Addresses.
+    An address already queued is queued again, so it is geocoded from its latest value.
+    """
+    address_ids = {address.AddressID for address in addresses}
+    if len(address_ids) == 0:
+        return
+    now = timezone.now()
+    queued = set(GeocodeJob.objects.filter(AddressID__in=address_ids).values_list('AddressID', flat=True))
+    if len(queued) != 0:
+        GeocodeJob.objects.filter(AddressID__in=queued).update(Queued=now, NextAttempt=now, Attempts=0, LastError='')
+    GeocodeJob.objects.bulk_create([GeocodeJob(AddressID_id=address_id, Queued=now, NextAttempt=now)
+                                    for address_id in sorted(address_ids - queued)], ignore_conflicts=True)
+
+
+def claim_geocode_jobs(batch_size, now):
+    """
+    Returns up to batch_size due jobs, leased to this process until now + GEOCODE_JOB_LEASE.
+    """
+    with transaction.atomic():
+        jobs = list(GeocodeJob.objects.select_for_update(skip_locked=True)
+                                      .filter(NextAttempt__lte=now).order_by('NextAttempt')[:batch_size])
+        GeocodeJob.objects.filter(JobID__in=[job.JobID for job in jobs]).update(NextAttempt=now + GEOCODE_JOB_LEASE)
+    return jobs
+
+
+def get_retry_delay(attempts):
+    return datetime.timedelta(seconds=settings.GEOCODE_JOB_RETRY_SECONDS * 2 ** (attempts - 1))
+
+
+def process_geocode_jobs(batch_size=None, rate_limiter=None):
+    """
+    Geocodes a batch of queued addresses and sets their Locations.
+    Returns a dict of the number of jobs 'claimed', 'geocoded', and 'failed'.
+    """
+    batch_size = batch_size if batch_size is not None else settings.GEOCODE_JOB_BATCH_SIZE
+    rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(settings.GEOCODE_JOB_RATE_PER_SECOND)
+    claimed_at = timezone.now()
+    jobs = claim_geocode_jobs(batch_size, claimed_at)
+    report = {'claimed': len(jobs), 'geocoded': 0, 'failed': 0}
+    if len(jobs) == 0:
+        return report
+    addresses = Address.objects.in_bulk([job.AddressID_id for job in jobs])
+    locations = Location.objects.in_bulk([address.LocationID_id for address in addresses.values() if address.LocationID_id is not None])
+    results = {}
+    done_jobs = []
+    failed_jobs = []
+    edited_locations = {}
+    for job in jobs:
+        address = addresses.get(job.AddressID_id)
+        location = locations.get(address.LocationID_id) if address is not None else None
+        addr_string = create_addr_string(address) if location is not None else ''
+        if addr_string == '':
+            done_jobs.append(job)
+            continue
+        if addr_string not in results:
+            rate_limiter.wait()
+            try:
+                results[addr_string] = get_elevation(addr_string)
+            except Exception as e:
+                results[addr_string] = e
+        loc = results[addr_string]
+        if isinstance(loc, Exception):
+            failed_jobs.append((job, loc))
+            continue
+        location.Elevation = loc['Elevation']['Value']
+        location.Longitude = loc['Longitude']['Value']
+        location.Latitude = loc['Latitude']['Value']
+        edited_locations[location.LocationID] = location
+        done_jobs.append(job)
+    with transaction.atomic():
+        if len(edited_locations) != 0:
+            bulk_update_with_history(list(edited_locations.values()), Location, ['Elevation', 'Longitude', 'Latitude'])
+            invalidate_ahj_documents(get_address_ahjpks([job.AddressID_id for job in done_jobs]))
+        # Jobs queued again since they were claimed are left for the next run
+        GeocodeJob.objects.filter(JobID__in=[job.JobID for job in done_jobs], Queued__lte=claimed_at).delete()
+        for job, error in failed_jobs:
+            attempts = job.Attempts + 1
+            next_attempt = claimed_at + get_retry_delay(attempts) if attempts < settings.GEOCODE_JOB_MAX_ATTEMPTS else None
+            GeocodeJob.objects.filter(JobID=job.JobID, Queued__lte=claimed_at).update(Attempts=attempts, NextAttempt=next_attempt,
+                                                                                       LastError=str(error)[:255])
+    report['geocoded'] = len(done_jobs)
+    report['failed'] = len(failed_jobs)
+    return report
+
+
+def process_all_geocode_jobs(batch_size=None):
+    """
+    Processes batches of jobs until none are due.
+    Returns the summed reports of the batches.
+    """
+    report = {'claimed': 0, 'geocoded': 0, 'failed': 0}
+    rate_limiter = RateLimiter(settings.GEOCODE_JOB_RATE_PER_SECOND)
+    while True:
+        batch_report = process_geocode_jobs(batch_size=batch_size, rate_limiter=rate_limiter)
+        for name in report:
+            report[name] += batch_report[name]
+        if batch_report['claimed'] == 0:
+            return report
@@ -0,0 +1,327 @@
+"""
+Geocoding of addresses with a persistent cache in front of the geocoder.
+
+Every lookup is first answered from the GeocodeCache table, keyed by the hash
+of the normalized address. Entries expire after settings.GEOCODE_CACHE_TTL_SECONDS,
+and the least recently used entries are evicted once the table holds more than
+settings.GEOCODE_CACHE_MAX_ENTRIES. settings.GEOCODER selects the geocoder
+called on a cache miss: 'google' for the Google Maps API, or 'stub' for an
+offline geocoder used in development and tests.
+
+geocode_address_async is the same lookup for async views: the cache is
+read and written in threads (see async_db.py), and the geocoder of
+ASYNC_GEOCODERS is awaited, so the event loop serves other requests during
+the round trip. The async Google geocoder sends its requests through an
+httpx client pooling settings.ASYNC_GEOCODER_MAX_CONNECTIONS connections.
+"""
+import asyncio
+import datetime
+import hashlib
+import re
+import threading
+import weakref
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+import googlemaps
+import httpx
+
+from .async_db import run_sync
+from .metrics import timed
+from .models import GeocodeCache
+
+"""
+A cache hit only updates the LastUsed of its entry if it is older than this
+"""
+GEOCODE_CACHE_TOUCH_INTERVAL = datetime.timedelta(hours=1)
+
+"""
+Number of cache misses between checks for entries to evict
+"""
+GEOCODE_CACHE_EVICTION_INTERVAL = 100
+
+
+class GoogleMapsGeocoder:
+    def __init__(self):
+        self.client = googlemaps.Client(key=settings.GOOGLE_MAPS_KEY)
+
+    def geocode(self, address):
+        """
+        Returns the (latitude, longitude) of an address, or None if it has no result.
+        """
+        results = self.client.geocode(address)
+        if len(results) == 0:
+            return None
+        location = results[0]['geometry']['location']
+        return location['lat'], location['lng']
+
+    def elevation(self, latitude, longitude):
+        return self.client.elevation((latitude, longitude))[0]['elevation']
+
+
+class StubGeocoder:
+    """
+    Geocoder that works offline.
+    An address containing a decimal 'latitude, longitude' pair geocodes to it,
+    and any other address has no result. Every location has an elevation of 0.
+    """
+    COORDINATES = re.compile(r'(-?\d+\.\d+)[\s,]+(-?\d+\.\d+)')
+
+    def geocode(self, address):
+        match = self.COORDINATES.search(address)
+        if match is None:
+            return None
+        return float(match.group(1)), float(match.group(2))
+
+    def elevation(self, latitude, longitude):
+        return 0.0
+
+
+class AsyncGoogleMapsGeocoder:
+    """
+    Geocoder calling the Google Maps Geocoding API with an async HTTP client.
+    Errors are raised as googlemaps.exceptions.ApiError, as GoogleMapsGeocoder raises them.
+    """
+    GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+
+    def __init__(self):
+        # The pooled connections of a client belong to the event loop that opened them
+        self.clients = weakref.WeakKeyDictionary()
+
+    def get_client(self):
+        loop = asyncio.get_event_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(max_connections=settings.ASYNC_GEOCODER_MAX_CONNECTIONS,
+                                  max_keepalive_connections=settings.ASYNC_GEOCODER_MAX_CONNECTIONS)
+            client = self.clients[loop] = httpx.AsyncClient(limits=limits, timeout=settings.ASYNC_GEOCODER_TIMEOUT_SECONDS)
+        return client
+
+    async def geocode(self, address):
+        """
+        Returns the (latitude, longitude) of an address, or None if it has no result.
+        """
+        response = await self.get_client().get(self.GEOCODE_URL, params={'address': address, 'key': settings.GOOGLE_MAPS_KEY})
+        if response.status_code != 200:
+            raise googlemaps.exceptions.HTTPError(response.status_code)
+        body = response.json()
+        if body['status'] == 'ZERO_RESULTS':
+            return None
+        if body['status'] != 'OK':
+            raise googlemaps.exceptions.ApiError(body['status'], body.get('error_message'))
+        location = body['results'][0]['geometry']['location']
+        return location['lat'], location['lng']
+
+
+class AsyncStubGeocoder(StubGeocoder):
+    async def geocode(self, address):
+        return super().geocode(address)
+
+
+GEOCODERS = {
+    'google': GoogleMapsGeocoder,
+    'stub': StubGeocoder
+}
+
+ASYNC_GEOCODERS = {
+    'google': AsyncGoogleMapsGeocoder,
+    'stub': AsyncStubGeocoder
+}
+
+_geocoders = {}
+
+_async_geocoders = {}
+
+
+def get_geocoder():
+    """
+    Returns the geocoder selected by settings.GEOCODER.
+    """
+    name = settings.GEOCODER
+    if name not in _geocoders:
+        _geocoders[name] = GEOCODERS[name]()
+    return _geocoders[name]
+
+
+def get_async_geocoder():
+    """
+    Returns the async geocoder selected by settings.GEOCODER.
+    """
+    name = settings.GEOCODER
+    if name not in _async_geocoders:
+        _async_geocoders[name] = ASYNC_GEOCODERS[name]()
+    return _async_geocoders[name]
+
+
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+
+def record_stat(name, count=1):
+    with _stats_lock:
+        _stats[name] += count
+
+
+def get_geocode_cache_stats():
+    """
+    Returns the hit, miss and eviction counts of this process.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups != 0 else 0.0
+    return stats
+
+
+def reset_geocode_cache_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def normalize_address(address):
+    """
+    Lowercases an address, treats commas and semicolons as spaces,
+    and collapses whitespace, so equivalent spellings share an entry.
+    """
+    return ' '.join(re.sub(r'[,;]', ' ', address.lower()).split())
+
+
+def get_address_key(normalized_address):
+    return hashlib.sha256(normalized_address.encode('utf-8')).hexdigest()
+
+
+def get_unexpired_entry(address_key, now):
+    ttl = datetime.timedelta(seconds=settings.GEOCODE_CACHE_TTL_SECONDS)
+    return GeocodeCache.objects.filter(AddressKey=address_key, Created__gt=now - ttl).first()
+
+
+def record_hit(entry, now):
+    record_stat('hits')
+    if entry.LastUsed < now - GEOCODE_CACHE_TOUCH_INTERVAL:
+        GeocodeCache.objects.filter(AddressKey=entry.AddressKey).update(LastUsed=now)
+
+
+def create_entry(address_key, normalized_address, location, now):
+    latitude, longitude = location if location is not None else (None, None)
+    return GeocodeCache(AddressKey=address_key, Address=normalized_address,
+                        Latitude=latitude, Longitude=longitude, Created=now)
+
+
+def save_entry(entry, now):
+    """
+    Saves an entry after a cache miss, evicting entries every GEOCODE_CACHE_EVICTION_INTERVAL misses.
+    """
+    entry.LastUsed = now
+    try:
+        with transaction.atomic():
+            entry.save()
+    except IntegrityError:
+        # Another process cached the address at the same time
+        pass
+    if _stats['misses'] % GEOCODE_CACHE_EVICTION_INTERVAL == 0:
+        evict_geocode_cache()
+    return entry
+
+
+def get_cache_entry(address, with_elevation=False):
+    """
+    Returns the GeocodeCache entry of an address, calling
+    the geocoder if there is no usable entry.
+    If with_elevation is True, the entry's Elevation is looked up if missing.
+    """
+    normalized_address = normalize_address(address)
+    address_key = get_address_key(normalized_address)
+    now = timezone.now()
+    entry = get_unexpired_entry(address_key, now)
+    needs_elevation = with_elevation and entry is not None and entry.Latitude is not None and entry.Elevation is None
+
+    if entry is not None and not needs_elevation:
+        record_hit(entry, now)
+        return entry
+
+    record_stat('misses')
+    geocoder = get_geocoder()
+    if entry is None:
+        with timed('geocode'):
+            location = geocoder.geocode(address)
+        entry = create_entry(address_key, normalized_address, location, now)
+    if with_elevation and entry.Latitude is not None:
+        with timed('geocode'):
+            entry.Elevation = geocoder.elevation(entry.Latitude, entry.Longitude)
+    return save_entry(entry, now)
+
+
+def get_cached_entry(address_key, now):
+    """
+    Returns the unexpired GeocodeCache entry of an address key, or None, recording the hit.
+    """
+    entry = get_unexpired_entry(address_key, now)
+    if entry is not None:
+        record_hit(entry, now)
+    return entry
+
+
+async def get_cache_entry_async(address):
+    """
+    Returns the GeocodeCache entry of an address as get_cache_entry does, awaiting the async geocoder.
+    """
+    normalized_address = normalize_address(address)
+    address_key = get_address_key(normalized_address)
+    now = timezone.now()
+    entry = await run_sync(get_cached_entry, address_key, now)
+    if entry is not None:
+        return entry
+
+    record_stat('misses')
+    with timed('geocode'):
+        location = await get_async_geocoder().geocode(address)
+    return await run_sync(save_entry, create_entry(address_key, normalized_address, location, now), now)
+
+
+def evict_geocode_cache():
+    """
+    Deletes expired entries, then the least recently used entries
+    beyond settings.GEOCODE_CACHE_MAX_ENTRIES.
+    Returns the number of entries deleted.
+    """
+    ttl = datetime.timedelta(seconds=settings.GEOCODE_CACHE_TTL_SECONDS)
+    evicted, _ = GeocodeCache.objects.filter(Created__lte=timezone.now() - ttl).delete()
+    excess = GeocodeCache.objects.count() - settings.GEOCODE_CACHE_MAX_ENTRIES
+    if excess > 0:
+        least_recently_used = list(GeocodeCache.objects.order_by('LastUsed')
+                                                       .values_list('AddressKey', flat=True)[:excess])
+        evicted += GeocodeCache.objects.filter(AddressKey__in=least_recently_used).delete()[0]
+    record_stat('evictions', evicted)
+    return evicted
+
+
+def geocode_address(address):
+    """
+    Returns the (latitude, longitude) of an address, or None if it has no result.
+    """
+    entry = get_cache_entry(address)
+    if entry.Latitude is None:
+        return None
+    return entry.Latitude, entry.Longitude
+
+
+async def geocode_address_async(address):
+    """
+    Returns the (latitude, longitude) of an address, or None if it has no result.
+    """
+    entry = await get_cache_entry_async(address)
+    if entry.Latitude is None:
+        return None
+    return entry.Latitude, entry.Longitude
+
+
+def geocode_address_with_elevation(address):
+    """
+    Returns the (latitude, longitude, elevation) of an address, or None if it has no result.
+    """
+    entry = get_cache_entry(address, with_elevation=True)
+    if entry.Latitude is None:
+        return None
+    return entry.Latitude, entry.Longitude, entry.Elevation
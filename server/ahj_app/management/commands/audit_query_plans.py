@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ahj_app.query_audit import audit_queries
+
+
+class Command(BaseCommand):
+    help = 'Explains the hot search and edit queries, flagging full table and index scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=0,
+                            help='Number of times each query is run to time it (default: not timed)')
+        parser.add_argument('--save', metavar='PATH',
+                            help='Write the results to a JSON file, to compare with a later run')
+        parser.add_argument('--compare', metavar='PATH',
+                            help='Show the timings of a run saved with --save next to this run\'s')
+        parser.add_argument('--fail-on-full-scan', action='store_true',
+                            help='Exit with an error if any query scans a whole table or index')
+
+    def handle(self, *args, **options):
+        results = audit_queries(repeat=options['repeat'])
+        before = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                before = {result['name']: result for result in json.load(f)}
+        for result in results:
+            line = result['name'] + ': '
+            if len(result['full_scans']) == 0:
+                line += 'no full scans'
+            else:
+                line += ', '.join('full {0} scan of {1} (~{2} rows)'.format('table' if scan['type'] == 'ALL' else 'index',
+                                                                           scan['table'], scan['rows'])
+                                  for scan in result['full_scans'])
+            if result['seconds'] is not None:
+                line += ', {0:.3f} ms'.format(result['seconds'] * 1000)
+                before_seconds = before.get(result['name'], {}).get('seconds')
+                if before_seconds is not None:
+                    line += ' (before {0:.3f} ms, {1:.2f}x)'.format(before_seconds * 1000,
+                                                                    before_seconds / result['seconds'] if result['seconds'] > 0 else 0)
+            self.stdout.write(self.style.WARNING(line) if len(result['full_scans']) != 0 else line)
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2)
+        scanning = sum(1 for result in results if len(result['full_scans']) != 0)
+        if scanning != 0 and options['fail_on_full_scan']:
+            raise CommandError(f'{scanning} of {len(results)} queries scan a whole table or index')
+        self.stdout.write(self.style.SUCCESS(f'Explained {len(results)} queries, {scanning} with full scans'))
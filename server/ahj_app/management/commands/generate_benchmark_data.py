@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.benchmark_data import delete_benchmark_data, generate_benchmark_data
+
+
+class Command(BaseCommand):
+    help = 'Creates synthetic AHJs, polygons, contacts, and edits for the benchmarks. Use a database only used for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--states', type=int, default=2,
+                            help='Number of states to create (default: 2)')
+        parser.add_argument('--counties-per-state', type=int, default=10,
+                            help='Number of counties, each with a city, per state (default: 10)')
+        parser.add_argument('--contacts-per-ahj', type=int, default=2,
+                            help='Number of contacts per AHJ (default: 2)')
+        parser.add_argument('--edits-per-ahj', type=int, default=1,
+                            help='Number of approved edits per AHJ taking effect today (default: 1)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the generated values (default: 0)')
+        parser.add_argument('--delete', action='store_true',
+                            help='Delete the previously generated data first')
+
+    def handle(self, *args, **options):
+        if options['delete']:
+            deleted = delete_benchmark_data()
+            self.stdout.write(f'Deleted {deleted} AHJs')
+        counts = generate_benchmark_data(states=options['states'], counties_per_state=options['counties_per_state'],
+                                         contacts_per_ahj=options['contacts_per_ahj'],
+                                         edits_per_ahj=options['edits_per_ahj'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS('Created ' + ', '.join(f'{count} {name}' for name, count in counts.items())))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.usf import AHJ_DATA_CSV_PATH, AHJ_LOAD_CHUNK_SIZE, load_ahj_data_csv
+
+
+class Command(BaseCommand):
+    help = 'Loads the AHJs, their addresses, contacts, and edits from an AHJ data CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=AHJ_DATA_CSV_PATH,
+                            help=f'Path of the CSV (default: {AHJ_DATA_CSV_PATH})')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of threads inserting the AHJs, one state at a time')
+        parser.add_argument('--chunk-size', type=int, default=AHJ_LOAD_CHUNK_SIZE,
+                            help='Number of AHJs inserted per transaction')
+
+    def handle(self, *args, **options):
+        count = load_ahj_data_csv(path=options['path'], workers=options['workers'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Loaded {count} AHJs'))
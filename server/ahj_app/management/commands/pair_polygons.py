@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.usf import pair_ahjs_to_polygons, write_unmatched_ahjs_csv
+
+
+class Command(BaseCommand):
+    help = 'Pairs every AHJ with the Census polygon matching its name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unmatched-csv', default=None,
+                            help='Path of a CSV file to write the AHJs not matching any polygon to')
+
+    def handle(self, *args, **options):
+        report = pair_ahjs_to_polygons()
+        if options['unmatched_csv'] is not None:
+            write_unmatched_ahjs_csv(report['unmatched'], options['unmatched_csv'])
+        for ahjpk, ahj_name, state_province in report['unmatched']:
+            self.stdout.write(f'Unmatched: {ahjpk} {ahj_name} ({state_province})')
+        self.stdout.write(self.style.SUCCESS(
+            f'Paired {report["paired"]} AHJs ({report["changed"]} changed), {len(report["unmatched"])} unmatched'))
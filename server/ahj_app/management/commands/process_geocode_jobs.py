@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ahj_app.geocode_jobs import process_all_geocode_jobs
+
+
+class Command(BaseCommand):
+    help = 'Geocodes the queued addresses and sets their locations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Number of jobs claimed at a time (default: GEOCODE_JOB_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep processing jobs every GEOCODE_JOB_INTERVAL_SECONDS')
+
+    def handle(self, *args, **options):
+        while True:
+            report = process_all_geocode_jobs(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS('Geocoded {0} jobs, {1} failed'.format(report['geocoded'], report['failed'])))
+            if not options['loop']:
+                return
+            time.sleep(settings.GEOCODE_JOB_INTERVAL_SECONDS)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.documents import rebuild_ahj_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored public and private documents of every AHJ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of AHJs serialized per batch')
+
+    def handle(self, *args, **options):
+        count = rebuild_ahj_documents(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the documents of {count} AHJs'))
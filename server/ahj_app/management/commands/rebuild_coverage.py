@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.coverage import rebuild_coverage
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the code coverage statistics served by the data map'
+
+    def handle(self, *args, **options):
+        polygon_count, state_count = rebuild_coverage()
+        self.stdout.write(self.style.SUCCESS(f'Counted the coverage of {polygon_count} polygons in {state_count} states'))
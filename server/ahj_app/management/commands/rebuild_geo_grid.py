@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.geo_grid import rebuild_geo_grid
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the geohash grid of the polygons covering or crossing each cell'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--precision', type=int, default=None,
+                            help='Number of geohash characters of the cells; defaults to settings.GEO_GRID_PRECISION')
+
+    def handle(self, *args, **options):
+        count = rebuild_geo_grid(precision=options['precision'])
+        self.stdout.write(self.style.SUCCESS(f'Recorded {count} grid cells'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.polygon_hierarchy import rebuild_polygon_hierarchy
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the containment of the city and county subdivision polygons within the counties'
+
+    def handle(self, *args, **options):
+        count = rebuild_polygon_hierarchy()
+        self.stdout.write(self.style.SUCCESS(f'Recorded {count} parent and child polygons'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.polygon_detail import rebuild_polygon_simplifications
+from ahj_app.vector_tiles import clear_tile_cache
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the simplified geometries of every polygon at every detail level'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Number of polygons simplified per batch')
+
+    def handle(self, *args, **options):
+        count = rebuild_polygon_simplifications(chunk_size=options['chunk_size'])
+        # The cached tiles are drawn from the simplified geometries
+        clear_tile_cache()
+        self.stdout.write(self.style.SUCCESS(f'Simplified {count} polygons'))
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ahj_app.benchmark import compare_results, run_load, run_micro_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Runs the micro-benchmarks and load driver on the data of generate_benchmark_data, optionally comparing with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', choices=['micro', 'load', 'all'], default='all',
+                            help='Benchmarks to run (default: all)')
+        parser.add_argument('--only', nargs='+', metavar='NAME',
+                            help='Names of the micro-benchmarks or load endpoints (ahj, geo-location, data-map) to run')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Number of calls of each micro-benchmark (default: 20)')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Number of requests sent to each endpoint (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of requests sent at once (default: 4)')
+        parser.add_argument('--base-url', metavar='URL',
+                            help='Send the load requests to the server at URL, such as http://localhost:8000, '
+                                 'instead of through the Django test client. The server must use the same database '
+                                 'unless --token is given')
+        parser.add_argument('--token', help='API token sent with the load requests (default: the benchmark user\'s)')
+        parser.add_argument('--save', metavar='PATH',
+                            help='Write the results to a JSON file, to use as the baseline of a later run')
+        parser.add_argument('--baseline', metavar='PATH',
+                            help='Compare the results with those saved by a run with --save')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Fraction the median latency may grow by before it is a regression (default: 0.2)')
+
+    def handle(self, *args, **options):
+        try:
+            results = []
+            if options['suite'] in ('micro', 'all'):
+                results += run_micro_benchmarks(repeat=options['repeat'], names=options['only'])
+            if options['suite'] in ('load', 'all'):
+                results += run_load(requests_per_endpoint=options['requests'], concurrency=options['concurrency'],
+                                    base_url=options['base_url'], token=options['token'], names=options['only'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for result in results:
+            line = '{0}: p50 {1:.3f} ms, p90 {2:.3f} ms, p99 {3:.3f} ms'.format(
+                result['name'], result['p50_seconds'] * 1000, result['p90_seconds'] * 1000, result['p99_seconds'] * 1000)
+            if result['queries'] is not None:
+                line += ', {0:g} queries'.format(result['queries'])
+            if result['memory_bytes'] is not None:
+                line += ', {0:.1f} MiB'.format(result['memory_bytes'] / 2 ** 20)
+            if result.get('requests_per_second') is not None:
+                line += ', {0:.1f} requests/s'.format(result['requests_per_second'])
+            if result.get('errors'):
+                line += ', {0} errors'.format(result['errors'])
+            self.stdout.write(line)
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = compare_results(results, json.load(f), tolerance=options['tolerance'])
+            for regression in regressions:
+                self.stdout.write(self.style.WARNING(regression))
+            if len(regressions) != 0:
+                raise CommandError(f'{len(regressions)} regressions from the baseline')
+        self.stdout.write(self.style.SUCCESS(f'Ran {len(results)} benchmarks'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ahj_app.usf import POLYGON_LAYERS, TRANSLATE_CHUNK_SIZE, translate_polygons
+
+
+class Command(BaseCommand):
+    help = 'Moves the uploaded Census shapefile rows from the temporary tables to the Polygon tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('layers', nargs='*', choices=list(POLYGON_LAYERS),
+                            help='Layers to translate (default: every layer)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of threads translating a layer, one state at a time')
+        parser.add_argument('--chunk-size', type=int, default=TRANSLATE_CHUNK_SIZE,
+                            help='Number of rows inserted per transaction')
+
+    def handle(self, *args, **options):
+        report = translate_polygons(layers=options['layers'] or None, workers=options['workers'],
+                                    chunk_size=options['chunk_size'])
+        count = sum(count for count, seconds in report.values())
+        self.stdout.write(self.style.SUCCESS(f'Translated {count} polygons'))
@@ -0,0 +1,190 @@
+"""
+Per-endpoint request metrics of this process.
+
+When settings.METRICS_ENABLED is True, MetricsMiddleware records for each
+request the number of SQL queries and the time spent running them, the time
+spent calling the external geocoder and serializing AHJs (see timed), the
+total time, and the response size. They are kept per URL name as counts and
+sums since the process started, and as a rolling window of the last
+settings.METRICS_WINDOW_SIZE requests from which quantiles are computed.
+render_prometheus formats them as Prometheus summaries for the /metrics
+endpoint. Each process keeps its own metrics.
+
+A request slower than settings.METRICS_SLOW_REQUEST_SECONDS is logged to the
+'ahj_app.slow_requests' logger with its metrics and the SQL it ran.
+
+The metrics of a request are kept in an asgiref Local, so an async view and
+the threads it runs database work in (see async_db.py) share them. Under
+ASGI, the SQL of sync views runs in threads the middleware cannot wrap, and
+is only counted for the async views.
+"""
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+from asgiref.local import Local
+from django.conf import settings
+
+slow_request_logger = logging.getLogger('ahj_app.slow_requests')
+
+"""
+The metrics recorded for each request, with their Prometheus help text
+"""
+METRICS = collections.OrderedDict([
+    ('request_duration_seconds', 'Time taken to respond to a request'),
+    ('sql_queries', 'Number of SQL queries run by a request'),
+    ('sql_duration_seconds', 'Time a request spent running SQL queries'),
+    ('geocode_duration_seconds', 'Time a request spent calling the external geocoder'),
+    ('serializer_duration_seconds', 'Time a request spent serializing AHJs'),
+    ('response_size_bytes', 'Size of the response body')
+])
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+"""
+Number of queries of a request kept for the slow request log
+"""
+SLOW_REQUEST_MAX_QUERIES = 100
+
+
+class RequestMetrics:
+    """
+    The metrics of the request being handled by a thread or task.
+    """
+    def __init__(self, capture_queries=False):
+        self.sql_queries = 0
+        self.sql_duration_seconds = 0.0
+        self.geocode_duration_seconds = 0.0
+        self.serializer_duration_seconds = 0.0
+        self.capture_queries = capture_queries
+        self.queries = []
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper timing each query (see connection.execute_wrapper).
+        """
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.monotonic() - start
+            self.sql_queries += 1
+            self.sql_duration_seconds += duration
+            if self.capture_queries and len(self.queries) < SLOW_REQUEST_MAX_QUERIES:
+                self.queries.append((duration, sql, params))
+
+
+class EndpointMetrics:
+    """
+    The counts, sums, and rolling windows of the metrics of one URL name.
+    """
+    def __init__(self, window_size):
+        self.count = 0
+        self.sums = {name: 0.0 for name in METRICS}
+        self.windows = {name: collections.deque(maxlen=window_size) for name in METRICS}
+
+    def record(self, values):
+        self.count += 1
+        for name, value in values.items():
+            self.sums[name] += value
+            self.windows[name].append(value)
+
+
+_local = Local()
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def start_request():
+    _local.metrics = RequestMetrics(capture_queries=settings.METRICS_SLOW_REQUEST_SECONDS is not None)
+    return _local.metrics
+
+
+def end_request():
+    _local.metrics = None
+
+
+def get_request_metrics():
+    return getattr(_local, 'metrics', None)
+
+
+@contextlib.contextmanager
+def timed(name):
+    """
+    Adds the time taken by the block to the <name>_duration_seconds metric of the current request, if any.
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        request_metrics = get_request_metrics()
+        if request_metrics is not None:
+            attribute = name + '_duration_seconds'
+            setattr(request_metrics, attribute, getattr(request_metrics, attribute) + time.monotonic() - start)
+
+
+def record_request(url_name, request_metrics, duration, response_size):
+    """
+    Records the metrics of a finished request under its URL name.
+    """
+    values = {
+        'request_duration_seconds': duration,
+        'sql_queries': request_metrics.sql_queries,
+        'sql_duration_seconds': request_metrics.sql_duration_seconds,
+        'geocode_duration_seconds': request_metrics.geocode_duration_seconds,
+        'serializer_duration_seconds': request_metrics.serializer_duration_seconds,
+        'response_size_bytes': response_size
+    }
+    with _endpoints_lock:
+        if url_name not in _endpoints:
+            _endpoints[url_name] = EndpointMetrics(settings.METRICS_WINDOW_SIZE)
+        _endpoints[url_name].record(values)
+    return values
+
+
+def log_slow_request(request, url_name, status_code, values, request_metrics):
+    lines = ['{0} {1} ({2}) {3}: {4}'.format(request.method, request.get_full_path(), url_name, status_code,
+                                            ', '.join(f'{name}={value:.6g}' for name, value in values.items()))]
+    for duration, sql, params in request_metrics.queries:
+        lines.append(f'  {duration * 1000:.3f} ms: {sql} {params}')
+    if request_metrics.sql_queries > len(request_metrics.queries):
+        lines.append(f'  ... {request_metrics.sql_queries - len(request_metrics.queries)} more queries')
+    slow_request_logger.warning('\n'.join(lines))
+
+
+def reset_metrics():
+    with _endpoints_lock:
+        _endpoints.clear()
+
+
+def get_quantile(sorted_values, quantile):
+    if len(sorted_values) == 0:
+        return float('nan')
+    return sorted_values[min(int(quantile * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    """
+    Returns the metrics of every URL name in the Prometheus text exposition format.
+    """
+    with _endpoints_lock:
+        snapshot = {url_name: (endpoint.count, dict(endpoint.sums), {name: sorted(window) for name, window in endpoint.windows.items()})
+                    for url_name, endpoint in _endpoints.items()}
+    lines = []
+    for name, help_text in METRICS.items():
+        metric = 'ahj_' + name
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} summary')
+        for url_name, (count, sums, windows) in sorted(snapshot.items()):
+            label = 'url_name="{0}"'.format(escape_label_value(url_name))
+            for quantile in QUANTILES:
+                lines.append(f'{metric}{{{label},quantile="{quantile}"}} {get_quantile(windows[name], quantile)}')
+            lines.append(f'{metric}_sum{{{label}}} {sums[name]}')
+            lines.append(f'{metric}_count{{{label}}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -1,3 +1,5 @@
+import asyncio
+
 from request_logging.middleware import LoggingMiddleware
 
 
@@ -5,15 +7,39 @@ class SkipRequestLoggingMiddleware(LoggingMiddleware):
     """
     Inherits from django-request-logging's LoggingMiddleware:
     https://github.com/Rhumbix/django-request-logging/blob/master/request_logging/middleware.py#L73
+    It is async capable, so it does not stop async views from being awaited under ASGI.
     """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Mark the middleware as a coroutine function, as Django's MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
     def __call__(self, request):
         """
         Overridden to skip calling self.process_request(request, response).
         Requests are not logged anymore; only responses to requests are logged.
         """
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
         self.cached_request_body = request.body
         response = self.get_response(request)
+        self.log_response(request, response)
+        return response
+
+    async def __acall__(self, request):
+        # Read before the view reads the request's stream, so it can still be read here after
+        request_body = request.body
+        response = await self.get_response(request)
+        # Set after awaiting the response, since other requests are handled meanwhile
+        self.cached_request_body = request_body
+        self.log_response(request, response)
+        return response
+
+    def log_response(self, request, response):
         if not hasattr(request, 'auth'):
             """
             LOGGING in settings.py wants a request.auth but this is only set
@@ -22,4 +48,3 @@ class SkipRequestLoggingMiddleware(LoggingMiddleware):
             """
             setattr(request, 'auth', None)
         self.process_response(request, response)
-        return response
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from ahj_app import metrics
+
+
+class MetricsMiddleware:
+    """
+    Records the SQL queries, time taken, and response size
+    of each request under its URL name (see ahj_app/metrics.py).
+    It is async capable, so it does not stop async views from being awaited under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Mark the middleware as a coroutine function, as Django's MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        request_metrics = metrics.start_request()
+        start = time.monotonic()
+        try:
+            with connection.execute_wrapper(request_metrics.record_query):
+                response = self.get_response(request)
+            duration = time.monotonic() - start
+        finally:
+            metrics.end_request()
+        self.record(request, response, request_metrics, duration)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        # Queries of async views are counted by async_db.run_sync
+        request_metrics = metrics.start_request()
+        start = time.monotonic()
+        try:
+            response = await self.get_response(request)
+            duration = time.monotonic() - start
+        finally:
+            metrics.end_request()
+        self.record(request, response, request_metrics, duration)
+        return response
+
+    def record(self, request, response, request_metrics, duration):
+        resolver_match = getattr(request, 'resolver_match', None)
+        url_name = resolver_match.view_name if resolver_match is not None and resolver_match.view_name else 'unmatched'
+        # Streamed responses, such as files, are not read to measure them
+        response_size = len(response.content) if not response.streaming else 0
+        values = metrics.record_request(url_name, request_metrics, duration, response_size)
+        if settings.METRICS_SLOW_REQUEST_SECONDS is not None and duration >= settings.METRICS_SLOW_REQUEST_SECONDS:
+            metrics.log_slow_request(request, url_name, response.status_code, values, request_metrics)
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0011_auto_20210623_2231'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('AddressKey', models.CharField(db_column='AddressKey', max_length=64, primary_key=True, serialize=False)),
+                ('Address', models.TextField(db_column='Address')),
+                ('Latitude', models.FloatField(db_column='Latitude', null=True)),
+                ('Longitude', models.FloatField(db_column='Longitude', null=True)),
+                ('Elevation', models.FloatField(db_column='Elevation', null=True)),
+                ('Created', models.DateTimeField(db_column='Created', default=django.utils.timezone.now)),
+                ('LastUsed', models.DateTimeField(db_column='LastUsed', db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Geocode Cache Entry',
+                'verbose_name_plural': 'Geocode Cache Entries',
+                'db_table': 'GeocodeCache',
+                'managed': True,
+            },
+        ),
+    ]
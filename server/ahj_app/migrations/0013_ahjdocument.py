@@ -0,0 +1,30 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0012_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AHJDocument',
+            fields=[
+                ('AHJPK', models.OneToOneField(db_column='AHJPK', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, serialize=False, to='ahj_app.ahj')),
+                ('PublicDocument', models.TextField(db_column='PublicDocument', null=True)),
+                ('PrivateDocument', models.TextField(db_column='PrivateDocument', null=True)),
+                ('Updated', models.DateTimeField(db_column='Updated', default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'AHJ Document',
+                'verbose_name_plural': 'AHJ Documents',
+                'db_table': 'AHJDocument',
+                'managed': True,
+            },
+        ),
+    ]
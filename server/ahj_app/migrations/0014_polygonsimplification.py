@@ -0,0 +1,31 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0013_ahjdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolygonSimplification',
+            fields=[
+                ('SimplificationID', models.AutoField(db_column='SimplificationID', primary_key=True, serialize=False)),
+                ('Detail', models.CharField(db_column='Detail', max_length=10)),
+                ('Polygon', django.contrib.gis.db.models.fields.MultiPolygonField(db_column='Polygon', spatial_index=False, srid=4326)),
+                ('PolygonID', models.ForeignKey(db_column='PolygonID', on_delete=django.db.models.deletion.DO_NOTHING, to='ahj_app.polygon')),
+            ],
+            options={
+                'verbose_name': 'Polygon Simplification',
+                'verbose_name_plural': 'Polygon Simplifications',
+                'db_table': 'PolygonSimplification',
+                'managed': True,
+                'unique_together': {('PolygonID', 'Detail')},
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0014_polygonsimplification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolygonCoverage',
+            fields=[
+                ('PolygonID', models.OneToOneField(db_column='PolygonID', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, serialize=False, to='ahj_app.polygon')),
+                ('NumAHJs', models.IntegerField(db_column='NumAHJs', default=0)),
+                ('NumBuildingCodes', models.IntegerField(db_column='NumBuildingCodes', default=0)),
+                ('NumElectricCodes', models.IntegerField(db_column='NumElectricCodes', default=0)),
+                ('NumFireCodes', models.IntegerField(db_column='NumFireCodes', default=0)),
+                ('NumResidentialCodes', models.IntegerField(db_column='NumResidentialCodes', default=0)),
+                ('NumWindCodes', models.IntegerField(db_column='NumWindCodes', default=0)),
+                ('StatePolygonID', models.ForeignKey(db_column='StatePolygonID', on_delete=django.db.models.deletion.DO_NOTHING, to='ahj_app.statepolygon')),
+            ],
+            options={
+                'verbose_name': 'Polygon Coverage',
+                'verbose_name_plural': 'Polygon Coverages',
+                'db_table': 'PolygonCoverage',
+                'managed': True,
+            },
+        ),
+        migrations.CreateModel(
+            name='StateCoverage',
+            fields=[
+                ('StatePolygonID', models.OneToOneField(db_column='StatePolygonID', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, serialize=False, to='ahj_app.statepolygon')),
+                ('NumAHJs', models.IntegerField(db_column='NumAHJs', default=0)),
+                ('NumBuildingCodes', models.IntegerField(db_column='NumBuildingCodes', default=0)),
+                ('NumElectricCodes', models.IntegerField(db_column='NumElectricCodes', default=0)),
+                ('NumFireCodes', models.IntegerField(db_column='NumFireCodes', default=0)),
+                ('NumResidentialCodes', models.IntegerField(db_column='NumResidentialCodes', default=0)),
+                ('NumWindCodes', models.IntegerField(db_column='NumWindCodes', default=0)),
+            ],
+            options={
+                'verbose_name': 'State Coverage',
+                'verbose_name_plural': 'State Coverages',
+                'db_table': 'StateCoverage',
+                'managed': True,
+            },
+        ),
+        # Fills the tables from the existing AHJs, as `manage.py rebuild_coverage` does
+        migrations.RunSQL(
+            sql=[
+                'INSERT INTO PolygonCoverage (PolygonID, StatePolygonID, NumAHJs, NumBuildingCodes, NumElectricCodes, '
+                'NumFireCodes, NumResidentialCodes, NumWindCodes) '
+                'SELECT polygons.PolygonID, MIN(polygons.StatePolygonID), COUNT(AHJ.AHJPK), COUNT(AHJ.BuildingCode), '
+                'COUNT(AHJ.ElectricCode), COUNT(AHJ.FireCode), COUNT(AHJ.ResidentialCode), COUNT(AHJ.WindCode) FROM '
+                '(SELECT PolygonID, StatePolygonID FROM CountyPolygon '
+                'UNION SELECT PolygonID, StatePolygonID FROM CityPolygon '
+                'UNION SELECT PolygonID, StatePolygonID FROM CountySubdivisionPolygon) as polygons '
+                'LEFT JOIN AHJ ON polygons.PolygonID=AHJ.PolygonID GROUP BY polygons.PolygonID;',
+                'INSERT INTO StateCoverage (StatePolygonID, NumAHJs, NumBuildingCodes, NumElectricCodes, '
+                'NumFireCodes, NumResidentialCodes, NumWindCodes) '
+                'SELECT StatePolygonID, SUM(GREATEST(NumAHJs, 1)), SUM(NumBuildingCodes), SUM(NumElectricCodes), '
+                'SUM(NumFireCodes), SUM(NumResidentialCodes), SUM(NumWindCodes) '
+                'FROM PolygonCoverage GROUP BY StatePolygonID;'
+            ],
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0015_coverage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeJob',
+            fields=[
+                ('JobID', models.AutoField(db_column='JobID', primary_key=True, serialize=False)),
+                ('Queued', models.DateTimeField(db_column='Queued', default=django.utils.timezone.now)),
+                ('NextAttempt', models.DateTimeField(db_column='NextAttempt', db_index=True, default=django.utils.timezone.now, null=True)),
+                ('Attempts', models.IntegerField(db_column='Attempts', default=0)),
+                ('LastError', models.CharField(blank=True, db_column='LastError', max_length=255)),
+                ('AddressID', models.OneToOneField(db_column='AddressID', on_delete=django.db.models.deletion.DO_NOTHING, to='ahj_app.address')),
+            ],
+            options={
+                'verbose_name': 'Geocode Job',
+                'verbose_name_plural': 'Geocode Jobs',
+                'db_table': 'GeocodeJob',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0016_geocodejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistryDataVersion',
+            fields=[
+                ('VersionID', models.IntegerField(db_column='VersionID', primary_key=True, serialize=False)),
+                ('Version', models.BigIntegerField(db_column='Version', default=0)),
+                ('Updated', models.DateTimeField(db_column='Updated', default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Registry Data Version',
+                'verbose_name_plural': 'Registry Data Versions',
+                'db_table': 'RegistryDataVersion',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0017_registrydataversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ahj',
+            index=models.Index(fields=['AHJCode'], name='AHJ_AHJCode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['AHJPK', 'Date'], name='Comment_AHJPK_Date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['ReplyingTo', 'Date'], name='Comment_ReplyingTo_Date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['StateProvince'], name='Address_StateProvince_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='edit',
+            index=models.Index(fields=['ReviewStatus', 'DateEffective'], name='Edit_status_effective_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='edit',
+            index=models.Index(fields=['SourceTable', 'SourceRow', 'SourceColumn', 'ReviewStatus', 'DateEffective'], name='Edit_source_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ahjusermaintains',
+            index=models.Index(fields=['AHJPK', 'MaintainerStatus'], name='AHJUserMaintains_AHJPK_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ahjusermaintains',
+            index=models.Index(fields=['UserID', 'MaintainerStatus'], name='AHJUserMaintains_UserID_idx'),
+        ),
+    ]
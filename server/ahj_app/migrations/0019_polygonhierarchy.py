@@ -0,0 +1,31 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0018_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolygonHierarchy',
+            fields=[
+                ('HierarchyID', models.AutoField(db_column='HierarchyID', primary_key=True, serialize=False)),
+                ('ChildType', models.CharField(db_column='ChildType', max_length=30)),
+                ('OverlapRatio', models.FloatField(db_column='OverlapRatio')),
+                ('ChildPolygonID', models.ForeignKey(db_column='ChildPolygonID', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ahj_app.polygon')),
+                ('ParentPolygonID', models.ForeignKey(db_column='ParentPolygonID', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ahj_app.polygon')),
+            ],
+            options={
+                'verbose_name': 'Polygon Hierarchy',
+                'verbose_name_plural': 'Polygon Hierarchies',
+                'db_table': 'PolygonHierarchy',
+                'managed': True,
+                'unique_together': {('ParentPolygonID', 'ChildPolygonID')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ahj_app', '0019_polygonhierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoGridCell',
+            fields=[
+                ('CellID', models.AutoField(db_column='CellID', primary_key=True, serialize=False)),
+                ('Geohash', models.CharField(db_column='Geohash', max_length=12)),
+                ('IsCovered', models.BooleanField(db_column='IsCovered')),
+                ('PolygonID', models.ForeignKey(db_column='PolygonID', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ahj_app.polygon')),
+                ('StatePolygonID', models.ForeignKey(db_column='StatePolygonID', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ahj_app.statepolygon')),
+            ],
+            options={
+                'verbose_name': 'Geo Grid Cell',
+                'verbose_name_plural': 'Geo Grid Cells',
+                'db_table': 'GeoGridCell',
+                'managed': True,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='geogridcell',
+            index=models.Index(fields=['Geohash'], name='GeoGridCell_Geohash_idx'),
+        ),
+    ]
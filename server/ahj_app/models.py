@@ -3,6 +3,7 @@ import datetime
 from django.apps import apps
 from django.conf import settings
 from .models_field_enums import *
+from . import enum_registry
 from django.contrib.gis.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -13,6 +14,18 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from simple_history.models import HistoricalRecords
 import uuid
 
+
+def get_prefetched_rows(instance, name, queryset):
+    """
+    Returns the rows a batched loader attached to the instance under name
+    (see ahj_app.prefetch), otherwise the given queryset is used.
+    """
+    prefetched = getattr(instance, '_prefetched_child_rows', {})
+    if name in prefetched:
+        return prefetched[name]
+    return queryset
+
+
 class AHJ(models.Model):
     AHJPK = models.AutoField(db_column='AHJPK', primary_key=True)
     AHJID = models.CharField(db_column='AHJID', unique=True, max_length=36)
@@ -44,47 +57,48 @@ class AHJ(models.Model):
         db_table = 'AHJ'
         verbose_name = 'AHJ'
         verbose_name_plural = 'AHJs'
+        indexes = [models.Index(fields=['AHJCode'], name='AHJ_AHJCode_idx')]
 
 
     def get_contacts(self):
-        return [contact for contact in Contact.objects.filter(ParentTable='AHJ', ParentID=self.AHJPK) if contact.ContactStatus is True]
+        return [contact for contact in get_prefetched_rows(self, 'Contacts', Contact.objects.filter(ParentTable='AHJ', ParentID=self.AHJPK)) if contact.ContactStatus is True]
 
     def get_unconfirmed(self):
-        return [contact for contact in Contact.objects.filter(ParentTable='AHJ', ParentID=self.AHJPK) if contact.ContactStatus is None]
+        return [contact for contact in get_prefetched_rows(self, 'Contacts', Contact.objects.filter(ParentTable='AHJ', ParentID=self.AHJPK)) if contact.ContactStatus is None]
 
     def get_comments(self):
-        return [comment for comment in Comment.objects.filter(AHJPK=self.AHJPK).order_by('-Date')]
+        return [comment for comment in get_prefetched_rows(self, 'Comments', Comment.objects.filter(AHJPK=self.AHJPK).order_by('-Date'))]
 
     def get_inspections(self):
-        return [ins for ins in AHJInspection.objects.filter(AHJPK=self.AHJPK) if ins.InspectionStatus is True]
+        return [ins for ins in get_prefetched_rows(self, 'AHJInspections', AHJInspection.objects.filter(AHJPK=self.AHJPK)) if ins.InspectionStatus is True]
 
     def get_unconfirmed_inspections(self):
-        return [ins for ins in AHJInspection.objects.filter(AHJPK=self.AHJPK) if ins.InspectionStatus is None]
+        return [ins for ins in get_prefetched_rows(self, 'AHJInspections', AHJInspection.objects.filter(AHJPK=self.AHJPK)) if ins.InspectionStatus is None]
 
 
     def get_document_submission_methods(self):
-        return [dsm for dsm in AHJDocumentSubmissionMethodUse.objects.filter(AHJPK=self.AHJPK) if dsm.MethodStatus is True]
+        return [dsm for dsm in get_prefetched_rows(self, 'DocumentSubmissionMethods', AHJDocumentSubmissionMethodUse.objects.filter(AHJPK=self.AHJPK)) if dsm.MethodStatus is True]
 
     def get_uncon_dsm(self):
-        return [dsm for dsm in AHJDocumentSubmissionMethodUse.objects.filter(AHJPK=self.AHJPK) if dsm.MethodStatus is None]
+        return [dsm for dsm in get_prefetched_rows(self, 'DocumentSubmissionMethods', AHJDocumentSubmissionMethodUse.objects.filter(AHJPK=self.AHJPK)) if dsm.MethodStatus is None]
 
     def get_permit_submission_methods(self):
-        return [pim for pim in AHJPermitIssueMethodUse.objects.filter(AHJPK=self.AHJPK) if pim.MethodStatus is True]
+        return [pim for pim in get_prefetched_rows(self, 'PermitIssueMethods', AHJPermitIssueMethodUse.objects.filter(AHJPK=self.AHJPK)) if pim.MethodStatus is True]
 
     def get_uncon_pim(self):
-        return [pim for pim in AHJPermitIssueMethodUse.objects.filter(AHJPK=self.AHJPK) if pim.MethodStatus is None]
+        return [pim for pim in get_prefetched_rows(self, 'PermitIssueMethods', AHJPermitIssueMethodUse.objects.filter(AHJPK=self.AHJPK)) if pim.MethodStatus is None]
 
     def get_err(self):
-        return[err for err in EngineeringReviewRequirement.objects.filter(AHJPK=self.AHJPK) if err.EngineeringReviewRequirementStatus is True]
+        return[err for err in get_prefetched_rows(self, 'EngineeringReviewRequirements', EngineeringReviewRequirement.objects.filter(AHJPK=self.AHJPK)) if err.EngineeringReviewRequirementStatus is True]
 
     def get_uncon_err(self):
-        return[err for err in EngineeringReviewRequirement.objects.filter(AHJPK=self.AHJPK) if err.EngineeringReviewRequirementStatus is None]
+        return[err for err in get_prefetched_rows(self, 'EngineeringReviewRequirements', EngineeringReviewRequirement.objects.filter(AHJPK=self.AHJPK)) if err.EngineeringReviewRequirementStatus is None]
 
     def get_fee_structures(self):
-        return [fs for fs in FeeStructure.objects.filter(AHJPK=self.AHJPK) if fs.FeeStructureStatus is True]
+        return [fs for fs in get_prefetched_rows(self, 'FeeStructures', FeeStructure.objects.filter(AHJPK=self.AHJPK)) if fs.FeeStructureStatus is True]
 
     def get_uncon_fs(self):
-        return [fs for fs in FeeStructure.objects.filter(AHJPK=self.AHJPK) if fs.FeeStructureStatus is None]
+        return [fs for fs in get_prefetched_rows(self, 'FeeStructures', FeeStructure.objects.filter(AHJPK=self.AHJPK)) if fs.FeeStructureStatus is None]
 
     SERIALIZER_EXCLUDED_FIELDS = ['Polygon', 'AHJPK', 'Comments', 'UnconfirmedContacts', 'UnconfirmedEngineeringReviewRequirements', 'UnconfirmedDocumentSubmissionMethods', 'UnconfirmedPermitIssueMethods', 'UnconfirmedInspections', 'UnconfirmedFeeStructures']
 
@@ -98,13 +112,21 @@ class Comment(models.Model):
     history = HistoricalRecords()
 
     def get_replies(self):
-        return [comment for comment in Comment.objects.filter(ReplyingTo=self.CommentID).order_by('-Date')]
+        return [comment for comment in get_prefetched_rows(self, 'Replies', Comment.objects.filter(ReplyingTo=self.CommentID).order_by('-Date', '-CommentID'))]
+
+    def get_reply_count(self):
+        reply_count = get_prefetched_rows(self, 'ReplyCount', None)
+        if reply_count is None:
+            return Comment.objects.filter(ReplyingTo=self.CommentID).count()
+        return reply_count
 
     class Meta:
         managed = True
         db_table = 'Comment'
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
+        indexes = [models.Index(fields=['AHJPK', 'Date'], name='Comment_AHJPK_Date_idx'),
+                   models.Index(fields=['ReplyingTo', 'Date'], name='Comment_ReplyingTo_Date_idx')]
 
 class Address(models.Model):
     AddressID = models.AutoField(db_column='AddressID', primary_key=True)
@@ -126,6 +148,7 @@ class Address(models.Model):
         db_table = 'Address'
         verbose_name = 'Address'
         verbose_name_plural = 'Addresses'
+        indexes = [models.Index(fields=['StateProvince'], name='Address_StateProvince_idx')]
 
     SERIALIZER_EXCLUDED_FIELDS = ['AddressID']
 
@@ -183,10 +206,10 @@ class AHJInspection(models.Model):
     InspectionStatus = models.BooleanField(db_column='InspectionStatus', null=True)
     history = HistoricalRecords()
     def get_contacts(self):
-        return [contact for contact in Contact.objects.filter(ParentTable='AHJInspection', ParentID=self.InspectionID) if contact.ContactStatus is True]
+        return [contact for contact in get_prefetched_rows(self, 'Contacts', Contact.objects.filter(ParentTable='AHJInspection', ParentID=self.InspectionID)) if contact.ContactStatus is True]
 
     def get_uncon_con(self):
-        return [contact for contact in Contact.objects.filter(ParentTable='AHJInspection', ParentID=self.InspectionID) if contact.ContactStatus is None]
+        return [contact for contact in get_prefetched_rows(self, 'Contacts', Contact.objects.filter(ParentTable='AHJInspection', ParentID=self.InspectionID)) if contact.ContactStatus is None]
 
     def create_relation_to(self, to):
         if to.__class__.__name__ == 'AHJ':
@@ -260,6 +283,9 @@ class Edit(models.Model):
         db_table = 'Edit'
         verbose_name = 'Edit'
         verbose_name_plural = 'Edits'
+        indexes = [models.Index(fields=['ReviewStatus', 'DateEffective'], name='Edit_status_effective_idx'),
+                   models.Index(fields=['SourceTable', 'SourceRow', 'SourceColumn', 'ReviewStatus', 'DateEffective'],
+                                name='Edit_source_status_idx')]
 
     def get_edited_row(self):
         model = apps.get_model('ahj_app', self.SourceTable)
@@ -355,7 +381,7 @@ class AHJDocumentSubmissionMethodUse(models.Model):
     SERIALIZER_EXCLUDED_FIELDS = ['UseID']
 
     def get_value(self):
-        return self.DocumentSubmissionMethodID.Value
+        return enum_registry.get_field_value(self, 'DocumentSubmissionMethodID')
 
     def get_relation_status_field(self):
         return 'MethodStatus'
@@ -400,7 +426,7 @@ class AHJPermitIssueMethodUse(models.Model):
     SERIALIZER_EXCLUDED_FIELDS = ['UseID']
 
     def get_value(self):
-        return self.PermitIssueMethodID.Value
+        return enum_registry.get_field_value(self, 'PermitIssueMethodID')
 
     def get_relation_status_field(self):
         return 'MethodStatus'
@@ -530,13 +556,13 @@ class User(AbstractBaseUser):
         return "Email"
 
     def get_maintained_ahjs(self):
-        return [ahjpk.AHJPK.AHJPK for ahjpk in AHJUserMaintains.objects.filter(UserID=self).filter(MaintainerStatus=True)]
+        return [maintains.AHJPK_id for maintains in get_prefetched_rows(self, 'MaintainedAHJs', AHJUserMaintains.objects.filter(UserID=self).filter(MaintainerStatus=True))]
 
     def is_ahj_official(self):
         return len(self.get_maintained_ahjs()) > 0
 
     def get_API_token(self):
-        api_token = APIToken.objects.filter(user=self).first()
+        api_token = next(iter(get_prefetched_rows(self, 'APITokens', APIToken.objects.filter(user=self).order_by('pk')[:1])), None)
         if api_token is None:
             return ''
         return api_token.key
@@ -560,6 +586,8 @@ class AHJUserMaintains(models.Model):
         verbose_name = 'AHJ User Maintains'
         verbose_name_plural = 'AHJ User Maintains'
         unique_together = (('AHJPK', 'UserID'),)
+        indexes = [models.Index(fields=['AHJPK', 'MaintainerStatus'], name='AHJUserMaintains_AHJPK_idx'),
+                   models.Index(fields=['UserID', 'MaintainerStatus'], name='AHJUserMaintains_UserID_idx')]
 
 class WebpageToken(rest_framework.authtoken.models.Token):
     key = models.CharField(max_length=40, primary_key=True, serialize=False, verbose_name='Key')
@@ -681,3 +709,179 @@ class AHJCensusName(models.Model):
     class Meta:
         verbose_name = 'AHJ Census Name'
         verbose_name_plural = 'AHJ Census Names'
+
+class GeocodeCache(models.Model):
+    """
+    Cached geocoder results keyed by the hash of a normalized address (see geocoding.py).
+    Latitude and Longitude are null if the address had no result.
+    Elevation is null until it is looked up for the address.
+    """
+    AddressKey = models.CharField(db_column='AddressKey', max_length=64, primary_key=True)
+    Address = models.TextField(db_column='Address')
+    Latitude = models.FloatField(db_column='Latitude', null=True)
+    Longitude = models.FloatField(db_column='Longitude', null=True)
+    Elevation = models.FloatField(db_column='Elevation', null=True)
+    Created = models.DateTimeField(db_column='Created', default=now)
+    LastUsed = models.DateTimeField(db_column='LastUsed', default=now, db_index=True)
+    # NOTE: No HistoricalRecords; rows are disposable copies of geocoder responses
+
+    class Meta:
+        managed = True
+        db_table = 'GeocodeCache'
+        verbose_name = 'Geocode Cache Entry'
+        verbose_name_plural = 'Geocode Cache Entries'
+
+class AHJDocument(models.Model):
+    """
+    The serialized public and private views of an AHJ, stored as JSON text (see documents.py).
+    A view is null until it is built.
+    """
+    AHJPK = models.OneToOneField(AHJ, models.DO_NOTHING, db_column='AHJPK', primary_key=True)
+    PublicDocument = models.TextField(db_column='PublicDocument', null=True)
+    PrivateDocument = models.TextField(db_column='PrivateDocument', null=True)
+    Updated = models.DateTimeField(db_column='Updated', default=now)
+    # NOTE: No HistoricalRecords; rows are rebuilt from the AHJ's rows
+
+    class Meta:
+        managed = True
+        db_table = 'AHJDocument'
+        verbose_name = 'AHJ Document'
+        verbose_name_plural = 'AHJ Documents'
+
+class PolygonSimplification(models.Model):
+    """
+    A simplified copy of a Polygon's geometry at one of the detail levels in polygon_detail.py.
+    """
+    SimplificationID = models.AutoField(db_column='SimplificationID', primary_key=True)
+    PolygonID = models.ForeignKey(Polygon, models.DO_NOTHING, db_column='PolygonID')
+    Detail = models.CharField(db_column='Detail', max_length=10)
+    # NOTE: Not spatially indexed; rows are only read by PolygonID
+    Polygon = models.MultiPolygonField(db_column='Polygon', spatial_index=False)
+    # NOTE: No HistoricalRecords; rows are rebuilt from the Polygon's geometry
+
+    class Meta:
+        managed = True
+        db_table = 'PolygonSimplification'
+        verbose_name = 'Polygon Simplification'
+        verbose_name_plural = 'Polygon Simplifications'
+        unique_together = (('PolygonID', 'Detail'),)
+
+class PolygonHierarchy(models.Model):
+    """
+    A polygon within a state, or within a county, and the fraction of its area inside
+    that parent. Location searches descend from a state to the polygons within the
+    counties containing the location (see polygon_hierarchy.py).
+    """
+    HierarchyID = models.AutoField(db_column='HierarchyID', primary_key=True)
+    ParentPolygonID = models.ForeignKey(Polygon, models.DO_NOTHING, db_column='ParentPolygonID', related_name='+')
+    ChildPolygonID = models.ForeignKey(Polygon, models.DO_NOTHING, db_column='ChildPolygonID', related_name='+')
+    # The polygon type table of the child: 'CountyPolygon', 'CityPolygon', or 'CountySubdivisionPolygon'
+    ChildType = models.CharField(db_column='ChildType', max_length=30)
+    OverlapRatio = models.FloatField(db_column='OverlapRatio')
+    # NOTE: No HistoricalRecords; rows are rebuilt from the polygon tables
+
+    class Meta:
+        managed = True
+        db_table = 'PolygonHierarchy'
+        verbose_name = 'Polygon Hierarchy'
+        verbose_name_plural = 'Polygon Hierarchies'
+        unique_together = (('ParentPolygonID', 'ChildPolygonID'),)
+
+class GeoGridCell(models.Model):
+    """
+    A polygon covering or crossing a geohash cell. Location searches test only the
+    polygons crossing the cell of the location (see geo_grid.py).
+    """
+    CellID = models.AutoField(db_column='CellID', primary_key=True)
+    Geohash = models.CharField(db_column='Geohash', max_length=12)
+    PolygonID = models.ForeignKey(Polygon, models.DO_NOTHING, db_column='PolygonID', related_name='+')
+    # Null for state polygons
+    StatePolygonID = models.ForeignKey(StatePolygon, models.DO_NOTHING, db_column='StatePolygonID', null=True, related_name='+')
+    IsCovered = models.BooleanField(db_column='IsCovered')
+    # NOTE: No HistoricalRecords; rows are rebuilt from the polygon tables
+
+    class Meta:
+        managed = True
+        db_table = 'GeoGridCell'
+        verbose_name = 'Geo Grid Cell'
+        verbose_name_plural = 'Geo Grid Cells'
+        indexes = [models.Index(fields=['Geohash'], name='GeoGridCell_Geohash_idx')]
+
+class PolygonCoverage(models.Model):
+    """
+    The number of AHJs paired with a state's county, city, or county subdivision
+    polygon, and the number of them with each code. See coverage.py.
+    """
+    PolygonID = models.OneToOneField(Polygon, models.DO_NOTHING, db_column='PolygonID', primary_key=True)
+    StatePolygonID = models.ForeignKey(StatePolygon, models.DO_NOTHING, db_column='StatePolygonID')
+    NumAHJs = models.IntegerField(db_column='NumAHJs', default=0)
+    NumBuildingCodes = models.IntegerField(db_column='NumBuildingCodes', default=0)
+    NumElectricCodes = models.IntegerField(db_column='NumElectricCodes', default=0)
+    NumFireCodes = models.IntegerField(db_column='NumFireCodes', default=0)
+    NumResidentialCodes = models.IntegerField(db_column='NumResidentialCodes', default=0)
+    NumWindCodes = models.IntegerField(db_column='NumWindCodes', default=0)
+    # NOTE: No HistoricalRecords; rows are rebuilt from the AHJ table
+
+    class Meta:
+        managed = True
+        db_table = 'PolygonCoverage'
+        verbose_name = 'Polygon Coverage'
+        verbose_name_plural = 'Polygon Coverages'
+
+class StateCoverage(models.Model):
+    """
+    The sums of the PolygonCoverage rows of a state, as served by data_map.
+    """
+    StatePolygonID = models.OneToOneField(StatePolygon, models.DO_NOTHING, db_column='StatePolygonID', primary_key=True)
+    # NOTE: Counts each polygon of the state without an AHJ as one, like the query data_map served before
+    NumAHJs = models.IntegerField(db_column='NumAHJs', default=0)
+    NumBuildingCodes = models.IntegerField(db_column='NumBuildingCodes', default=0)
+    NumElectricCodes = models.IntegerField(db_column='NumElectricCodes', default=0)
+    NumFireCodes = models.IntegerField(db_column='NumFireCodes', default=0)
+    NumResidentialCodes = models.IntegerField(db_column='NumResidentialCodes', default=0)
+    NumWindCodes = models.IntegerField(db_column='NumWindCodes', default=0)
+    # NOTE: No HistoricalRecords; rows are rebuilt from the PolygonCoverage table
+
+    class Meta:
+        managed = True
+        db_table = 'StateCoverage'
+        verbose_name = 'State Coverage'
+        verbose_name_plural = 'State Coverages'
+
+class GeocodeJob(models.Model):
+    """
+    A queued geocoding of an Address, which sets the Latitude, Longitude, and Elevation
+    of its Location (see geocode_jobs.py). The row is deleted once the address is geocoded.
+    NextAttempt is null once the job has failed GEOCODE_JOB_MAX_ATTEMPTS times.
+    """
+    JobID = models.AutoField(db_column='JobID', primary_key=True)
+    AddressID = models.OneToOneField(Address, models.DO_NOTHING, db_column='AddressID')
+    Queued = models.DateTimeField(db_column='Queued', default=now)
+    NextAttempt = models.DateTimeField(db_column='NextAttempt', default=now, null=True, db_index=True)
+    Attempts = models.IntegerField(db_column='Attempts', default=0)
+    LastError = models.CharField(db_column='LastError', max_length=255, blank=True)
+    # NOTE: No HistoricalRecords; rows only exist until their address is geocoded
+
+    class Meta:
+        managed = True
+        db_table = 'GeocodeJob'
+        verbose_name = 'Geocode Job'
+        verbose_name_plural = 'Geocode Jobs'
+
+class RegistryDataVersion(models.Model):
+    """
+    A number incremented whenever a row serialized under an AHJ changes, and one
+    incremented whenever a row in the public view of an AHJ changes.
+    Cached search responses are keyed on them (see response_cache.py).
+    A third row counts polygon changes, which reload the spatial index (see spatial_index.py).
+    """
+    VersionID = models.IntegerField(db_column='VersionID', primary_key=True)
+    Version = models.BigIntegerField(db_column='Version', default=0)
+    Updated = models.DateTimeField(db_column='Updated', default=now)
+    # NOTE: No HistoricalRecords; the row is only a counter
+
+    class Meta:
+        managed = True
+        db_table = 'RegistryDataVersion'
+        verbose_name = 'Registry Data Version'
+        verbose_name_plural = 'Registry Data Versions'
@@ -0,0 +1,305 @@
+"""
+In-process trigram index of the AHJ names.
+
+When the index is loaded (see settings.NAME_INDEX_ENABLED), the names and
+census names of the AHJs are held in memory as the trigrams of their
+normalized words, and ahj-private/autocomplete/ is answered from the index.
+
+filter_ahjs matched AHJName with LIKE '%name%', which reads every row of the
+AHJ table. With the index loaded, the AHJs whose AHJName contains the
+searched name are found in memory instead: the lowercased names having
+every trigram of the lowercased search are read from a second set of
+postings, and checked to contain it. The search's AHJs are then ranked by
+how well they match:
+
+- Names are lowercased, punctuation is dropped, and common abbreviations
+  are expanded ("Twp" and "Township" are both "township").
+- An AHJ matches when, for every searched word, at least
+  MIN_NAME_MATCH_SCORE of the word's trigrams are trigrams of its names, so
+  "Cook County" does not match every other county. Whole words and the
+  starts of words score 1, other substrings of three or more characters
+  match, and a typo only loses the trigrams around it.
+- Matches are ranked by the fraction of the trigrams of all the searched
+  words they have, then names starting with the search, then shorter names.
+
+Processes notice changes to the AHJs by comparing the public data version
+(see response_cache.py) with the version the index was loaded at, at most
+once every settings.NAME_INDEX_CHECK_INTERVAL_SECONDS, and reload the index
+in the background. The previous index answers searches until then.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+from .models import AHJ, AHJCensusName
+from .response_cache import get_data_version
+
+MIN_NAME_MATCH_SCORE = 0.5
+
+NAME_ABBREVIATIONS = {
+    'boro': 'borough',
+    'cnty': 'county',
+    'co': 'county',
+    'cty': 'city',
+    'dept': 'department',
+    'ft': 'fort',
+    'hts': 'heights',
+    'jct': 'junction',
+    'lk': 'lake',
+    'mt': 'mount',
+    'mtn': 'mountain',
+    'pk': 'park',
+    'pt': 'point',
+    'spgs': 'springs',
+    'st': 'saint',
+    'twp': 'township',
+    'twsp': 'township',
+    'vlg': 'village'
+}
+
+NON_WORD_CHARACTERS = re.compile(r'[^0-9a-z]+')
+
+
+def get_words(name):
+    return [word for word in NON_WORD_CHARACTERS.split(name.lower().replace('&', ' and ')) if word != '']
+
+
+def normalize_name(name):
+    """
+    Returns the lowercased words of a name with abbreviations expanded.
+    """
+    return [NAME_ABBREVIATIONS.get(word, word) for word in get_words(name)]
+
+
+def get_trigrams(words):
+    """
+    Returns the trigrams of the words, each padded with a space in front,
+    so a search for the start of a word also matches its first trigram.
+    """
+    trigrams = set()
+    for word in words:
+        padded = ' ' + word
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def get_substring_trigrams(string):
+    """
+    Returns the trigrams of a string as it is, which every string containing it also has.
+    """
+    return {string[i:i + 3] for i in range(len(string) - 2)}
+
+
+class NameEntry:
+    """
+    An AHJ held in the index.
+    """
+    __slots__ = ('AHJPK', 'AHJID', 'AHJName', 'StateProvince', 'names', 'words')
+
+    def __init__(self, AHJPK, AHJID, AHJName, StateProvince, names):
+        self.AHJPK = AHJPK
+        self.AHJID = AHJID
+        self.AHJName = AHJName
+        self.StateProvince = StateProvince
+        normalized = [normalize_name(name) for name in names if name]
+        self.names = [' '.join(words) for words in normalized]
+        self.words = {word for words in normalized for word in words}
+
+
+class NameIndex:
+    def __init__(self, entries, version=None):
+        # Entries are ordered the way equal matches are ranked, so the rank of a match is its position
+        self.entries = sorted(entries, key=lambda entry: (len(entry.AHJName), entry.AHJPK))
+        self.version = version
+        self.postings = {}
+        for i, entry in enumerate(self.entries):
+            for trigram in get_trigrams(entry.words):
+                self.postings.setdefault(trigram, []).append(i)
+        # The AHJNames as LIKE compares them, and their trigrams
+        self.lower_names = [(entry.AHJName or '').lower() for entry in self.entries]
+        self.name_postings = {}
+        for i, name in enumerate(self.lower_names):
+            for trigram in get_substring_trigrams(name):
+                self.name_postings.setdefault(trigram, []).append(i)
+        # Single letters have no trigram, so they are found by prefix
+        self.sorted_words = sorted((word, i) for i, entry in enumerate(self.entries) for word in entry.words)
+        self.sorted_names = sorted((name, i) for i, entry in enumerate(self.entries) for name in entry.names)
+
+    @property
+    def size(self):
+        return len(self.entries)
+
+    def get_prefix_matches(self, prefix, sorted_strings=None):
+        """
+        Returns the indices of the entries with a word, or with a name if sorted_strings
+        is self.sorted_names, starting with prefix.
+        """
+        sorted_strings = sorted_strings if sorted_strings is not None else self.sorted_words
+        matches = set()
+        for j in range(bisect.bisect_left(sorted_strings, (prefix,)), len(sorted_strings)):
+            string, i = sorted_strings[j]
+            if not string.startswith(prefix):
+                break
+            matches.add(i)
+        return matches
+
+    def get_word_counts(self, word):
+        """
+        Returns a dict of the index of each entry matching a word to the number
+        of the word's trigrams it has, and the number of trigrams of the word.
+        """
+        trigrams = get_trigrams([word])
+        if len(trigrams) == 0:
+            # Single letters are matched as the start of a word
+            return {i: 1 for i in self.get_prefix_matches(word)}, 1
+        counts = Counter()
+        for trigram in trigrams:
+            counts.update(self.postings.get(trigram, ()))
+        min_count = MIN_NAME_MATCH_SCORE * len(trigrams)
+        return {i: count for i, count in counts.items() if count >= min_count}, len(trigrams)
+
+    def get_word_scores(self, words):
+        """
+        Returns a dict of the index of each entry matching every word to its score.
+        """
+        if len(words) == 0:
+            return {}
+        counts = None
+        total = 0
+        for word in words:
+            word_counts, word_total = self.get_word_counts(word)
+            if counts is None:
+                counts = word_counts
+            else:
+                counts = {i: count + word_counts[i] for i, count in counts.items() if i in word_counts}
+            total += word_total
+        return {i: count / total for i, count in counts.items()}
+
+    def get_scores(self, name):
+        """
+        Returns a dict of the index of each entry matching a name to its score.
+        A word that could be an abbreviation could also be the start of a word
+        being typed, so a name with one is scored both ways.
+        """
+        typed_words = get_words(name)
+        words = normalize_name(name)
+        scores = self.get_word_scores(words)
+        if words != typed_words:
+            for i, score in self.get_word_scores(typed_words).items():
+                scores[i] = max(score, scores.get(i, 0))
+        return scores
+
+    def search(self, name, limit=None):
+        """
+        Returns the entries matching a name, best match first, with their scores.
+        """
+        words = normalize_name(name)
+        if len(words) == 0:
+            return []
+        scores = self.get_scores(name)
+        starts_with = self.get_prefix_matches(' '.join(words), self.sorted_names) | \
+                      self.get_prefix_matches(' '.join(get_words(name)), self.sorted_names)
+
+        def rank(item):
+            i, score = item
+            return -score, i not in starts_with, i
+        items = scores.items()
+        ranked = heapq.nsmallest(limit, items, key=rank) if limit is not None else sorted(items, key=rank)
+        return [(self.entries[i], score) for i, score in ranked]
+
+    def get_ahjpks_containing(self, name):
+        """
+        Returns the AHJPKs of the AHJs whose AHJName contains name, ignoring case,
+        which are the AHJs AHJName LIKE '%name%' matches.
+        """
+        name = name.lower()
+        trigrams = get_substring_trigrams(name)
+        if len(trigrams) == 0:
+            candidates = range(len(self.entries))
+        else:
+            postings = sorted((self.name_postings.get(trigram, ()) for trigram in trigrams), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return {self.entries[i].AHJPK for i in candidates if name in self.lower_names[i]}
+
+
+def get_name_entries():
+    """
+    Reads the names of every AHJ from the database.
+    """
+    census_names = dict(AHJCensusName.objects.values_list('AHJPK', 'AHJCensusName'))
+    return [NameEntry(ahjpk, ahjid, name, state or '', [name, census_names.get(ahjpk)])
+            for ahjpk, ahjid, name, state in AHJ.objects.order_by('AHJPK')
+                                                       .values_list('AHJPK', 'AHJID', 'AHJName', 'AddressID__StateProvince')]
+
+
+_name_index = None
+_checked_at = 0.0
+_loading = False
+_name_index_lock = threading.Lock()
+
+
+def load_name_index():
+    """
+    Builds the name index from the database and makes it the current index.
+    """
+    global _name_index, _checked_at, _loading
+    with _name_index_lock:
+        try:
+            # Read before the rows, so a change made while they are read causes another reload
+            version = get_data_version(is_public_view=True)
+            name_index = NameIndex(get_name_entries(), version=version)
+            _name_index, _checked_at = name_index, time.monotonic()
+        finally:
+            _loading = False
+    return name_index
+
+
+def clear_name_index():
+    global _name_index
+    _name_index = None
+
+
+def load_name_index_in_background():
+    """
+    Loads the name index on a separate thread. Searches use SQL until it is first loaded.
+    """
+    global _loading
+    if _loading:
+        return None
+    _loading = True
+
+    def load():
+        try:
+            load_name_index()
+        finally:
+            connection.close()
+    thread = threading.Thread(target=load, name='load_name_index', daemon=True)
+    thread.start()
+    return thread
+
+
+def get_name_index():
+    """
+    Returns the loaded name index, or None if it is not loaded.
+    Starts reloading it if the registry data changed since it was loaded.
+    """
+    global _checked_at
+    name_index = _name_index
+    if name_index is None:
+        return None
+    if time.monotonic() - _checked_at >= settings.NAME_INDEX_CHECK_INTERVAL_SECONDS:
+        _checked_at = time.monotonic()
+        if get_data_version(is_public_view=True) != name_index.version:
+            load_name_index_in_background()
+    return name_index
+
+
+def start():
+    if settings.NAME_INDEX_ENABLED:
+        load_name_index_in_background()
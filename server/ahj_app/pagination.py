@@ -0,0 +1,139 @@
+"""
+Keyset pagination of the AHJ search endpoints.
+
+LimitOffsetPagination counts every AHJ matching a search and makes the
+database skip the rows before the offset, so reading the last pages of the
+registry costs more than reading the first. In keyset pagination the AHJs
+are ordered by AHJPK, and each page is read starting after the last AHJPK of
+the previous page, given by the opaque cursor in the 'next' link. This makes
+every page cost the same. Clients choose keyset pagination by sending the
+'cursor' query parameter, which is empty for the first page.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db import connection
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .models import AHJ
+from .utils import filter_ahjs, order_ahj_list_name_match
+
+
+def get_approximate_ahj_count():
+    """
+    Returns the number of rows in the AHJ table estimated by MySQL, which
+    unlike COUNT(*) is read without scanning the table.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                       'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [AHJ._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row is not None else None
+
+
+class AHJKeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    count_query_param = 'count'
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    @classmethod
+    def is_requested(cls, request):
+        return cls.cursor_query_param in request.query_params
+
+    def paginate_ahjs(self, get_ahjs, request, is_filtered=True):
+        """
+        Returns a page of AHJs. get_ahjs is called with the after_AHJPK and limit
+        arguments of utils.filter_ahjs and returns the AHJs of the search.
+        If the 'count' query parameter is 'approximate', an estimate of the
+        number of AHJs is given for searches without filters, and null otherwise.
+        """
+        self.request = request
+        self.limit = self.get_limit(request)
+        after_AHJPK = self.decode_cursor(request)
+        # Read one more AHJ than the limit to know if there is a next page
+        ahjs = list(get_ahjs(after_AHJPK=after_AHJPK, limit=self.limit + 1))
+        page = ahjs[:self.limit]
+        self.next_AHJPK = page[-1].AHJPK if len(ahjs) > self.limit else None
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approximate' and not is_filtered:
+            self.count = get_approximate_ahj_count()
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(request.query_params[self.limit_query_param], strict=True, cutoff=self.max_limit)
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def decode_cursor(self, request):
+        """
+        Returns the AHJPK encoded in the cursor, or None for the first page.
+        """
+        encoded = request.query_params.get(self.cursor_query_param, '')
+        if encoded == '':
+            return None
+        try:
+            after_AHJPK = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))['a']
+        except (TypeError, KeyError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(after_AHJPK, int):
+            raise NotFound(self.invalid_cursor_message)
+        return after_AHJPK
+
+    @staticmethod
+    def encode_cursor(after_AHJPK):
+        return base64.urlsafe_b64encode(json.dumps({'a': after_AHJPK}).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if self.next_AHJPK is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param,
+                                   self.encode_cursor(self.next_AHJPK))
+
+    def get_previous_link(self):
+        # Pages are only walked forward
+        return None
+
+
+def is_search_filtered(search):
+    return any(value not in (None, '', []) for value in search.values())
+
+
+def paginate_ahj_search(search, request):
+    """
+    Returns the paginator and the page of AHJs of a search given as the keyword
+    arguments of utils.filter_ahjs. Keyset pagination is used if the request
+    sends a cursor, and LimitOffsetPagination otherwise.
+    With LimitOffsetPagination, a name search without a location or polygon is
+    ranked by name match before it is paginated, so each page continues the
+    ranking of the previous one. Keyset pages stay ordered by AHJPK.
+    """
+    if AHJKeysetPagination.is_requested(request):
+        paginator = AHJKeysetPagination()
+        page = paginator.paginate_ahjs(lambda **keyset: filter_ahjs(**search, **keyset), request,
+                                       is_filtered=is_search_filtered(search))
+    else:
+        paginator = LimitOffsetPagination()
+        ahjs = filter_ahjs(**search)
+        if search.get('AHJName') is not None and search.get('location') is None and search.get('polygon') is None:
+            # The raw query is read whole to be counted, so ranking every AHJ found reads no more rows
+            ahjs = order_ahj_list_name_match(list(ahjs), search['AHJName'])
+        page = paginator.paginate_queryset(ahjs, request)
+    return paginator, page
@@ -0,0 +1,136 @@
+"""
+Simplified copies of polygon geometries at several detail levels.
+
+Census polygons are too detailed to draw on a map, so endpoints returning
+polygons take a detail level: 'none' to leave polygons out, one of the
+simplified levels of DETAIL_TOLERANCES, or 'full' for the original geometry.
+The simplified geometries are stored in the PolygonSimplification table.
+A missing simplification is built and stored the first time it is read, and
+the simplifications of a polygon are deleted when the polygon is saved. The
+rebuild_polygon_simplifications management command builds every one of them.
+"""
+from collections import OrderedDict
+
+from django.contrib.gis.geos import MultiPolygon, Polygon as GEOSPolygon
+from django.db.models.signals import post_save, pre_delete
+
+from .models import Polygon, PolygonSimplification
+
+"""
+Douglas-Peucker tolerance of each simplified level, in degrees
+"""
+DETAIL_TOLERANCES = OrderedDict([
+    ('low', 0.01),
+    ('medium', 0.001),
+    ('high', 0.0001)
+])
+
+DETAIL_LEVELS = ['none'] + list(DETAIL_TOLERANCES) + ['full']
+
+
+def get_detail(value, default):
+    """
+    Returns the detail level given as a request parameter, or the default if it was not given.
+    Raises ValueError if it is not a detail level.
+    """
+    if value is None:
+        return default
+    if value not in DETAIL_LEVELS:
+        raise ValueError('Invalid detail, must be one of: ' + ', '.join(DETAIL_LEVELS))
+    return value
+
+
+def simplify(geometry, tolerance):
+    """
+    Returns a MultiPolygon simplified without self-intersections.
+    The geometry is returned unchanged if simplifying it would leave nothing.
+    """
+    simplified = geometry.simplify(tolerance, preserve_topology=True)
+    if simplified.empty:
+        return geometry
+    if isinstance(simplified, GEOSPolygon):
+        simplified = MultiPolygon(simplified, srid=geometry.srid)
+    return simplified
+
+
+def build_polygon_simplifications(polygons):
+    """
+    Simplifies a list of polygons at every simplified level and stores them.
+    Returns a dict of (PolygonID, detail) to the simplified geometry.
+    """
+    polygons = list(polygons)
+    if len(polygons) == 0:
+        return {}
+    simplifications = [PolygonSimplification(PolygonID_id=polygon.PolygonID, Detail=detail,
+                                             Polygon=simplify(polygon.Polygon, tolerance))
+                       for polygon in polygons for detail, tolerance in DETAIL_TOLERANCES.items()]
+    PolygonSimplification.objects.filter(PolygonID__in=[polygon.PolygonID for polygon in polygons]).delete()
+    # Another request may have stored the same simplifications at the same time
+    PolygonSimplification.objects.bulk_create(simplifications, ignore_conflicts=True)
+    return {(simplification.PolygonID_id, simplification.Detail): simplification.Polygon for simplification in simplifications}
+
+
+def get_simplified_geometries(polygon_ids, detail):
+    """
+    Returns a dict of PolygonID to the geometry of each polygon at a simplified
+    detail level, building the simplifications that are missing.
+    """
+    polygon_ids = set(polygon_ids)
+    geometries = dict(PolygonSimplification.objects.filter(PolygonID__in=polygon_ids, Detail=detail)
+                                                   .values_list('PolygonID', 'Polygon'))
+    missing = polygon_ids - set(geometries)
+    if len(missing) != 0:
+        built = build_polygon_simplifications(Polygon.objects.filter(PolygonID__in=missing))
+        for polygon_id in missing:
+            if (polygon_id, detail) in built:
+                geometries[polygon_id] = built[(polygon_id, detail)]
+    return geometries
+
+
+def attach_simplified_geometries(polygons, detail):
+    """
+    Attaches the simplified geometry of each polygon to it where
+    get_polygon_geometry picks it up, so polygons can be loaded
+    without their full geometry.
+    """
+    polygons = [polygon for polygon in polygons if polygon is not None]
+    geometries = get_simplified_geometries([polygon.PolygonID for polygon in polygons], detail)
+    for polygon in polygons:
+        if not hasattr(polygon, '_simplified_geometries'):
+            polygon._simplified_geometries = {}
+        polygon._simplified_geometries[detail] = geometries.get(polygon.PolygonID)
+
+
+def get_polygon_geometry(polygon, detail):
+    """
+    Returns a polygon's geometry at a detail level other than 'none'.
+    """
+    if detail == 'full':
+        return polygon.Polygon
+    attached = getattr(polygon, '_simplified_geometries', {})
+    if detail not in attached:
+        attach_simplified_geometries([polygon], detail)
+    return polygon._simplified_geometries[detail]
+
+
+def rebuild_polygon_simplifications(chunk_size=100):
+    """
+    Rebuilds the simplifications of every polygon.
+    Returns the number of polygons simplified.
+    """
+    polygon_ids = list(Polygon.objects.order_by('PolygonID').values_list('PolygonID', flat=True))
+    PolygonSimplification.objects.exclude(PolygonID__in=Polygon.objects.values('PolygonID')).delete()
+    for i in range(0, len(polygon_ids), chunk_size):
+        build_polygon_simplifications(Polygon.objects.filter(PolygonID__in=polygon_ids[i:i + chunk_size]))
+    return len(polygon_ids)
+
+
+def delete_polygon_simplifications(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    PolygonSimplification.objects.filter(PolygonID=instance.PolygonID).delete()
+
+
+def connect_signals():
+    post_save.connect(delete_polygon_simplifications, sender=Polygon, dispatch_uid='polygon_simplifications_save')
+    pre_delete.connect(delete_polygon_simplifications, sender=Polygon, dispatch_uid='polygon_simplifications_delete')
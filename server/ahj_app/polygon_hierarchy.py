@@ -0,0 +1,126 @@
+"""
+Precomputed containment of the Census polygons within each other.
+
+filter_ahjs finds the polygons containing a location by testing it against
+every county, city, and county subdivision polygon of the states containing
+it. Which cities and county subdivisions lie within which counties does not
+change between Census uploads, so the PolygonHierarchy table records it:
+
+- Each county is a child of its state.
+- Each city and county subdivision is a child of every county of its state
+  it overlaps, with the fraction of its area inside that county.
+- A city or county subdivision not wholly covered by the counties of its
+  state is also a child of its state, so locations outside every county
+  are still found.
+
+When settings.POLYGON_HIERARCHY_ENABLED is True, a location search finds
+the states containing the location, then the counties of those states
+containing it, and only then tests the children of those counties, instead
+of every polygon of the states. The rebuild_polygon_hierarchy management
+command, which translate_polygons runs after translating polygons, builds
+the table.
+"""
+from django.contrib.gis.geos import Point
+from django.db import transaction
+
+from .models import CityPolygon, CountyPolygon, CountySubdivisionPolygon, PolygonHierarchy, StatePolygon
+
+"""
+The polygon type tables whose polygons are children of the counties
+"""
+COUNTY_CHILD_MODELS = [CityPolygon, CountySubdivisionPolygon]
+
+"""
+A child whose overlap ratios with the counties sum to less than 1 minus this is also a child of its state
+"""
+COUNTY_COVERAGE_TOLERANCE = 1e-6
+
+
+def extents_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def get_overlap_ratio(parent, child):
+    """
+    Returns the fraction of the child geometry's area inside the parent geometry.
+    parent is a (geometry, prepared geometry) pair.
+    """
+    geometry, prepared = parent
+    if child.area == 0:
+        return 1.0 if prepared.intersects(child) else 0.0
+    if prepared.contains(child):
+        return 1.0
+    if not prepared.intersects(child):
+        return 0.0
+    return min(geometry.intersection(child).area / child.area, 1.0)
+
+
+def get_state_polygons(model, state_id):
+    return [(row.PolygonID_id, row.PolygonID.Polygon)
+            for row in model.objects.filter(StatePolygonID=state_id).select_related('PolygonID').only('PolygonID__Polygon', 'StatePolygonID')]
+
+
+def build_state_hierarchy(state_id):
+    """
+    Returns the PolygonHierarchy rows of the polygons of one state.
+    """
+    rows = []
+    state_geometry = StatePolygon.objects.select_related('PolygonID').get(PolygonID=state_id).PolygonID.Polygon
+    state = (state_geometry, state_geometry.prepared)
+    counties = [(polygon_id, geometry, geometry.extent, geometry.prepared)
+                for polygon_id, geometry in get_state_polygons(CountyPolygon, state_id)]
+    for polygon_id, geometry, extent, prepared in counties:
+        rows.append(PolygonHierarchy(ParentPolygonID_id=state_id, ChildPolygonID_id=polygon_id,
+                                     ChildType=CountyPolygon.__name__, OverlapRatio=get_overlap_ratio(state, geometry)))
+    for model in COUNTY_CHILD_MODELS:
+        for polygon_id, geometry in get_state_polygons(model, state_id):
+            extent = geometry.extent
+            covered = 0.0
+            for county_id, county_geometry, county_extent, county_prepared in counties:
+                if not extents_overlap(extent, county_extent):
+                    continue
+                ratio = get_overlap_ratio((county_geometry, county_prepared), geometry)
+                if ratio > 0:
+                    covered += ratio
+                    rows.append(PolygonHierarchy(ParentPolygonID_id=county_id, ChildPolygonID_id=polygon_id,
+                                                 ChildType=model.__name__, OverlapRatio=ratio))
+            if covered < 1 - COUNTY_COVERAGE_TOLERANCE:
+                rows.append(PolygonHierarchy(ParentPolygonID_id=state_id, ChildPolygonID_id=polygon_id,
+                                             ChildType=model.__name__, OverlapRatio=get_overlap_ratio(state, geometry)))
+    return rows
+
+
+def rebuild_polygon_hierarchy(batch_size=1000):
+    """
+    Rebuilds the PolygonHierarchy table from the polygon tables, one state at a time.
+    Returns the number of rows written.
+    The table is replaced in one transaction, so searches read the previous
+    rows until it commits rather than a partly built hierarchy.
+    """
+    count = 0
+    with transaction.atomic():
+        PolygonHierarchy.objects.all().delete()
+        for state_id in StatePolygon.objects.order_by('PolygonID').values_list('PolygonID', flat=True):
+            rows = build_state_hierarchy(state_id)
+            PolygonHierarchy.objects.bulk_create(rows, batch_size=batch_size)
+            count += len(rows)
+    return count
+
+
+def get_polygon_ids_containing(lng, lat):
+    """
+    Returns the PolygonIDs filter_ahjs searches for AHJs located at a point: the states
+    containing it, and the county, city, and county subdivision polygons of those states containing it.
+    """
+    point = Point(lng, lat)
+    state_ids = set(StatePolygon.objects.filter(PolygonID__Polygon__contains=point).values_list('PolygonID', flat=True))
+    if len(state_ids) == 0:
+        return set()
+    children = set(PolygonHierarchy.objects.filter(ParentPolygonID__in=state_ids, ChildPolygonID__Polygon__contains=point)
+                                           .values_list('ChildPolygonID', 'ChildType'))
+    county_ids = {polygon_id for polygon_id, child_type in children if child_type == CountyPolygon.__name__}
+    polygon_ids = state_ids | {polygon_id for polygon_id, child_type in children}
+    if len(county_ids) != 0:
+        polygon_ids.update(PolygonHierarchy.objects.filter(ParentPolygonID__in=county_ids, ChildPolygonID__Polygon__contains=point)
+                                                   .values_list('ChildPolygonID', flat=True))
+    return polygon_ids
@@ -0,0 +1,183 @@
+"""
+Batched loading of the rows serialized under each AHJ.
+
+AHJSerializer reads an AHJ's child rows through the AHJ.get_* methods, which
+query the database once per AHJ per child table. The loader here gathers the
+child rows of a whole page of AHJs with a fixed number of queries, groups them
+by their parent, and attaches them to each instance where the get_* methods
+pick them up (see models.get_prefetched_rows).
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Prefetch, prefetch_related_objects
+
+from .models import AHJInspection, AHJDocumentSubmissionMethodUse, AHJPermitIssueMethodUse, AHJUserMaintains, APIToken, \
+    Comment, Contact, EngineeringReviewRequirement, FeeStructure, Polygon, User
+from .polygon_detail import attach_simplified_geometries
+
+"""
+Related rows serialized under an AHJ and its contacts.
+Enum rows are read from the enum registry, so they are not loaded here.
+"""
+CONTACT_RELATED_FIELDS = ['AddressID__LocationID']
+
+USER_RELATED_FIELDS = ['ContactID__AddressID__LocationID']
+
+AHJ_RELATED_FIELDS = ['AddressID__LocationID']
+
+
+def group_rows_by(rows, field):
+    """
+    Groups rows into a dict of lists keyed by the value of field.
+    The order of the rows within each list is kept.
+    """
+    groups = defaultdict(list)
+    for row in rows:
+        groups[getattr(row, field)].append(row)
+    return groups
+
+
+def attach_child_rows(instances, name, groups):
+    """
+    Attaches each instance's group of rows to it under name.
+    """
+    for instance in instances:
+        if not hasattr(instance, '_prefetched_child_rows'):
+            instance._prefetched_child_rows = {}
+        instance._prefetched_child_rows[name] = groups.get(instance.pk, [])
+
+
+def prefetch_ahj_polygons(ahjs, polygon_detail):
+    """
+    Loads the polygon of each AHJ. Simplified geometries are read instead
+    of the full geometry unless polygon_detail is 'full'.
+    """
+    if polygon_detail == 'none':
+        return
+    if polygon_detail == 'full':
+        prefetch_related_objects(ahjs, 'PolygonID')
+        return
+    prefetch_related_objects(ahjs, Prefetch('PolygonID', queryset=Polygon.objects.defer('Polygon')))
+    attach_simplified_geometries([ahj.PolygonID for ahj in ahjs], polygon_detail)
+
+
+def prefetch_contacts(instances, parent_table):
+    """
+    Attaches the contacts of each instance of parent_table to it.
+    """
+    contacts = Contact.objects.filter(ParentTable=parent_table,
+                                      ParentID__in=[instance.pk for instance in instances]) \
+                              .select_related(*CONTACT_RELATED_FIELDS) \
+                              .order_by('ContactID')
+    attach_child_rows(instances, 'Contacts', group_rows_by(contacts, 'ParentID'))
+
+
+def prefetch_ahj_children(ahjs, is_public_view=False, polygon_detail='full'):
+    """
+    Loads every row serialized by AHJSerializer for a list of AHJs.
+    The number of queries does not depend on the number of AHJs.
+    If is_public_view is True, rows only serialized for the private view are not loaded.
+    Polygons are loaded with their geometry at polygon_detail (see polygon_detail.py).
+    """
+    ahjs = [ahj for ahj in ahjs if ahj is not None]
+    if len(ahjs) == 0:
+        return ahjs
+    ahjpks = [ahj.AHJPK for ahj in ahjs]
+
+    # NOTE: Each child query is ordered the way the per-AHJ query reads its
+    # rows from the index on AHJPK, so grouped rows keep the order the
+    # AHJ.get_* methods return them in.
+
+    prefetch_related_objects(ahjs, *AHJ_RELATED_FIELDS)
+    if not is_public_view:
+        prefetch_ahj_polygons(ahjs, polygon_detail)
+
+    prefetch_contacts(ahjs, 'AHJ')
+
+    inspections = list(AHJInspection.objects.filter(AHJPK__in=ahjpks)
+                                            .order_by('AHJInspectionName', 'InspectionID'))
+    prefetch_contacts(inspections, 'AHJInspection')
+    attach_child_rows(ahjs, 'AHJInspections', group_rows_by(inspections, 'AHJPK_id'))
+
+    dsms = AHJDocumentSubmissionMethodUse.objects.filter(AHJPK__in=ahjpks) \
+                                                 .order_by('DocumentSubmissionMethodID', 'UseID')
+    attach_child_rows(ahjs, 'DocumentSubmissionMethods', group_rows_by(dsms, 'AHJPK_id'))
+
+    pims = AHJPermitIssueMethodUse.objects.filter(AHJPK__in=ahjpks) \
+                                          .order_by('PermitIssueMethodID', 'UseID')
+    attach_child_rows(ahjs, 'PermitIssueMethods', group_rows_by(pims, 'AHJPK_id'))
+
+    errs = EngineeringReviewRequirement.objects.filter(AHJPK__in=ahjpks) \
+                                               .order_by('EngineeringReviewRequirementID')
+    attach_child_rows(ahjs, 'EngineeringReviewRequirements', group_rows_by(errs, 'AHJPK_id'))
+
+    fee_structures = FeeStructure.objects.filter(AHJPK__in=ahjpks) \
+                                         .order_by('FeeStructurePK')
+    attach_child_rows(ahjs, 'FeeStructures', group_rows_by(fee_structures, 'AHJPK_id'))
+
+    if not is_public_view:
+        comments = list(Comment.objects.filter(AHJPK__in=ahjpks).order_by('-Date'))
+        prefetch_comment_threads(comments)
+        attach_child_rows(ahjs, 'Comments', group_rows_by(comments, 'AHJPK'))
+
+    return ahjs
+
+
+def prefetch_comment_users(comments):
+    """
+    Attaches to each comment its user, with the rows UserSerializer reads.
+    """
+    user_ids = {comment.UserID_id for comment in comments}
+    if len(user_ids) == 0:
+        return
+    users = {user.UserID: user for user in User.objects.filter(UserID__in=user_ids).select_related(*USER_RELATED_FIELDS)}
+    maintains = AHJUserMaintains.objects.filter(UserID__in=user_ids, MaintainerStatus=True).order_by('MaintainerID')
+    attach_child_rows(users.values(), 'MaintainedAHJs', group_rows_by(maintains, 'UserID_id'))
+    api_tokens = APIToken.objects.filter(user__in=user_ids).order_by('pk')
+    attach_child_rows(users.values(), 'APITokens', group_rows_by(api_tokens, 'user_id'))
+    for comment in comments:
+        if comment.UserID_id in users:
+            comment.UserID = users[comment.UserID_id]
+
+
+def attach_reply_counts(comments, counts):
+    for comment in comments:
+        if not hasattr(comment, '_prefetched_child_rows'):
+            comment._prefetched_child_rows = {}
+        comment._prefetched_child_rows['ReplyCount'] = counts.get(comment.CommentID, 0)
+
+
+def prefetch_comment_threads(comments, max_depth=None, max_replies=None):
+    """
+    Loads the replies of a list of comments down to max_depth levels of replies
+    with one query per level, and attaches them with their reply counts and users.
+    At most the newest max_replies replies of a comment are attached. The replies
+    that are not attached are counted by the comment's ReplyCount, so clients
+    can page through them with the comment replies endpoint.
+    """
+    max_depth = max_depth if max_depth is not None else settings.COMMENT_THREAD_MAX_DEPTH
+    max_replies = max_replies if max_replies is not None else settings.COMMENT_THREAD_MAX_REPLIES
+    loaded = list(comments)
+    level = loaded
+    depth = 0
+    while len(level) != 0:
+        comment_ids = [comment.CommentID for comment in level]
+        if depth == max_depth:
+            # Only count the replies below the deepest loaded level
+            counts = dict(Comment.objects.filter(ReplyingTo__in=comment_ids)
+                                         .values('ReplyingTo')
+                                         .annotate(count=Count('CommentID'))
+                                         .values_list('ReplyingTo', 'count'))
+            attach_child_rows(level, 'Replies', {})
+            attach_reply_counts(level, counts)
+            break
+        replies = group_rows_by(Comment.objects.filter(ReplyingTo__in=comment_ids).order_by('-Date', '-CommentID'), 'ReplyingTo')
+        attach_reply_counts(level, {comment_id: len(rows) for comment_id, rows in replies.items()})
+        replies = {comment_id: rows[:max_replies] for comment_id, rows in replies.items()}
+        attach_child_rows(level, 'Replies', replies)
+        level = [reply for comment in level for reply in replies.get(comment.CommentID, [])]
+        loaded.extend(level)
+        depth += 1
+    prefetch_comment_users(loaded)
+    return loaded
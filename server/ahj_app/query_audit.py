@@ -0,0 +1,127 @@
+"""
+Query plans and timings of the queries the search and edit endpoints run most.
+
+get_hot_queries builds one query of each shape with sample values, and
+audit_queries runs EXPLAIN on each and reports the tables it reads with a
+full table or index scan. The audit_query_plans management command prints
+the report, and can save the timings of a run to compare them with a later
+one, such as before and after migrating a new index.
+"""
+import datetime
+import time
+from collections import OrderedDict
+
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.utils import timezone
+
+from .models import AHJDocumentSubmissionMethodUse, AHJInspection, AHJPermitIssueMethodUse, AHJUserMaintains, \
+    Address, CityPolygon, Comment, Contact, CountyPolygon, CountySubdivisionPolygon, Edit, EngineeringReviewRequirement, \
+    FeeStructure, GeocodeJob, GeoGridCell, PolygonHierarchy
+from .utils import filter_ahjs, get_str_location
+from .views_edits import get_edits_effective_on
+
+"""
+EXPLAIN access types that read every row of a table or index
+"""
+FULL_SCAN_TYPES = ('ALL', 'index')
+
+SAMPLE_AHJPKS = [1, 2, 3]
+
+
+def get_queryset_sql(queryset):
+    return queryset.query.sql_with_params()
+
+
+def get_raw_sql(raw_queryset):
+    return raw_queryset.raw_query, raw_queryset.params
+
+
+def get_hot_queries():
+    """
+    Returns an OrderedDict of the name of each query shape to its (sql, params).
+    """
+    location = get_str_location({'Latitude': {'Value': 40.7608}, 'Longitude': {'Value': -111.891}})
+    now = timezone.now()
+    return OrderedDict([
+        ('filter_ahjs AHJName', get_raw_sql(filter_ahjs(AHJName='Salt Lake'))),
+        ('filter_ahjs StateProvince', get_raw_sql(filter_ahjs(StateProvince='UT'))),
+        ('filter_ahjs AHJCode', get_raw_sql(filter_ahjs(AHJCode='UT-4967000'))),
+        ('filter_ahjs location', get_raw_sql(filter_ahjs(location=location))),
+        ('filter_ahjs page', get_raw_sql(filter_ahjs(after_AHJPK=0, limit=20))),
+        ('AHJ contacts', get_queryset_sql(Contact.objects.filter(ParentTable='AHJ', ParentID__in=SAMPLE_AHJPKS).order_by('ContactID'))),
+        ('AHJ inspections', get_queryset_sql(AHJInspection.objects.filter(AHJPK__in=SAMPLE_AHJPKS).order_by('AHJInspectionName', 'InspectionID'))),
+        ('AHJ document submission methods', get_queryset_sql(AHJDocumentSubmissionMethodUse.objects.filter(AHJPK__in=SAMPLE_AHJPKS)
+                                                                                                   .order_by('DocumentSubmissionMethodID', 'UseID'))),
+        ('AHJ permit issue methods', get_queryset_sql(AHJPermitIssueMethodUse.objects.filter(AHJPK__in=SAMPLE_AHJPKS)
+                                                                                     .order_by('PermitIssueMethodID', 'UseID'))),
+        ('AHJ engineering review requirements', get_queryset_sql(EngineeringReviewRequirement.objects.filter(AHJPK__in=SAMPLE_AHJPKS)
+                                                                                                      .order_by('EngineeringReviewRequirementID'))),
+        ('AHJ fee structures', get_queryset_sql(FeeStructure.objects.filter(AHJPK__in=SAMPLE_AHJPKS).order_by('FeeStructurePK'))),
+        ('AHJ comments', get_queryset_sql(Comment.objects.filter(AHJPK__in=SAMPLE_AHJPKS).order_by('-Date'))),
+        ('comment replies', get_queryset_sql(Comment.objects.filter(ReplyingTo__in=SAMPLE_AHJPKS).order_by('-Date', '-CommentID'))),
+        ('AHJ maintainers', get_queryset_sql(AHJUserMaintains.objects.filter(AHJPK__in=SAMPLE_AHJPKS, MaintainerStatus=True))),
+        ('user maintained AHJs', get_queryset_sql(AHJUserMaintains.objects.filter(UserID__in=SAMPLE_AHJPKS, MaintainerStatus=True)
+                                                                          .order_by('MaintainerID'))),
+        ('edits of AHJ', get_queryset_sql(Edit.objects.filter(AHJPK=SAMPLE_AHJPKS[0]))),
+        ('edits effective today', get_queryset_sql(get_edits_effective_on(datetime.date.today(), 'A'))),
+        ('edit is latest applied', get_queryset_sql(Edit.objects.filter(SourceTable='AHJ', SourceRow=SAMPLE_AHJPKS[0], SourceColumn='AHJName',
+                                                                        ReviewStatus='A', DateEffective__gt=now)[:1])),
+        ('county polygons of state', get_queryset_sql(CountyPolygon.objects.filter(StatePolygonID=SAMPLE_AHJPKS[0]))),
+        ('city polygons of state', get_queryset_sql(CityPolygon.objects.filter(StatePolygonID=SAMPLE_AHJPKS[0]))),
+        ('county subdivision polygons of state', get_queryset_sql(CountySubdivisionPolygon.objects.filter(StatePolygonID=SAMPLE_AHJPKS[0]))),
+        ('polygon hierarchy children containing location', get_queryset_sql(
+            PolygonHierarchy.objects.filter(ParentPolygonID__in=SAMPLE_AHJPKS, ChildPolygonID__Polygon__contains=Point(-111.891, 40.7608))
+                                    .values_list('ChildPolygonID', 'ChildType'))),
+        ('geo grid cell of location', get_queryset_sql(
+            GeoGridCell.objects.filter(Geohash='9x0rv').values_list('PolygonID', 'StatePolygonID', 'IsCovered'))),
+        ('addresses of state', get_queryset_sql(Address.objects.filter(StateProvince='UT'))),
+        ('due geocode jobs', get_queryset_sql(GeocodeJob.objects.filter(NextAttempt__lte=now).order_by('NextAttempt')[:100]))
+    ])
+
+
+def explain(sql, params):
+    """
+    Returns the rows of the EXPLAIN of a query as dicts.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def get_full_scans(plan):
+    """
+    Returns the rows of an EXPLAIN that scan a whole table or index.
+    Derived tables and unions built by the query itself are not counted.
+    """
+    return [row for row in plan
+            if row.get('type') in FULL_SCAN_TYPES and row.get('table') is not None and not row['table'].startswith('<')]
+
+
+def time_query(sql, params, repeat):
+    """
+    Returns the mean seconds taken to run a query and fetch its rows.
+    """
+    start = time.monotonic()
+    with connection.cursor() as cursor:
+        for i in range(repeat):
+            cursor.execute(sql, params)
+            cursor.fetchall()
+    return (time.monotonic() - start) / repeat
+
+
+def audit_queries(repeat=0):
+    """
+    Returns a list of a dict of the 'name', 'full_scans', and mean 'seconds' of each hot query.
+    The queries are only timed if repeat is positive.
+    """
+    results = []
+    for name, (sql, params) in get_hot_queries().items():
+        plan = explain(sql, params)
+        results.append({
+            'name': name,
+            'full_scans': [{'table': row['table'], 'type': row['type'], 'rows': row.get('rows')} for row in get_full_scans(plan)],
+            'seconds': time_query(sql, params, repeat) if repeat > 0 else None
+        })
+    return results
@@ -0,0 +1,159 @@
+"""
+Cache of the responses of the AHJ search endpoints.
+
+When settings.AHJ_RESPONSE_CACHE_ENABLED is True, the views decorated with
+cache_ahj_response store the data of their successful responses in the
+'ahj_responses' cache of settings.CACHES, keyed on the endpoint, the
+normalized query parameters and request body, the serializer context
+(is_public_view), and the registry data version, as well as the data version
+the name index (see name_index.py) was loaded at. The cache backend is set in
+settings, so the responses can be kept in process memory, in files, or on a
+Redis server shared by every process.
+
+The data version is a counter in the RegistryDataVersion table incremented
+by documents.invalidate_ahj_documents, which every change to a row
+serialized under an AHJ calls. Incrementing it makes every cached response
+unreachable, and they expire from the cache on their own. Responses of the
+public view are keyed on a separate public data version, which is only
+incremented when a row in the public view changes, so changes to comments
+and users do not drop them.
+
+The key is also sent as the response's ETag, so a client sending it back in
+If-None-Match is answered 304 Not Modified without the search being run.
+
+The headers in CACHED_HEADERS, such as the X-AHJ-Geo-Lookup header telling
+how ahj_geo_location found the polygons containing the location, are cached
+with the data.
+"""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.db.utils import IntegrityError
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import RegistryDataVersion
+
+RESPONSE_CACHE_ALIAS = 'ahj_responses'
+
+DATA_VERSION_ID = 1
+
+PUBLIC_DATA_VERSION_ID = 2
+
+"""
+Incremented when polygons change, so processes reload their spatial index (see spatial_index.py)
+"""
+POLYGON_VERSION_ID = 3
+
+GEO_LOOKUP_HEADER = 'X-AHJ-Geo-Lookup'
+
+CACHED_HEADERS = (GEO_LOOKUP_HEADER,)
+
+"""
+Incremented when the format of the cached entries changes, so older entries are not read
+"""
+CACHE_ENTRY_FORMAT = 2
+
+
+def get_data_version(is_public_view=False):
+    """
+    Returns the data version, or the public data version if is_public_view is True.
+    """
+    return get_version(PUBLIC_DATA_VERSION_ID if is_public_view else DATA_VERSION_ID)
+
+
+def get_version(version_id):
+    version = RegistryDataVersion.objects.filter(VersionID=version_id).values_list('Version', flat=True).first()
+    return version if version is not None else 0
+
+
+def increment_version(version_id):
+    now = timezone.now()
+    if RegistryDataVersion.objects.filter(VersionID=version_id).update(Version=F('Version') + 1, Updated=now) != 0:
+        return
+    try:
+        with transaction.atomic():
+            RegistryDataVersion.objects.create(VersionID=version_id, Version=1, Updated=now)
+    except IntegrityError:
+        # Another process created the row at the same time
+        RegistryDataVersion.objects.filter(VersionID=version_id).update(Version=F('Version') + 1, Updated=now)
+
+
+def increment_data_version(public=True):
+    """
+    Increments the data version, and the public data version if public is True.
+    """
+    increment_version(DATA_VERSION_ID)
+    if public:
+        increment_version(PUBLIC_DATA_VERSION_ID)
+
+
+def bump_data_version(public=True):
+    """
+    Increments the data version once the current transaction commits,
+    so the row is not locked while the rest of the transaction runs.
+    """
+    transaction.on_commit(functools.partial(increment_data_version, public=public))
+
+
+def normalize_params(params):
+    """
+    Returns query parameters or form data as a sorted list of (name, values).
+    Other request bodies are returned as they are.
+    """
+    if hasattr(params, 'lists'):
+        return sorted((name, sorted(values)) for name, values in params.lists())
+    return params
+
+
+def get_response_cache_key(request, view_name, is_public_view, data_version):
+    # NOTE: Imported here because the name index reads the data version from this module
+    from .name_index import get_name_index
+    # Name searches are answered by the name index, which is reloaded some time after the data changes
+    name_index = get_name_index()
+    key_data = [view_name, request.method, request.build_absolute_uri(request.path),
+                normalize_params(request.query_params), normalize_params(request.data),
+                is_public_view, data_version, name_index.version if name_index is not None else None, CACHE_ENTRY_FORMAT]
+    key_json = json.dumps(key_data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(key_json.encode()).hexdigest()
+
+
+def cache_ahj_response(is_public_view):
+    """
+    Decorator caching the 200 responses of a search view. It is applied below
+    the api_view decorators, so requests are authenticated before reaching it.
+    Responses must not depend on the user making the request.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def cached_view(request, *args, **kwargs):
+            if not settings.AHJ_RESPONSE_CACHE_ENABLED:
+                return view(request, *args, **kwargs)
+            key = get_response_cache_key(request, view.__name__, is_public_view, get_data_version(is_public_view))
+            etag = quote_etag(key)
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+            if if_none_match is not None:
+                etags = parse_etags(if_none_match)
+                if etag in etags or '*' in etags:
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            cache = caches[RESPONSE_CACHE_ALIAS]
+            entry = cache.get(key)
+            if entry is not None:
+                response = Response(entry['data'], status=status.HTTP_200_OK, headers=entry['headers'])
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK or not isinstance(response, Response):
+                    return response
+                headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+                cache.set(key, {'data': response.data, 'headers': headers}, settings.AHJ_RESPONSE_CACHE_TIMEOUT_SECONDS)
+            response['ETag'] = etag
+            return response
+        return cached_view
+    return decorator
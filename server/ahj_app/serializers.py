@@ -1,4 +1,5 @@
 from collections import OrderedDict
+import copy
 
 from djoser.compat import get_user_email, get_user_email_field_name
 from django.conf import settings
@@ -7,6 +8,9 @@ from rest_framework import serializers
 from rest_framework_gis import serializers as geo_serializers
 from djoser.serializers import UserCreateSerializer
 from .models import *
+from . import enum_registry
+from .polygon_detail import get_polygon_geometry
+from .prefetch import prefetch_ahj_children
 
 
 class PolygonSerializer(geo_serializers.GeoFeatureModelSerializer):
@@ -26,6 +30,17 @@ class PolygonSerializer(geo_serializers.GeoFeatureModelSerializer):
     def get_AHJID(self, instance):
         return self.context.get('AHJID', '')
 
+    def to_representation(self, instance):
+        """
+        Serializes the geometry at the 'polygon_detail' level of the context (see polygon_detail.py).
+        The geometry is null if the level is 'none'.
+        """
+        detail = self.context.get('polygon_detail', 'full')
+        if detail != 'full':
+            instance = copy.copy(instance)
+            instance.Polygon = get_polygon_geometry(instance, detail) if detail != 'none' else None
+        return super().to_representation(instance)
+
 
 class OrangeButtonSerializer(serializers.Field):
     """
@@ -61,7 +76,12 @@ class EnumModelSerializer(serializers.Serializer):
     Value = serializers.CharField()
 
     def get_attribute(self, instance):
-        attribute = super().get_attribute(instance)
+        # Read the enum row from the enum registry instead of querying it
+        field = instance._meta.get_field(self.source)
+        enum_pk = getattr(instance, field.attname)
+        attribute = enum_registry.get_row_by_pk(field.related_model.__name__, enum_pk)
+        if attribute is None and enum_pk is not None:
+            attribute = super().get_attribute(instance)
         if attribute is None:
             return {'Value': ''}
         else:
@@ -278,12 +298,15 @@ class UserCreateSerializer(UserCreateSerializer):
 class CommentSerializer(serializers.Serializer):
     """
     Serializes Comment to OrderedDict.
+    ReplyCount can be greater than the number of Replies
+    when the replies were loaded with a size limit.
     """
     CommentID = OrangeButtonSerializer()
     User = UserSerializer(source='UserID')
     CommentText = OrangeButtonSerializer()
     Date = OrangeButtonSerializer()
     Replies = RecursiveField(source='get_replies', many=True)
+    ReplyCount = serializers.IntegerField(source='get_reply_count')
 
 
 class DocumentSubmissionMethodUseSerializer(serializers.Serializer):
@@ -369,6 +392,17 @@ class EngineeringReviewRequirementSerializer(serializers.Serializer):
         return super().to_representation(err)
 
 
+class AHJListSerializer(serializers.ListSerializer):
+    """
+    Serializes a list of AHJs, loading the child rows
+    of every AHJ in the list with batched queries.
+    """
+    def to_representation(self, data):
+        ahjs = prefetch_ahj_children(data, is_public_view=self.context.get('is_public_view', False),
+                                     polygon_detail=self.context.get('polygon_detail', 'full'))
+        return super().to_representation(ahjs)
+
+
 class AHJSerializer(serializers.Serializer):
     """
     Serializes Orange Button AHJ object
@@ -410,6 +444,9 @@ class AHJSerializer(serializers.Serializer):
     FeeStructures = FeeStructureSerializer(source='get_fee_structures', many=True)
     UnconfirmedFeeStructures = FeeStructureSerializer(source='get_uncon_fs', many=True)
 
+    class Meta:
+        list_serializer_class = AHJListSerializer
+
     def to_representation(self, ahj):
         """
         Returns an OrderedDict representing an AHJ object
@@ -421,15 +458,20 @@ class AHJSerializer(serializers.Serializer):
             for field in AHJ.SERIALIZER_EXCLUDED_FIELDS:
                 if field in self.fields:
                     self.fields.pop(field)
+        if not hasattr(ahj, '_prefetched_child_rows'):
+            prefetch_ahj_children([ahj], is_public_view=self.context.get('is_public_view', False),
+                                  polygon_detail=self.context.get('polygon_detail', 'full'))
         return super().to_representation(ahj)
 
     def get_Polygon(self, instance):
         """
         Helper method to serialize the polygon associated with an AHJ
+        at the 'polygon_detail' level of the context, or None if it is 'none'
         """
-        if instance.PolygonID is None:
+        detail = self.context.get('polygon_detail', 'full')
+        if instance.PolygonID_id is None or detail == 'none':
             return None
-        return PolygonSerializer(instance.PolygonID, context={'AHJID': instance.AHJID}).data
+        return PolygonSerializer(instance.PolygonID, context={'AHJID': instance.AHJID, 'polygon_detail': detail}).data
 
 
 class EditSerializer(serializers.Serializer):
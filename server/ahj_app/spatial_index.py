@@ -0,0 +1,258 @@
+"""
+In-process spatial index of the jurisdiction polygons.
+
+filter_ahjs finds the polygons containing a location with ST_CONTAINS
+subqueries over every polygon table. When the index is loaded (see
+settings.SPATIAL_INDEX_ENABLED), the polygons are held in memory in a
+Sort-Tile-Recursive packed R-tree over their extents, and candidates are
+tested with GEOS prepared geometries, so a lookup never touches the database.
+
+Polygon saves and deletes, and translate_polygons, increment the polygon
+version (see response_cache.py). Processes compare it with the version their
+index was loaded at, at most once every
+settings.SPATIAL_INDEX_CHECK_INTERVAL_SECONDS, and reload the index in the
+background. The previous index answers lookups until then.
+
+A prepared geometry builds its internal indexes the first time it is
+tested, and GEOS does not make that safe for threads testing it at once, so
+each polygon's tests hold the polygon's lock.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import Polygon, StatePolygon, CountyPolygon, CityPolygon, CountySubdivisionPolygon
+from .response_cache import POLYGON_VERSION_ID, get_version, increment_version
+
+STR_TREE_NODE_CAPACITY = 10
+
+
+class IndexedPolygon:
+    """
+    A polygon held in the index.
+    StatePolygonID is None for state polygons.
+    """
+    __slots__ = ('PolygonID', 'StatePolygonID', 'extent', 'prepared', 'lock')
+
+    def __init__(self, PolygonID, StatePolygonID, geometry):
+        self.PolygonID = PolygonID
+        self.StatePolygonID = StatePolygonID
+        self.extent = geometry.extent
+        self.prepared = geometry.prepared
+        self.lock = threading.Lock()
+
+    def contains(self, point):
+        with self.lock:
+            return self.prepared.contains(point)
+
+
+class STRtree:
+    """
+    Static R-tree bulk loaded with the Sort-Tile-Recursive algorithm.
+    Nodes are tuples of (xmin, ymin, xmax, ymax, children), where
+    the children of leaf nodes are the indexed items.
+    """
+    def __init__(self, items, node_capacity=STR_TREE_NODE_CAPACITY):
+        """
+        items is a list of (extent, item) pairs, where extent is (xmin, ymin, xmax, ymax).
+        """
+        self.node_capacity = node_capacity
+        self.size = len(items)
+        level = [(*extent, item) for extent, item in items]
+        self.height = 0
+        while len(level) > node_capacity:
+            level = self.pack(level)
+            self.height += 1
+        self.root = level
+
+    def pack(self, entries):
+        """
+        Groups one level of entries into parent nodes of at most node_capacity entries.
+        Entries are sorted into vertical slices by the x of their center, and
+        each slice is sorted by the y of their center before it is tiled.
+        """
+        num_nodes = math.ceil(len(entries) / self.node_capacity)
+        slice_size = math.ceil(math.sqrt(num_nodes)) * self.node_capacity
+        entries = sorted(entries, key=lambda e: e[0] + e[2])
+        nodes = []
+        for i in range(0, len(entries), slice_size):
+            vertical_slice = sorted(entries[i:i + slice_size], key=lambda e: e[1] + e[3])
+            for j in range(0, len(vertical_slice), self.node_capacity):
+                children = vertical_slice[j:j + self.node_capacity]
+                nodes.append((min(c[0] for c in children),
+                              min(c[1] for c in children),
+                              max(c[2] for c in children),
+                              max(c[3] for c in children),
+                              children))
+        return nodes
+
+    def query_point(self, x, y):
+        """
+        Returns the items whose extent contains the point (x, y).
+        """
+        results = []
+        stack = [(self.root, self.height)]
+        while stack:
+            entries, height = stack.pop()
+            for xmin, ymin, xmax, ymax, child in entries:
+                if xmin <= x <= xmax and ymin <= y <= ymax:
+                    if height == 0:
+                        results.append(child)
+                    else:
+                        stack.append((child, height - 1))
+        return results
+
+
+class PolygonIndex:
+    """
+    Answers which polygons contain a point the same way filter_ahjs does:
+    the state polygons containing the point, plus the county, city and
+    county subdivision polygons of those states containing the point.
+    """
+    def __init__(self, polygons, version=None):
+        self.tree = STRtree([(polygon.extent, polygon) for polygon in polygons])
+        self.version = version
+
+    @property
+    def size(self):
+        return self.tree.size
+
+    def polygons_containing(self, lng, lat):
+        point = Point(lng, lat)
+        return [polygon for polygon in self.tree.query_point(lng, lat) if polygon.contains(point)]
+
+    def get_polygon_ids_containing(self, lng, lat):
+        return get_polygon_ids_in_containing_states([(polygon.PolygonID, polygon.StatePolygonID)
+                                                     for polygon in self.polygons_containing(lng, lat)])
+
+
+def get_polygon_ids_in_containing_states(containing):
+    """
+    Given the (PolygonID, StatePolygonID) pairs of the polygons containing a point,
+    where StatePolygonID is None for state polygons, returns the PolygonIDs
+    of the states and the polygons within those states.
+    """
+    state_ids = {polygon_id for polygon_id, state_id in containing if state_id is None}
+    return {polygon_id for polygon_id, state_id in containing
+            if state_id is None or state_id in state_ids}
+
+
+def get_indexed_polygons():
+    """
+    Reads every polygon of the polygon type tables from the database.
+    """
+    polygons = []
+    for state in StatePolygon.objects.select_related('PolygonID').only('PolygonID__Polygon'):
+        polygons.append(IndexedPolygon(state.PolygonID_id, None, state.PolygonID.Polygon))
+    for model in [CountyPolygon, CityPolygon, CountySubdivisionPolygon]:
+        for row in model.objects.select_related('PolygonID').only('PolygonID__Polygon', 'StatePolygonID'):
+            polygons.append(IndexedPolygon(row.PolygonID_id, row.StatePolygonID_id, row.PolygonID.Polygon))
+    return polygons
+
+
+def get_polygon_version():
+    return get_version(POLYGON_VERSION_ID)
+
+
+def bump_polygon_version():
+    """
+    Increments the polygon version once the current transaction commits.
+    """
+    transaction.on_commit(lambda: increment_version(POLYGON_VERSION_ID))
+
+
+_polygon_index = None
+_checked_at = 0.0
+_loading = False
+_polygon_index_lock = threading.Lock()
+
+
+def get_polygon_index():
+    """
+    Returns the loaded polygon index, or None if it is not loaded.
+    Starts reloading it if the polygons changed since it was loaded.
+    """
+    global _checked_at
+    polygon_index = _polygon_index
+    if polygon_index is None:
+        return None
+    if time.monotonic() - _checked_at >= settings.SPATIAL_INDEX_CHECK_INTERVAL_SECONDS:
+        _checked_at = time.monotonic()
+        if get_polygon_version() != polygon_index.version:
+            load_polygon_index_in_background()
+    return polygon_index
+
+
+def load_polygon_index():
+    """
+    Builds the polygon index from the database and makes it the current index.
+    The previous index keeps answering lookups until the new one is built.
+    """
+    global _polygon_index, _checked_at, _loading
+    with _polygon_index_lock:
+        try:
+            # Read before the polygons, so a change made while they are read causes another reload
+            version = get_polygon_version()
+            polygon_index = PolygonIndex(get_indexed_polygons(), version=version)
+            _polygon_index, _checked_at = polygon_index, time.monotonic()
+        finally:
+            _loading = False
+    return polygon_index
+
+
+def clear_polygon_index():
+    global _polygon_index
+    _polygon_index = None
+
+
+def load_polygon_index_in_background():
+    """
+    Loads the polygon index on a separate thread so starting a worker is not blocked.
+    Lookups use SQL until the index is first loaded.
+    """
+    global _loading
+    if _loading:
+        return None
+    _loading = True
+
+    def load():
+        try:
+            load_polygon_index()
+        finally:
+            connection.close()
+    thread = threading.Thread(target=load, name='load_polygon_index', daemon=True)
+    thread.start()
+    return thread
+
+
+def bump_polygon_version_on_change(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    bump_polygon_version()
+
+
+def connect_signals():
+    """
+    Connects the receivers incrementing the polygon version, if the spatial index is enabled.
+    """
+    if not settings.SPATIAL_INDEX_ENABLED:
+        return
+    for model in [Polygon, StatePolygon, CountyPolygon, CityPolygon, CountySubdivisionPolygon]:
+        post_save.connect(bump_polygon_version_on_change, sender=model, dispatch_uid=f'spatial_index_{model.__name__}_save')
+        post_delete.connect(bump_polygon_version_on_change, sender=model, dispatch_uid=f'spatial_index_{model.__name__}_delete')
+
+
+def disconnect_signals():
+    for model in [Polygon, StatePolygon, CountyPolygon, CityPolygon, CountySubdivisionPolygon]:
+        post_save.disconnect(sender=model, dispatch_uid=f'spatial_index_{model.__name__}_save')
+        post_delete.disconnect(sender=model, dispatch_uid=f'spatial_index_{model.__name__}_delete')
+
+
+def start():
+    if settings.SPATIAL_INDEX_ENABLED:
+        load_polygon_index_in_background()
@@ -23,14 +23,17 @@ apiTokenUrls = [
 
 noAuthTokenUrls = [
     ('ahj-private', {}),
+    ('ahj-autocomplete', {}),
     ('single_ahj', {}),
     ('edit-list', {}),
     ('user-edits', {}),
     ('user-comments', {}),
+    ('comment-replies', {}),
     ('single-user-info', {'username': 'test'}),
     ('form-validator', {}),
     ('data-map', {}),
     ('data-map-polygon', {}),
+    ('vector-tile', {'z': 0, 'x': 0, 'y': 0}),
     ('send-support-email', {}),
     ('form-validator', {})
 ]
@@ -4,6 +4,7 @@ from django.contrib.gis.db import models
 from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
 from django.contrib.gis.geos import Polygon as geosPolygon
 from ahj_app.models import WebpageToken, APIToken, User, Contact, Address, AHJ, AHJUserMaintains, Polygon
+from ahj_app import documents, enum_registry
 from rest_framework.test import APIClient
 from constants import webpageTokenUrls, apiTokenUrls
 import datetime
@@ -13,6 +14,25 @@ import string
 import uuid
 
 
+@pytest.fixture(autouse=True)
+def clear_enum_registry():
+    """
+    Enum rows created by a test are rolled back without clearing the enum registry.
+    """
+    enum_registry.clear()
+    yield
+    enum_registry.clear()
+
+@pytest.fixture
+def document_signals(settings):
+    """
+    Connects the receivers invalidating documents, which are only connected at startup if enabled.
+    """
+    settings.AHJ_DOCUMENTS_ENABLED = True
+    documents.connect_signals()
+    yield
+    documents.disconnect_signals()
+
 @pytest.fixture
 def api_client():
     return APIClient()
@@ -292,6 +292,47 @@ def test_ahj_list__multiple_search_params_one_ahj(url_name, list_of_ahjs, client
     assert response.data['count'] == 1
     assert ahjs[0]['AHJCode']['Value'] == ahj4.AHJCode
 
+@pytest.mark.parametrize(
+   'url_name', [
+       ('ahj-private'),
+       ('ahj-public')
+   ])
+@pytest.mark.django_db
+def test_ahj_list__cursor_pagination_walks_all_ahjs(url_name, list_of_ahjs, client_with_credentials):
+    url = reverse(url_name) + '?cursor=&limit=2'
+    ahj_codes = []
+    while url is not None:
+        response = client_with_credentials.post(url)
+        assert response.status_code == 200
+        ahj_codes.extend(ahj['AHJCode']['Value'] for ahj in get_ahjs_from_response(response, url_name))
+        url = response.data['next']
+    assert ahj_codes == [ahj.AHJCode for ahj in list_of_ahjs] # Ordered by AHJPK
+
+@pytest.mark.parametrize(
+   'url_name, payload', [
+       ('ahj-private', {'AHJName': 'Orange'}),
+       ('ahj-public', {'AHJName': { 'Value': 'Orange'}})
+   ])
+@pytest.mark.django_db
+def test_ahj_list__cursor_pagination_with_search(url_name, payload, list_of_ahjs, client_with_credentials):
+    ahj1, ahj2, ahj3, ahj4, ahj5 = list_of_ahjs
+    response = client_with_credentials.post(reverse(url_name) + '?cursor=&limit=1&count=approximate', payload, format='json')
+    assert response.data['count'] is None # Only unfiltered searches are counted
+    assert get_ahjs_from_response(response, url_name)[0]['AHJCode']['Value'] == ahj2.AHJCode
+    response = client_with_credentials.post(response.data['next'], payload, format='json')
+    assert get_ahjs_from_response(response, url_name)[0]['AHJCode']['Value'] == ahj3.AHJCode
+    assert response.data['next'] is None
+
+@pytest.mark.parametrize(
+   'url_name', [
+       ('ahj-private'),
+       ('ahj-public')
+   ])
+@pytest.mark.django_db
+def test_ahj_list__invalid_cursor(url_name, list_of_ahjs, client_with_credentials):
+    response = client_with_credentials.post(reverse(url_name) + '?cursor=notacursor')
+    assert response.status_code == 404
+
 """
     Only Private AHJ Search Tests
 """
@@ -459,6 +500,51 @@ def test_ahj_geo_location__search_array_has_ahj(list_of_ahjs, client_with_creden
     assert len(response.data) == 1
     assert response.status_code == 200
 
+# ahj_geo_location_batch Tests
+
+def lat_lng_location_ob(lat, lng):
+    return {'Latitude': {'Value': lat}, 'Longitude': {'Value': lng}}
+
+@pytest.mark.django_db
+def test_ahj_geo_location_batch__matches_single_location_search(list_of_ahjs, client_with_credentials):
+    locations = [lat_lng_location_ob(25, 25), lat_lng_location_ob(5, 5), lat_lng_location_ob(90, 90), lat_lng_location_ob(25, 25)]
+    response = client_with_credentials.post(reverse('ahj-geo-location-batch'), {'Locations': locations}, format='json')
+    assert response.status_code == 200
+    assert len(response.data) == len(locations)
+    for location, ahjs in zip(locations, response.data):
+        single_response = client_with_credentials.post(reverse('ahj-geo-location'), {'Location': location}, format='json')
+        assert ahjs == single_response.data
+
+@pytest.mark.django_db
+def test_ahj_geo_location_batch__search_array(list_of_ahjs, client_with_credentials):
+    url = reverse('ahj-geo-location-batch')
+    response = client_with_credentials.post(url, {'ahjs_to_search': ['f97ea81a-f9c4-4195-889e-ad414b736ce5'],
+                                                  'Locations': [lat_lng_location_ob(5, 5), {'Location': lat_lng_location_ob(25, 25)}]}, format='json')
+    assert response.status_code == 200
+    assert [ahj['AHJID']['Value'] for ahj in response.data[0]] == ['f97ea81a-f9c4-4195-889e-ad414b736ce5']
+    assert response.data[1] == []
+
+@pytest.mark.parametrize(
+    'locations', [
+        None,
+        [],
+        [lat_lng_location_ob(25, 25), lat_lng_location_ob('a', 'a')],
+        [lat_lng_location_ob(25, 25), {'Latitude': {'Value': '25'}}],
+        [{'Latitude': '25', 'Longitude': '25'}]
+    ]
+)
+@pytest.mark.django_db
+def test_ahj_geo_location_batch__invalid_locations(locations, client_with_credentials):
+    response = client_with_credentials.post(reverse('ahj-geo-location-batch'), {'Locations': locations}, format='json')
+    assert response.status_code == 400
+
+@pytest.mark.django_db
+def test_ahj_geo_location_batch__too_many_locations(client_with_credentials, settings):
+    settings.GEO_LOCATION_BATCH_MAX_SIZE = 2
+    locations = [lat_lng_location_ob(25, 25)] * 3
+    response = client_with_credentials.post(reverse('ahj-geo-location-batch'), {'Locations': locations}, format='json')
+    assert response.status_code == 400
+
 
 @pytest.mark.django_db
 def test_deactivate_expired_api_tokens(create_user):
@@ -0,0 +1,44 @@
+from ahj_app.benchmark import compare_results, run_micro_benchmarks, summarize
+from ahj_app.benchmark_data import BENCHMARK_AHJ_CODE_PREFIX, delete_benchmark_data, generate_benchmark_data
+from ahj_app.models import *
+from fixtures import *
+import pytest
+
+
+@pytest.fixture
+def benchmark_data(settings):
+    settings.VECTOR_TILE_CACHE_DIR = None
+    return generate_benchmark_data(states=1, counties_per_state=2, contacts_per_ahj=1, edits_per_ahj=1)
+
+
+@pytest.mark.django_db
+def test_generate_benchmark_data(benchmark_data):
+    # A state, and a county and a city per county
+    assert benchmark_data['AHJ'] == 5 and benchmark_data['Contact'] == 5 and benchmark_data['Edit'] == 5
+    assert AHJ.objects.filter(AHJCode__startswith=BENCHMARK_AHJ_CODE_PREFIX).count() == 5
+    assert StatePolygon.objects.count() == 1 and CountyPolygon.objects.count() == 2 and CityPolygon.objects.count() == 2
+    assert delete_benchmark_data() == 5
+    assert AHJ.objects.count() == 0 and Polygon.objects.count() == 0 and Contact.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_run_micro_benchmarks(benchmark_data):
+    results = {result['name']: result for result in run_micro_benchmarks(repeat=2)}
+    assert results['filter_ahjs_location']['calls'] == 2
+    assert results['filter_ahjs_location']['queries'] > 0
+    assert results['build_field_val_dict']['queries'] == 0
+    # apply_edits is rolled back after each call
+    assert Edit.objects.filter(ReviewStatus='A').count() == 5
+    assert AHJ.history.count() == 0
+
+
+def test_run_micro_benchmarks__no_data(db):
+    with pytest.raises(ValueError):
+        run_micro_benchmarks(repeat=1)
+
+
+def test_compare_results():
+    baseline = [summarize('a', [0.010], [3], None), summarize('b', [0.010], [3], None)]
+    results = [summarize('a', [0.011], [3], None), summarize('b', [0.020], [4], None), summarize('c', [1.0], [9], None)]
+    regressions = compare_results(results, baseline, tolerance=0.2)
+    assert len(regressions) == 2 and all(regression.startswith('b:') for regression in regressions)
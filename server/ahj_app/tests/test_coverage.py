@@ -0,0 +1,78 @@
+from django.contrib.gis.geos import MultiPolygon
+from django.contrib.gis.geos import Polygon as geosPolygon
+from django.urls import reverse
+from ahj_app.models import *
+from ahj_app.models_field_enums import BUILDING_CODE_CHOICES
+from ahj_app.coverage import COVERAGE_FIELDS, rebuild_coverage
+from fixtures import *
+import pytest
+import uuid
+
+
+def create_polygon(model, **kwargs):
+    polygon = Polygon.objects.create(Polygon=MultiPolygon(geosPolygon(((0, 0), (0, 1), (1, 1), (0, 0)))),
+                                     LandArea=1, WaterArea=1, InternalPLatitude=1, InternalPLongitude=1)
+    return model.objects.create(PolygonID=polygon, **kwargs)
+
+
+@pytest.fixture
+def state():
+    state = create_polygon(StatePolygon, FIPSCode='49')
+    create_polygon(CityPolygon, StatePolygonID=state)
+    return state
+
+
+@pytest.fixture
+def county(state):
+    return create_polygon(CountyPolygon, StatePolygonID=state)
+
+
+def get_state_coverage(state):
+    return StateCoverage.objects.filter(StatePolygonID=state).values(*COVERAGE_FIELDS).first()
+
+
+def get_coverage_rows():
+    return (list(PolygonCoverage.objects.order_by('PolygonID').values('PolygonID', 'StatePolygonID', *COVERAGE_FIELDS)),
+            list(StateCoverage.objects.order_by('StatePolygonID').values('StatePolygonID', *COVERAGE_FIELDS)))
+
+
+@pytest.mark.django_db
+def test_coverage__updated_by_ahj_changes(state, county):
+    # Polygons without an AHJ count as one, like data_map did before
+    assert get_state_coverage(state)['NumAHJs'] == 2
+    ahj = AHJ.objects.create(AHJID=uuid.uuid4(), PolygonID=county.PolygonID)
+    AHJ.objects.create(AHJID=uuid.uuid4(), PolygonID=county.PolygonID)
+    assert get_state_coverage(state)['NumAHJs'] == 3
+    ahj.BuildingCode = BuildingCode.objects.create(Value=BUILDING_CODE_CHOICES[0][0])
+    ahj.save()
+    assert PolygonCoverage.objects.get(PolygonID=county.PolygonID).NumBuildingCodes == 1
+    assert get_state_coverage(state)['NumBuildingCodes'] == 1
+    ahj.delete()
+    assert get_state_coverage(state) == {'NumAHJs': 2, 'NumBuildingCodes': 0, 'NumElectricCodes': 0,
+                                         'NumFireCodes': 0, 'NumResidentialCodes': 0, 'NumWindCodes': 0}
+
+
+@pytest.mark.django_db
+def test_coverage__updated_by_polygon_changes(state, county):
+    county.delete()
+    assert not PolygonCoverage.objects.filter(PolygonID=county.PolygonID).exists()
+    assert get_state_coverage(state)['NumAHJs'] == 1
+
+
+@pytest.mark.django_db
+def test_rebuild_coverage(state, county):
+    AHJ.objects.create(AHJID=uuid.uuid4(), PolygonID=county.PolygonID,
+                       BuildingCode=BuildingCode.objects.create(Value=BUILDING_CODE_CHOICES[0][0]))
+    updated = get_coverage_rows()
+    PolygonCoverage.objects.all().update(NumAHJs=0)
+    assert rebuild_coverage() == (2, 1)
+    assert get_coverage_rows() == updated
+
+
+@pytest.mark.django_db
+def test_data_map__served_from_coverage(state, county, client_with_webpage_credentials):
+    StateCoverage.objects.filter(StatePolygonID=state).update(NumWindCodes=7)
+    response = client_with_webpage_credentials.get(reverse('data-map'))
+    assert response.data[0]['numWindCodes'] == 7 and response.data[0]['numAHJs'] == 2
+    response = client_with_webpage_credentials.get(reverse('data-map'), {'StatePK': state.PolygonID_id})
+    assert {row['PolygonID'] for row in response.data} == {county.PolygonID_id, CityPolygon.objects.get().PolygonID_id}
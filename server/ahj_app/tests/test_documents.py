@@ -0,0 +1,117 @@
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from ahj_app.models import *
+from ahj_app import documents
+from ahj_app.documents import serialize_ahjs, get_ahj_documents
+from ahj_app.serializers import AHJSerializer
+from fixtures import *
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def ahj_documents_enabled(document_signals):
+    pass
+
+
+@pytest.fixture
+def ahj_with_comments(create_minimal_obj, create_user):
+    ahj = create_minimal_obj('AHJ')
+    Contact.objects.create(ParentTable='AHJ', ParentID=ahj.AHJPK, ContactStatus=True, FirstName='Contact')
+    inspection = AHJInspection.objects.create(AHJPK=ahj, AHJInspectionName='Inspection', InspectionStatus=True)
+    Contact.objects.create(ParentTable='AHJInspection', ParentID=inspection.InspectionID, ContactStatus=True)
+    user = create_user(FirstName='User')
+    comment = Comment.objects.create(UserID=user, AHJPK=ahj.AHJPK, CommentText='Comment')
+    Comment.objects.create(UserID=user, ReplyingTo=comment.CommentID, CommentText='Reply')
+    return AHJ.objects.get(AHJPK=ahj.AHJPK)
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+def has_document(ahj):
+    return AHJDocument.objects.filter(AHJPK=ahj.AHJPK).exists()
+
+
+@pytest.mark.parametrize(
+    'is_public_view', [
+        True,
+        False
+    ]
+)
+@pytest.mark.django_db
+def test_serialize_ahjs__matches_serializer(is_public_view, ahj_with_comments):
+    context = {'is_public_view': is_public_view}
+    expected = render(AHJSerializer([ahj_with_comments], many=True, context=context).data)
+    assert render(serialize_ahjs([ahj_with_comments], context=context)) == expected  # Builds the documents
+    assert has_document(ahj_with_comments)
+    assert render(serialize_ahjs([ahj_with_comments], context=context)) == expected  # Reads the documents
+
+
+@pytest.mark.django_db
+def test_get_ahj_documents__stored_documents_are_read(ahj_with_comments, django_assert_num_queries):
+    get_ahj_documents([ahj_with_comments])
+    with django_assert_num_queries(1):
+        get_ahj_documents([ahj_with_comments])
+
+
+@pytest.mark.parametrize(
+    'change_row', [
+        lambda ahj: AHJ.objects.get(AHJPK=ahj.AHJPK).save(),
+        lambda ahj: Contact.objects.get(ParentTable='AHJ', ParentID=ahj.AHJPK).save(),
+        lambda ahj: Contact.objects.get(ParentTable='AHJInspection').delete(),
+        lambda ahj: ahj.AddressID.LocationID.save(),
+        lambda ahj: Comment.objects.get(CommentText='Reply').save(),
+        lambda ahj: User.objects.get(ContactID__FirstName='User').save(),
+        lambda ahj: Contact.objects.get(FirstName='User').save(),
+        lambda ahj: AHJLevelCode.objects.create(Value='040')
+    ]
+)
+@pytest.mark.django_db
+def test_ahj_documents__invalidated_when_row_changes(change_row, ahj_with_comments):
+    get_ahj_documents([ahj_with_comments])
+    change_row(ahj_with_comments)
+    assert not has_document(ahj_with_comments)
+
+
+@pytest.mark.django_db
+def test_ahj_documents__kept_when_user_logs_in(ahj_with_comments):
+    get_ahj_documents([ahj_with_comments])
+    user = User.objects.get(ContactID__FirstName='User')
+    user.last_login = timezone.now()
+    user.save(update_fields=['last_login'])
+    assert has_document(ahj_with_comments)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_ahj_documents__not_stored_when_changed_while_serialized(ahj_with_comments, monkeypatch):
+    dump_document = documents.dump_document
+
+    def change_ahj_then_dump(data):
+        # An edit committed after the rows were read, invalidating a document not stored yet
+        if AHJ.objects.filter(AHJPK=ahj_with_comments.AHJPK, AHJName='Changed').count() == 0:
+            AHJ.objects.filter(AHJPK=ahj_with_comments.AHJPK).update(AHJName='Changed')
+            documents.invalidate_ahj_documents([ahj_with_comments.AHJPK])
+        return dump_document(data)
+    monkeypatch.setattr(documents, 'dump_document', change_ahj_then_dump)
+    get_ahj_documents([ahj_with_comments])
+    assert not has_document(ahj_with_comments)
+    monkeypatch.setattr(documents, 'dump_document', dump_document)
+    assert get_ahj_documents([ahj_with_comments])[0]['AHJName']['Value'] == 'Changed'
+
+
+@pytest.mark.django_db
+def test_rebuild_ahj_documents_command(ahj_with_comments, create_minimal_obj):
+    other_ahj = create_minimal_obj('AHJ')
+    call_command('rebuild_ahj_documents')
+    assert has_document(ahj_with_comments) and has_document(other_ahj)
+
+
+@pytest.mark.django_db
+def test_get_single_ahj__served_from_document(ahj_with_comments, client_with_webpage_credentials, settings):
+    url = reverse('single_ahj')
+    response = client_with_webpage_credentials.get(url, {'AHJPK': ahj_with_comments.AHJPK})
+    assert has_document(ahj_with_comments)
+    settings.AHJ_DOCUMENTS_ENABLED = False
+    assert client_with_webpage_credentials.get(url, {'AHJPK': ahj_with_comments.AHJPK}).content == response.content
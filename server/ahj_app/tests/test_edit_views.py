@@ -3,7 +3,9 @@ import uuid
 from decimal import Decimal
 
 from django.apps import apps
-from ahj_app.models import User, Edit, Comment, AHJInspection, Contact, Address, Location, AHJ, AHJUserMaintains
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ahj_app.models import User, Edit, Comment, AHJInspection, Contact, Address, Location, AHJ, AHJUserMaintains, GeocodeJob
 from django.urls import reverse
 from django.utils import timezone
 
@@ -816,3 +818,74 @@ def test_edit_reset__kwargs(force_resettable, skip_undo, create_user, ahj_obj):
     assert edit.ReviewStatus == 'P'
     assert edit.ApprovedBy is None
     assert edit.DateEffective is None
+
+
+def create_approved_edit(user, ahj, model_name, row, field_name, new_value, date_effective=None):
+    return Edit.objects.create(ChangedBy=user, ApprovedBy=user, SourceTable=model_name, SourceRow=row.pk, SourceColumn=field_name,
+                               OldValue='', NewValue=new_value, DateRequested=timezone.now(),
+                               DateEffective=date_effective if date_effective is not None else timezone.now(),
+                               ReviewStatus='A', EditType='U', AHJPK=ahj)
+
+
+@pytest.mark.django_db
+def test_apply_edits__last_edit_of_column_applied(create_user, create_minimal_obj):
+    user = create_user()
+    ahj = create_minimal_obj('AHJ')
+    start, end = views_edits.get_day_range(datetime.date.today())
+    create_approved_edit(user, ahj, 'AHJ', ahj, 'AHJName', 'later', date_effective=start + datetime.timedelta(minutes=2))
+    create_approved_edit(user, ahj, 'AHJ', ahj, 'AHJName', 'earlier', date_effective=start + datetime.timedelta(minutes=1))
+    create_approved_edit(user, ahj, 'AHJ', ahj, 'Description', 'description', date_effective=start + datetime.timedelta(minutes=1))
+    report = views_edits.apply_edits()
+    assert report['edits'] == 3 and report['rows'] == 1
+    ahj = AHJ.objects.get(AHJPK=ahj.AHJPK)
+    assert (ahj.AHJName, ahj.Description) == ('later', 'description')
+    history = AHJ.history.filter(AHJPK=ahj.AHJPK).latest()
+    assert history.AHJName == 'later' and history.history_user == user
+
+
+@pytest.mark.django_db
+def test_apply_edits__queries_independent_of_edit_count(create_user, create_minimal_obj):
+    user = create_user()
+
+    def count_apply_queries(num_ahjs):
+        ahjs = [create_minimal_obj('AHJ') for i in range(num_ahjs)]
+        edits = [create_approved_edit(user, ahj, 'AHJ', ahj, 'AHJName', f'name{i}') for i, ahj in enumerate(ahjs)]
+        edits = list(Edit.objects.filter(EditID__in=[edit.EditID for edit in edits]).select_related('ApprovedBy'))
+        with CaptureQueriesContext(connection) as context:
+            views_edits.apply_edits(ready_edits=edits)
+        return len(context.captured_queries)
+    assert count_apply_queries(2) == count_apply_queries(10)
+
+
+@pytest.mark.django_db
+def test_apply_edits__missing_row(create_user, create_minimal_obj):
+    user = create_user()
+    ahj = create_minimal_obj('AHJ')
+    edit = create_approved_edit(user, ahj, 'AHJInspection', ahj, 'AHJInspectionName', 'name')
+    report = views_edits.apply_edits(ready_edits=[edit])
+    assert report['missing'] == 1 and report['rows'] == 0
+
+
+@pytest.mark.django_db
+def test_apply_edits__address_geocoding_queued(create_user, create_minimal_obj):
+    user = create_user()
+    address = create_minimal_obj('Address')
+    ahj = create_minimal_obj('AHJ')
+    views_edits.apply_edits(ready_edits=[create_approved_edit(user, ahj, 'Address', address, 'City', 'Salt Lake City')])
+    assert GeocodeJob.objects.filter(AddressID=address).exists()
+
+
+@pytest.mark.django_db
+def test_get_edits_effective_on(create_user, create_minimal_obj):
+    user = create_user()
+    ahj = create_minimal_obj('AHJ')
+    today = datetime.date.today()
+    start, end = views_edits.get_day_range(today)
+    first = create_approved_edit(user, ahj, 'AHJ', ahj, 'AHJName', 'first')
+    last = create_approved_edit(user, ahj, 'AHJ', ahj, 'AHJName', 'last')
+    tomorrow = create_approved_edit(user, ahj, 'AHJ', ahj, 'AHJName', 'tomorrow')
+    Edit.objects.filter(EditID=first.EditID).update(DateEffective=start)
+    Edit.objects.filter(EditID=last.EditID).update(DateEffective=end - datetime.timedelta(microseconds=1))
+    Edit.objects.filter(EditID=tomorrow.EditID).update(DateEffective=end)
+    assert list(views_edits.get_edits_effective_on(today, 'A')) == [first, last]
+    assert len(views_edits.get_edits_effective_on(today, 'R')) == 0
@@ -0,0 +1,67 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ahj_app import enum_registry
+from ahj_app.models import *
+from ahj_app.models_field_enums import *
+from ahj_app.serializers import AHJSerializer
+from ahj_app.usf import add_enum_values
+from ahj_app.utils import get_enum_value_row
+from fixtures import *
+import pytest
+
+
+@pytest.fixture
+def building_codes():
+    return [BuildingCode.objects.create(Value=choice[0]) for choice in BUILDING_CODE_CHOICES[:2]]
+
+
+@pytest.mark.django_db
+def test_get_row__no_queries_once_loaded(building_codes, django_assert_num_queries):
+    enum_registry.load()
+    with django_assert_num_queries(0):
+        assert get_enum_value_row('BuildingCode', building_codes[0].Value) == building_codes[0]
+        assert enum_registry.get_row_by_pk('BuildingCode', building_codes[1].pk) == building_codes[1]
+        assert enum_registry.get_value('BuildingCode', building_codes[1].pk) == building_codes[1].Value
+
+
+@pytest.mark.django_db
+def test_get_row__value_does_not_exist(building_codes):
+    with pytest.raises(BuildingCode.DoesNotExist):
+        enum_registry.get_row('BuildingCode', 'NotACode')
+
+
+@pytest.mark.django_db
+def test_get_row__saving_an_enum_row_clears_registry(building_codes):
+    enum_registry.load()
+    building_code = BuildingCode.objects.create(Value=BUILDING_CODE_CHOICES[2][0])
+    assert enum_registry.get_row_by_pk('BuildingCode', building_code.pk) == building_code
+
+
+@pytest.mark.django_db
+def test_get_tables__notices_changes_without_signals(building_codes, settings):
+    enum_registry.load()
+    BuildingCode.objects.bulk_create([BuildingCode(Value=BUILDING_CODE_CHOICES[2][0])])
+    assert enum_registry.get_row_by_pk('BuildingCode', BuildingCode.objects.get(Value=BUILDING_CODE_CHOICES[2][0]).pk) is None
+    settings.ENUM_REGISTRY_CHECK_INTERVAL_SECONDS = 0
+    assert enum_registry.get_row_by_pk('BuildingCode', BuildingCode.objects.get(Value=BUILDING_CODE_CHOICES[2][0]).pk) is not None
+
+
+@pytest.mark.django_db
+def test_add_enum_values__clears_registry(building_codes):
+    enum_registry.load()
+    add_enum_values()
+    assert get_enum_value_row('BuildingCode', building_codes[0].Value).pk == BuildingCode.objects.get(Value=building_codes[0].Value).pk
+
+
+@pytest.mark.django_db
+def test_ahj_serializer__enum_fields_read_from_registry(create_minimal_obj, building_codes):
+    ahj = create_minimal_obj('AHJ')
+    ahj.BuildingCode = building_codes[1]
+    ahj.save()
+    ahj = AHJ.objects.get(AHJPK=ahj.AHJPK)
+    enum_registry.load()
+    with CaptureQueriesContext(connection) as queries:
+        data = AHJSerializer(ahj).data
+    assert data['BuildingCode'] == {'Value': building_codes[1].Value}
+    assert data['ElectricCode'] == {'Value': ''}
+    assert not any('FROM `BuildingCode`' in query['sql'] for query in queries.captured_queries)
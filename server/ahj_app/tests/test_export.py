@@ -0,0 +1,92 @@
+from django.urls import reverse
+from django.utils import timezone
+from ahj_app.models import *
+from ahj_app.export import iter_ahj_export_lines, get_ahjpks_changed_since
+from fixtures import *
+import datetime
+import json
+import pytest
+
+
+@pytest.fixture
+def three_ahjs(create_minimal_obj):
+    return [create_minimal_obj('AHJ') for i in range(3)]
+
+
+def read_export(response):
+    return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+
+@pytest.mark.parametrize(
+    'chunk_size', [
+        1,
+        2,
+        500
+    ]
+)
+@pytest.mark.django_db
+def test_iter_ahj_export_lines__every_ahj_in_order(chunk_size, three_ahjs):
+    lines = list(iter_ahj_export_lines(chunk_size=chunk_size))
+    assert [json.loads(line)['AHJID']['Value'] for line in lines] == [str(ahj.AHJID) for ahj in three_ahjs]
+    assert all(line.endswith('\n') and line.count('\n') == 1 for line in lines)
+
+
+@pytest.mark.django_db
+def test_get_ahjpks_changed_since(three_ahjs):
+    since = timezone.now()
+    Contact.objects.create(ParentTable='AHJ', ParentID=three_ahjs[1].AHJPK, ContactStatus=True)
+    inspection = AHJInspection.objects.create(AHJPK=three_ahjs[2], AHJInspectionName='Inspection', InspectionStatus=True)
+    inspection.delete()
+    assert get_ahjpks_changed_since(since) == {three_ahjs[1].AHJPK, three_ahjs[2].AHJPK}
+
+
+@pytest.mark.django_db
+def test_get_ahjpks_changed_since__queries_do_not_grow_with_rows(three_ahjs, django_assert_max_num_queries):
+    since = timezone.now()
+    for ahj in three_ahjs:
+        ahj.AddressID.LocationID.save()
+        Contact.objects.create(ParentTable='AHJ', ParentID=ahj.AHJPK, ContactStatus=True)
+    with django_assert_max_num_queries(15):
+        assert get_ahjpks_changed_since(since) == {ahj.AHJPK for ahj in three_ahjs}
+
+
+@pytest.mark.django_db
+def test_ahj_export(three_ahjs, client_with_credentials):
+    response = client_with_credentials.get(reverse('ahj-export'))
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/x-ndjson'
+    ahjs = read_export(response)
+    assert [ahj['AHJID']['Value'] for ahj in ahjs] == [str(ahj.AHJID) for ahj in three_ahjs]
+    assert 'AHJPK' not in ahjs[0]  # Public view
+
+
+@pytest.mark.django_db
+def test_ahj_export__since(three_ahjs, client_with_credentials):
+    since = timezone.localtime() + datetime.timedelta(seconds=1)
+    AHJ.history.filter(AHJPK=three_ahjs[0].AHJPK).update(history_date=since + datetime.timedelta(minutes=1))
+    response = client_with_credentials.get(reverse('ahj-export'), {'since': since.replace(tzinfo=None).isoformat()})
+    assert [ahj['AHJID']['Value'] for ahj in read_export(response)] == [str(three_ahjs[0].AHJID)]
+
+
+@pytest.mark.django_db
+def test_ahj_export__since_lists_deleted_ahjs(three_ahjs, client_with_credentials):
+    since = timezone.now()
+    deleted = three_ahjs[2]
+    Contact.objects.create(ParentTable='AHJ', ParentID=three_ahjs[1].AHJPK, ContactStatus=True)
+    deleted.delete()
+    lines = list(iter_ahj_export_lines(since=since))
+    assert json.loads(lines[0])['AHJID']['Value'] == str(three_ahjs[1].AHJID)
+    assert json.loads(lines[-1]) == {'AHJID': {'Value': str(deleted.AHJID)}, 'Deleted': True}
+    assert len(lines) == 2
+
+
+@pytest.mark.parametrize(
+    'since', [
+        'yesterday',
+        '2021-13-01'
+    ]
+)
+@pytest.mark.django_db
+def test_ahj_export__invalid_since(since, client_with_credentials):
+    response = client_with_credentials.get(reverse('ahj-export'), {'since': since})
+    assert response.status_code == 400
@@ -0,0 +1,84 @@
+from django.contrib.gis.geos import MultiPolygon
+from django.contrib.gis.geos import Polygon as geosPolygon
+from django.urls import reverse
+from ahj_app.geo_grid import encode_geohash, get_geohash_extent, get_polygon_cells, get_polygon_ids_containing, rebuild_geo_grid
+from ahj_app.models import *
+from ahj_app.utils import filter_ahjs, get_str_location
+from fixtures import *
+import pytest
+import uuid
+
+
+def create_polygon(bbox):
+    return Polygon.objects.create(Polygon=MultiPolygon(geosPolygon.from_bbox(bbox)), LandArea=1, WaterArea=1,
+                                  InternalPLatitude=0, InternalPLongitude=0)
+
+
+@pytest.fixture
+def polygons(db, settings):
+    """
+    A state with two counties and a city across both counties, gridded at
+    precision 4, where cells are about 0.35 degrees wide and 0.18 degrees high.
+    """
+    settings.GEO_GRID_PRECISION = 4
+    state = StatePolygon.objects.create(PolygonID=create_polygon((0, 0, 4, 4)), FIPSCode='01')
+    polygons = {'state': state.PolygonID}
+    for name, bbox in [('county_a', (0, 0, 2, 4)), ('county_b', (2, 0, 4, 4))]:
+        polygons[name] = CountyPolygon.objects.create(PolygonID=create_polygon(bbox), StatePolygonID=state).PolygonID
+    polygons['city'] = CityPolygon.objects.create(PolygonID=create_polygon((1, 1, 3, 2)), StatePolygonID=state).PolygonID
+    for polygon in polygons.values():
+        AHJ.objects.create(AHJID=uuid.uuid4(), PolygonID=polygon)
+    rebuild_geo_grid()
+    return polygons
+
+
+def test_encode_geohash():
+    assert encode_geohash(-5.6, 42.6, 5) == 'ezs42'
+    xmin, ymin, xmax, ymax = get_geohash_extent('ezs42')
+    assert xmin <= -5.6 <= xmax and ymin <= 42.6 <= ymax
+
+
+def test_get_polygon_cells():
+    cells = dict(get_polygon_cells(geosPolygon.from_bbox((0, 0, 1, 1)), 3))
+    assert cells[encode_geohash(0.5, 0.5, 3)] is True
+    assert cells[encode_geohash(1.2, 1.2, 3)] is False
+    assert encode_geohash(2, 2, 3) not in cells
+
+
+@pytest.mark.parametrize(
+    'lng, lat, expected_names, used_exact_test', [
+        (0.5, 0.5, ['state', 'county_a'], False),
+        (1.5, 1.5, ['state', 'county_a', 'city'], False),
+        (2.1, 1.5, ['state', 'county_b', 'city'], True),
+        (5, 5, [], False)
+    ]
+)
+@pytest.mark.django_db
+def test_get_polygon_ids_containing(lng, lat, expected_names, used_exact_test, polygons):
+    polygon_ids, used_exact = get_polygon_ids_containing(lng, lat)
+    assert polygon_ids == {polygons[name].PolygonID for name in expected_names}
+    assert used_exact == used_exact_test
+
+
+@pytest.mark.django_db
+def test_filter_ahjs__geo_grid(polygons, settings):
+    location = get_str_location({'Longitude': {'Value': 2.1}, 'Latitude': {'Value': 1.5}})
+    expected = {ahj.AHJPK for ahj in filter_ahjs(location=location)}
+    settings.GEO_GRID_ENABLED = True
+    assert {ahj.AHJPK for ahj in filter_ahjs(location=location)} == expected
+    assert len(expected) == 3
+
+
+@pytest.mark.parametrize(
+    'lng, lat, geo_grid_enabled, geo_lookup', [
+        (0.5, 0.5, True, 'grid'),
+        (2.1, 1.5, True, 'exact'),
+        (0.5, 0.5, False, 'sql')
+    ]
+)
+@pytest.mark.django_db
+def test_ahj_geo_location__geo_lookup_header(lng, lat, geo_grid_enabled, geo_lookup, polygons, settings, client_with_api_credentials):
+    settings.GEO_GRID_ENABLED = geo_grid_enabled
+    url = reverse('ahj-geo-location')
+    response = client_with_api_credentials.post(url, {'Latitude': {'Value': lat}, 'Longitude': {'Value': lng}}, format='json')
+    assert response.status_code == 200 and response['X-AHJ-Geo-Lookup'] == geo_lookup
@@ -0,0 +1,80 @@
+from django.utils import timezone
+from ahj_app.models import *
+from ahj_app import geocode_jobs
+from fixtures import *
+import pytest
+
+
+@pytest.fixture
+def addresses(create_minimal_obj):
+    addresses = [create_minimal_obj('Address') for i in range(3)]
+    for address in addresses:
+        address.City = 'Salt Lake City'
+        address.save()
+    return addresses
+
+
+@pytest.fixture
+def geocoded(monkeypatch):
+    geocoded = []
+
+    def get_elevation(address):
+        geocoded.append(address)
+        return {'Latitude': {'Value': 40}, 'Longitude': {'Value': -111}, 'Elevation': {'Value': 1300}}
+    monkeypatch.setattr(geocode_jobs, 'get_elevation', get_elevation)
+    return geocoded
+
+
+@pytest.fixture
+def failing_geocoder(monkeypatch):
+    def get_elevation(address):
+        raise ConnectionError('Geocoder unavailable')
+    monkeypatch.setattr(geocode_jobs, 'get_elevation', get_elevation)
+
+
+@pytest.mark.django_db
+def test_enqueue_geocode_jobs__one_job_per_address(addresses):
+    geocode_jobs.enqueue_geocode_jobs(addresses)
+    geocode_jobs.enqueue_geocode_jobs(addresses[:1])
+    assert GeocodeJob.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_process_geocode_jobs(addresses, geocoded):
+    geocode_jobs.enqueue_geocode_jobs(addresses)
+    report = geocode_jobs.process_geocode_jobs()
+    assert report == {'claimed': 3, 'geocoded': 3, 'failed': 0}
+    assert geocoded == ['Salt Lake City']
+    for address in addresses:
+        location = Location.objects.get(LocationID=address.LocationID_id)
+        assert (location.Latitude, location.Longitude, location.Elevation) == (40, -111, 1300)
+    assert not GeocodeJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_process_geocode_jobs__batches(addresses, geocoded):
+    geocode_jobs.enqueue_geocode_jobs(addresses)
+    assert geocode_jobs.process_geocode_jobs(batch_size=2)['claimed'] == 2
+    assert geocode_jobs.process_all_geocode_jobs(batch_size=2)['claimed'] == 1
+
+
+@pytest.mark.django_db
+def test_process_geocode_jobs__retries(addresses, failing_geocoder, settings):
+    settings.GEOCODE_JOB_MAX_ATTEMPTS = 2
+    geocode_jobs.enqueue_geocode_jobs(addresses[:1])
+    assert geocode_jobs.process_geocode_jobs()['failed'] == 1
+    job = GeocodeJob.objects.get()
+    assert job.Attempts == 1 and job.NextAttempt > timezone.now() and job.LastError == 'Geocoder unavailable'
+    assert geocode_jobs.process_geocode_jobs()['claimed'] == 0
+    GeocodeJob.objects.update(NextAttempt=timezone.now())
+    geocode_jobs.process_geocode_jobs()
+    job = GeocodeJob.objects.get()
+    assert job.Attempts == 2 and job.NextAttempt is None
+
+
+@pytest.mark.django_db
+def test_process_geocode_jobs__requeued_address_kept(addresses, geocoded):
+    geocode_jobs.enqueue_geocode_jobs(addresses[:1])
+    GeocodeJob.objects.update(Queued=timezone.now() + datetime.timedelta(minutes=1))
+    geocode_jobs.process_geocode_jobs()
+    assert GeocodeJob.objects.count() == 1
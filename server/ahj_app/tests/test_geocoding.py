@@ -0,0 +1,89 @@
+from django.utils import timezone
+from ahj_app import geocoding
+from ahj_app.models import GeocodeCache
+from ahj_app.utils import get_elevation, get_location_gecode_address_str
+import datetime
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def stub_geocoder(settings):
+    settings.GEOCODER = 'stub'
+    geocoding.reset_geocode_cache_stats()
+
+
+@pytest.mark.parametrize(
+    'address, expected_output', [
+        ('  123 Main St,  Salt Lake City ', '123 main st salt lake city'),
+        ('123 MAIN ST; SALT LAKE CITY', '123 main st salt lake city'),
+        ('', '')
+    ]
+)
+def test_normalize_address(address, expected_output):
+    assert geocoding.normalize_address(address) == expected_output
+
+
+@pytest.mark.parametrize(
+    'address, expected_output', [
+        ('40.76, -111.89', (40.76, -111.89)),
+        ('Somewhere 40.76 -111.89', (40.76, -111.89)),
+        ('112 Baker St', None)
+    ]
+)
+def test_stub_geocoder(address, expected_output):
+    assert geocoding.StubGeocoder().geocode(address) == expected_output
+
+
+@pytest.mark.django_db
+def test_geocode_address__cache_hits_and_misses():
+    assert geocoding.geocode_address('40.76, -111.89') == (40.76, -111.89)
+    assert geocoding.geocode_address('40.76 -111.89') == (40.76, -111.89)
+    assert geocoding.geocode_address('112 Baker St') is None
+    assert geocoding.geocode_address('112 BAKER ST') is None
+    stats = geocoding.get_geocode_cache_stats()
+    assert stats['hits'] == 2 and stats['misses'] == 2
+    assert GeocodeCache.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_geocode_address_with_elevation__looks_up_missing_elevation():
+    geocoding.geocode_address('40.76, -111.89')
+    assert GeocodeCache.objects.get().Elevation is None
+    assert geocoding.geocode_address_with_elevation('40.76, -111.89') == (40.76, -111.89, 0.0)
+    assert geocoding.geocode_address_with_elevation('40.76, -111.89') == (40.76, -111.89, 0.0)
+    stats = geocoding.get_geocode_cache_stats()
+    assert stats['hits'] == 1 and stats['misses'] == 2
+
+
+@pytest.mark.django_db
+def test_geocode_address__expired_entry_is_refreshed(settings):
+    geocoding.geocode_address('40.76, -111.89')
+    GeocodeCache.objects.update(Created=timezone.now() - datetime.timedelta(seconds=settings.GEOCODE_CACHE_TTL_SECONDS + 1))
+    geocoding.geocode_address('40.76, -111.89')
+    assert geocoding.get_geocode_cache_stats()['misses'] == 2
+    assert GeocodeCache.objects.get().Created > timezone.now() - datetime.timedelta(seconds=settings.GEOCODE_CACHE_TTL_SECONDS)
+
+
+@pytest.mark.django_db
+def test_evict_geocode_cache__least_recently_used(settings):
+    settings.GEOCODE_CACHE_MAX_ENTRIES = 2
+    now = timezone.now()
+    for i, address in enumerate(['1.5, 1.5', '2.5, 2.5', '3.5, 3.5']):
+        geocoding.geocode_address(address)
+        GeocodeCache.objects.filter(AddressKey=geocoding.get_address_key(address.replace(',', ''))) \
+                            .update(LastUsed=now - datetime.timedelta(days=3 - i))
+    expired = GeocodeCache.objects.create(AddressKey='expired', Address='expired',
+                                          Created=now - datetime.timedelta(seconds=settings.GEOCODE_CACHE_TTL_SECONDS + 1))
+    assert geocoding.evict_geocode_cache() == 2
+    assert not GeocodeCache.objects.filter(AddressKey__in=[expired.AddressKey, geocoding.get_address_key('1.5 1.5')]).exists()
+    assert GeocodeCache.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_get_location_gecode_address_str__uses_geocoder():
+    assert get_location_gecode_address_str('40.76, -111.89') == {'Latitude': {'Value': 40.76}, 'Longitude': {'Value': -111.89}}
+
+
+@pytest.mark.django_db
+def test_get_elevation__no_result():
+    assert get_elevation('112 Baker St') == {'Latitude': {'Value': None}, 'Longitude': {'Value': None}, 'Elevation': {'Value': None}}
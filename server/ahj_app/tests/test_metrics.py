@@ -0,0 +1,64 @@
+from django.urls import reverse
+from ahj_app import metrics
+from ahj_app.models import *
+from fixtures import *
+import logging
+import pytest
+
+
+@pytest.fixture
+def metrics_enabled(settings):
+    settings.METRICS_ENABLED = True
+    settings.METRICS_WINDOW_SIZE = 3
+    metrics.reset_metrics()
+    yield
+    metrics.reset_metrics()
+
+
+@pytest.fixture
+def superuser_client(create_user, api_client):
+    api_client.force_authenticate(user=create_user(is_superuser=True))
+    yield api_client
+    api_client.force_authenticate(user=None)
+
+
+def test_get_quantile():
+    assert metrics.get_quantile([1, 2, 3, 4], 0.5) == 3
+    assert metrics.get_quantile([1, 2, 3, 4], 0.99) == 4
+
+
+@pytest.mark.django_db
+def test_metrics_middleware__records_requests(ahj_obj, metrics_enabled, client_with_credentials):
+    for i in range(5):
+        client_with_credentials.get(reverse('single_ahj'), {'AHJPK': ahj_obj.AHJPK})
+    endpoint = metrics._endpoints['single_ahj']
+    assert endpoint.count == 5
+    assert len(endpoint.windows['sql_queries']) == 3
+    assert min(endpoint.windows['sql_queries']) > 0
+    assert min(endpoint.windows['response_size_bytes']) > 0
+    assert endpoint.sums['serializer_duration_seconds'] > 0
+
+
+@pytest.mark.django_db
+def test_metrics_middleware__slow_request_log(ahj_obj, metrics_enabled, settings, client_with_credentials, caplog):
+    settings.METRICS_SLOW_REQUEST_SECONDS = 0
+    with caplog.at_level(logging.WARNING, logger='ahj_app.slow_requests'):
+        client_with_credentials.get(reverse('single_ahj'), {'AHJPK': ahj_obj.AHJPK})
+    assert 'single_ahj' in caplog.text and 'SELECT' in caplog.text
+
+
+@pytest.mark.django_db
+def test_metrics(ahj_obj, metrics_enabled, superuser_client):
+    superuser_client.get(reverse('single_ahj'), {'AHJPK': ahj_obj.AHJPK})
+    response = superuser_client.get(reverse('metrics'))
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = response.content.decode()
+    assert '# TYPE ahj_sql_queries summary' in text
+    assert 'ahj_request_duration_seconds_count{url_name="single_ahj"} 1' in text
+
+
+@pytest.mark.django_db
+def test_metrics__not_superuser(client_with_credentials):
+    response = client_with_credentials.get(reverse('metrics'))
+    assert response.status_code == 403
@@ -48,6 +48,32 @@ def test_user_comments__user_does_not_exist(client_with_webpage_credentials):
     assert len(response.data) == 0 # no comments returned
     assert response.status_code == 200
 
+@pytest.mark.django_db
+def test_comment_replies__pages(ahj_obj, generate_client_with_webpage_credentials):
+    client = generate_client_with_webpage_credentials(Username='someone')
+    user = User.objects.get(Username='someone')
+    comment = Comment.objects.create(UserID=user, AHJPK=ahj_obj.AHJPK, CommentText='Comment')
+    now = timezone.now()
+    replies = [Comment.objects.create(UserID=user, CommentText='Reply' + str(i), ReplyingTo=comment.CommentID, Date=now - datetime.timedelta(minutes=i))
+               for i in range(3)]
+    Comment.objects.create(UserID=user, CommentText='Reply to reply', ReplyingTo=replies[2].CommentID)
+    url = reverse('comment-replies')
+    response = client.get(url, {'CommentID': comment.CommentID, 'offset': 2, 'limit': 2})
+    assert response.status_code == 200
+    assert response.data['count'] == 3
+    assert [reply['CommentText']['Value'] for reply in response.data['results']] == ['Reply2']
+    assert response.data['results'][0]['ReplyCount'] == 1
+
+@pytest.mark.parametrize(
+   'params', [
+       {},
+       {'CommentID': 'abc'}
+   ])
+@pytest.mark.django_db
+def test_comment_replies__invalid_comment_id(params, client_with_webpage_credentials):
+    response = client_with_webpage_credentials.get(reverse('comment-replies'), params)
+    assert response.status_code == 400
+
 @pytest.mark.django_db
 def test_comment_submit__normal_submission(ahj_obj, client_with_webpage_credentials):
     url = reverse('comment-submit')
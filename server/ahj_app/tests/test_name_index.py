@@ -0,0 +1,113 @@
+from django.urls import reverse
+from ahj_app.models import *
+from ahj_app import name_index
+from ahj_app.name_index import NameEntry, NameIndex, normalize_name
+from ahj_app.utils import filter_ahjs
+from fixtures import *
+import pytest
+import uuid
+
+
+NAMES = ['Salt Lake City', 'Salt Lake County', 'Smith Township', 'Orange County', 'Cottonwood Heights', 'St. George']
+
+
+@pytest.fixture
+def index():
+    return NameIndex([NameEntry(i + 1, str(i + 1), name, 'UT', [name]) for i, name in enumerate(NAMES)])
+
+
+@pytest.fixture
+def loaded_name_index(db):
+    for name in NAMES:
+        AHJ.objects.create(AHJID=uuid.uuid4(), AHJName=name)
+    yield name_index.load_name_index()
+    name_index.clear_name_index()
+
+
+def search_names(index, name, limit=None):
+    return [entry.AHJName for entry, score in index.search(name, limit=limit)]
+
+
+@pytest.mark.parametrize(
+    'name, expected_output', [
+        ('Smith Twp.', ['smith', 'township']),
+        ('St. George', ['saint', 'george']),
+        ('Lewis & Clark Co', ['lewis', 'and', 'clark', 'county']),
+        ('', [])
+    ]
+)
+def test_normalize_name(name, expected_output):
+    assert normalize_name(name) == expected_output
+
+
+@pytest.mark.parametrize(
+    'name, expected_output', [
+        ('Smith Twp', ['Smith Township']),
+        ('Saint George', ['St. George']),
+        ('cotonwood hts', ['Cottonwood Heights']),
+        ('orange cnty', ['Orange County']),
+        ('ange', ['Orange County']),
+        ('xyz', [])
+    ]
+)
+def test_name_index_search(name, expected_output, index):
+    assert search_names(index, name) == expected_output
+
+
+def test_name_index_search__ranks_prefix_matches_first(index):
+    assert search_names(index, 'co', limit=3) == ['Cottonwood Heights', 'Orange County', 'Salt Lake County']
+    assert search_names(index, 'county')[-1] == 'Salt Lake County'
+
+
+def test_name_index_search__single_letter_prefix(index):
+    assert set(search_names(index, 'o')) == {'Orange County'}
+
+
+def test_name_index_search__every_word_must_match(index):
+    assert search_names(index, 'Cook County') == []
+    assert search_names(index, 'Salt Lake County') == ['Salt Lake County']
+
+
+@pytest.mark.parametrize(
+    'name, expected_output', [
+        ('Lake C', {'Salt Lake City', 'Salt Lake County'}),
+        ('ty', {'Salt Lake City', 'Salt Lake County', 'Orange County'}),
+        ('st. g', {'St. George'}),
+        ('Salt Lake Cty', set())
+    ]
+)
+def test_name_index_get_ahjpks_containing(name, expected_output, index):
+    assert {entry.AHJName for entry in index.entries if entry.AHJPK in index.get_ahjpks_containing(name)} == expected_output
+
+
+@pytest.mark.django_db
+def test_filter_ahjs__name_matched_as_substring(loaded_name_index):
+    ahjs = filter_ahjs(AHJName='Lake C')
+    assert 'LIKE' not in ahjs.raw_query
+    assert {ahj.AHJName for ahj in ahjs} == {'Salt Lake City', 'Salt Lake County'}
+    assert list(filter_ahjs(AHJName='Salt Lake Cty')) == []
+    name_index.clear_name_index()
+    assert {ahj.AHJName for ahj in filter_ahjs(AHJName='Lake C')} == {'Salt Lake City', 'Salt Lake County'}
+
+
+@pytest.mark.django_db
+def test_ahj_list__name_search_ranked_before_paginating(loaded_name_index, client_with_credentials):
+    response = client_with_credentials.post(reverse('ahj-private') + '?limit=1', {'AHJName': 'County'}, format='json')
+    assert response.data['count'] == 2
+    assert [ahj['AHJName']['Value'] for ahj in response.data['results']['ahjlist']] == ['Orange County']
+
+
+@pytest.mark.django_db
+def test_ahj_autocomplete(loaded_name_index, client_with_webpage_credentials):
+    response = client_with_webpage_credentials.get(reverse('ahj-autocomplete'), {'q': 'salt lake', 'limit': 1})
+    assert response.status_code == 200
+    assert [suggestion['AHJName'] for suggestion in response.data] == ['Salt Lake City']
+
+
+@pytest.mark.django_db
+def test_ahj_autocomplete__without_index(client_with_webpage_credentials):
+    AHJ.objects.create(AHJID=uuid.uuid4(), AHJName='Salt Lake City')
+    response = client_with_webpage_credentials.get(reverse('ahj-autocomplete'), {'q': 'lake'})
+    assert [suggestion['AHJName'] for suggestion in response.data] == ['Salt Lake City']
+    response = client_with_webpage_credentials.get(reverse('ahj-autocomplete'), {'q': 'l'})
+    assert response.data == []
@@ -0,0 +1,97 @@
+from django.contrib.gis.geos import MultiPolygon
+from django.contrib.gis.geos import Polygon as geosPolygon
+from django.urls import reverse
+from ahj_app.models import *
+from ahj_app import polygon_detail
+from ahj_app.serializers import AHJSerializer
+from fixtures import *
+import math
+import uuid
+import pytest
+
+
+def circle(x, y, radius, num_points):
+    points = [(x + radius * math.cos(2 * math.pi * i / num_points), y + radius * math.sin(2 * math.pi * i / num_points))
+              for i in range(num_points)]
+    return geosPolygon(points + [points[0]])
+
+
+def count_points(geojson_geometry):
+    return sum(len(ring) for polygon in geojson_geometry['coordinates'] for ring in polygon)
+
+
+@pytest.fixture
+def detailed_ahj():
+    polygon = Polygon.objects.create(Polygon=MultiPolygon(circle(0, 0, 1, 2000), srid=4326),
+                                     LandArea=1, WaterArea=1, InternalPLatitude=0, InternalPLongitude=0)
+    return AHJ.objects.create(AHJID=uuid.uuid4(), PolygonID=polygon, AddressID=Address.objects.create())
+
+
+@pytest.mark.parametrize(
+    'value, expected_output', [
+        (None, 'medium'),
+        ('none', 'none'),
+        ('full', 'full')
+    ]
+)
+def test_get_detail(value, expected_output):
+    assert polygon_detail.get_detail(value, 'medium') == expected_output
+
+
+def test_get_detail__invalid():
+    with pytest.raises(ValueError):
+        polygon_detail.get_detail('extreme', 'medium')
+
+
+def test_simplify__fewer_points_at_lower_detail():
+    geometry = MultiPolygon(circle(0, 0, 1, 2000), srid=4326)
+    point_counts = [polygon_detail.simplify(geometry, tolerance).num_points for tolerance in polygon_detail.DETAIL_TOLERANCES.values()]
+    assert point_counts == sorted(point_counts) and point_counts[-1] < geometry.num_points
+    assert isinstance(polygon_detail.simplify(geometry, 0.1), MultiPolygon)
+
+
+@pytest.mark.django_db
+def test_get_simplified_geometries__built_once(detailed_ahj, django_assert_num_queries):
+    polygon_id = detailed_ahj.PolygonID_id
+    geometry = polygon_detail.get_simplified_geometries([polygon_id], 'low')[polygon_id]
+    assert PolygonSimplification.objects.filter(PolygonID=polygon_id).count() == len(polygon_detail.DETAIL_TOLERANCES)
+    with django_assert_num_queries(1):
+        assert polygon_detail.get_simplified_geometries([polygon_id], 'low')[polygon_id].num_points == geometry.num_points
+
+
+@pytest.mark.django_db
+def test_polygon_simplifications__deleted_when_polygon_saved(detailed_ahj):
+    polygon_detail.get_simplified_geometries([detailed_ahj.PolygonID_id], 'low')
+    detailed_ahj.PolygonID.save()
+    assert not PolygonSimplification.objects.filter(PolygonID=detailed_ahj.PolygonID_id).exists()
+
+
+@pytest.mark.django_db
+def test_ahj_serializer__polygon_detail(detailed_ahj):
+    def serialize(detail):
+        return AHJSerializer(AHJ.objects.get(AHJPK=detailed_ahj.AHJPK), context={'polygon_detail': detail}).data['Polygon']
+    assert serialize('none') is None
+    assert count_points(serialize('low')['geometry']) < count_points(serialize('full')['geometry'])
+    assert serialize('low')['properties'] == serialize('full')['properties']
+
+
+@pytest.mark.parametrize(
+    'params, status_code', [
+        ({}, 200),
+        ({'detail': 'high'}, 200),
+        ({'detail': 'extreme'}, 400)
+    ]
+)
+@pytest.mark.django_db
+def test_data_map_get_polygon__detail(params, status_code, detailed_ahj, client_with_webpage_credentials):
+    response = client_with_webpage_credentials.get(reverse('data-map-polygon'), {'PolygonID': detailed_ahj.PolygonID_id, **params})
+    assert response.status_code == status_code
+    if status_code == 200:
+        assert count_points(response.data['geometry']) < detailed_ahj.PolygonID.Polygon.num_points
+
+
+@pytest.mark.django_db
+def test_get_single_ahj__no_polygon(detailed_ahj, client_with_webpage_credentials):
+    response = client_with_webpage_credentials.get(reverse('single_ahj'), {'AHJPK': detailed_ahj.AHJPK, 'detail': 'none'})
+    assert response.status_code == 200
+    assert response.data['Polygon'] is None
@@ -0,0 +1,66 @@
+from django.contrib.gis.geos import MultiPolygon
+from django.contrib.gis.geos import Polygon as geosPolygon
+from ahj_app.models import *
+from ahj_app.polygon_hierarchy import get_polygon_ids_containing, rebuild_polygon_hierarchy
+from ahj_app.utils import filter_ahjs, get_str_location
+from fixtures import *
+import pytest
+import uuid
+
+
+def create_polygon(bbox):
+    return Polygon.objects.create(Polygon=MultiPolygon(geosPolygon.from_bbox(bbox)), LandArea=1, WaterArea=1,
+                                  InternalPLatitude=0, InternalPLongitude=0)
+
+
+@pytest.fixture
+def polygons(db):
+    """
+    A state with two counties leaving its top right corner uncovered,
+    a city across both counties, and a city in the uncovered corner.
+    """
+    state = StatePolygon.objects.create(PolygonID=create_polygon((0, 0, 4, 4)), FIPSCode='01')
+    polygons = {'state': state.PolygonID}
+    for name, bbox in [('county_a', (0, 0, 2, 4)), ('county_b', (2, 0, 4, 3))]:
+        polygons[name] = CountyPolygon.objects.create(PolygonID=create_polygon(bbox), StatePolygonID=state).PolygonID
+    for name, bbox in [('city_across', (1, 1, 3, 2)), ('city_outside', (2.5, 3.2, 3, 3.8))]:
+        polygons[name] = CityPolygon.objects.create(PolygonID=create_polygon(bbox), StatePolygonID=state).PolygonID
+    for polygon in polygons.values():
+        AHJ.objects.create(AHJID=uuid.uuid4(), PolygonID=polygon)
+    rebuild_polygon_hierarchy()
+    return polygons
+
+
+@pytest.mark.django_db
+def test_rebuild_polygon_hierarchy(polygons):
+    ratios = {(row.ParentPolygonID_id, row.ChildPolygonID_id): row.OverlapRatio for row in PolygonHierarchy.objects.all()}
+    ids = {name: polygon.PolygonID for name, polygon in polygons.items()}
+    assert ratios == pytest.approx({
+        (ids['state'], ids['county_a']): 1.0,
+        (ids['state'], ids['county_b']): 1.0,
+        (ids['county_a'], ids['city_across']): 0.5,
+        (ids['county_b'], ids['city_across']): 0.5,
+        (ids['state'], ids['city_outside']): 1.0
+    })
+
+
+@pytest.mark.parametrize(
+    'lng, lat, expected_names', [
+        (1.5, 1.5, ['state', 'county_a', 'city_across']),
+        (2.5, 1.5, ['state', 'county_b', 'city_across']),
+        (2.7, 3.5, ['state', 'city_outside']),
+        (5, 5, [])
+    ]
+)
+@pytest.mark.django_db
+def test_get_polygon_ids_containing(lng, lat, expected_names, polygons):
+    assert get_polygon_ids_containing(lng, lat) == {polygons[name].PolygonID for name in expected_names}
+
+
+@pytest.mark.django_db
+def test_filter_ahjs__polygon_hierarchy(polygons, settings):
+    location = get_str_location({'Longitude': {'Value': 2.5}, 'Latitude': {'Value': 1.5}})
+    expected = {ahj.AHJPK for ahj in filter_ahjs(location=location)}
+    settings.POLYGON_HIERARCHY_ENABLED = True
+    assert {ahj.AHJPK for ahj in filter_ahjs(location=location)} == expected
+    assert len(expected) == 3
@@ -0,0 +1,137 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ahj_app.models import *
+from ahj_app import enum_registry
+from ahj_app.prefetch import prefetch_ahj_children, prefetch_comment_threads
+from ahj_app.serializers import AHJSerializer, CommentSerializer
+from fixtures import *
+import pytest
+
+
+def create_ahj_with_children(create_minimal_obj, document_submission_method, permit_issue_method):
+    ahj = create_minimal_obj('AHJ')
+    Contact.objects.create(ParentTable='AHJ', ParentID=ahj.AHJPK, ContactStatus=True, FirstName='Confirmed',
+                           AddressID=Address.objects.create(LocationID=Location.objects.create()))
+    Contact.objects.create(ParentTable='AHJ', ParentID=ahj.AHJPK, ContactStatus=None, FirstName='Unconfirmed')
+    inspection = AHJInspection.objects.create(AHJPK=ahj, AHJInspectionName='Inspection' + str(ahj.AHJPK), InspectionStatus=True)
+    Contact.objects.create(ParentTable='AHJInspection', ParentID=inspection.InspectionID, ContactStatus=True)
+    AHJDocumentSubmissionMethodUse.objects.create(AHJPK=ahj, DocumentSubmissionMethodID=document_submission_method, MethodStatus=True)
+    AHJPermitIssueMethodUse.objects.create(AHJPK=ahj, PermitIssueMethodID=permit_issue_method, MethodStatus=None)
+    EngineeringReviewRequirement.objects.create(AHJPK=ahj, EngineeringReviewRequirementStatus=True)
+    FeeStructure.objects.create(AHJPK=ahj, FeeStructureName='FeeStructure' + str(ahj.AHJPK), FeeStructureStatus=True)
+    return AHJ.objects.get(AHJPK=ahj.AHJPK)
+
+
+@pytest.fixture
+def ahjs_with_children(create_minimal_obj):
+    dsm = DocumentSubmissionMethod.objects.create(Value='SolarApp')
+    pim = PermitIssueMethod.objects.create(Value='SolarApp')
+    return [create_ahj_with_children(create_minimal_obj, dsm, pim) for i in range(3)]
+
+
+@pytest.mark.parametrize(
+    'getter', [
+        'get_contacts', 'get_unconfirmed', 'get_comments', 'get_inspections', 'get_unconfirmed_inspections',
+        'get_document_submission_methods', 'get_uncon_dsm', 'get_permit_submission_methods', 'get_uncon_pim',
+        'get_err', 'get_uncon_err', 'get_fee_structures', 'get_uncon_fs'
+    ]
+)
+@pytest.mark.django_db
+def test_prefetch_ahj_children__matches_getters(getter, ahjs_with_children):
+    prefetched_ahjs = prefetch_ahj_children([AHJ.objects.get(AHJPK=ahj.AHJPK) for ahj in ahjs_with_children])
+    for ahj, prefetched_ahj in zip(ahjs_with_children, prefetched_ahjs):
+        assert getattr(prefetched_ahj, getter)() == getattr(ahj, getter)()
+
+
+@pytest.mark.django_db
+def test_prefetch_ahj_children__inspection_contacts(ahjs_with_children):
+    prefetched_ahjs = prefetch_ahj_children(list(AHJ.objects.filter(AHJPK__in=[ahj.AHJPK for ahj in ahjs_with_children])))
+    for prefetched_ahj in prefetched_ahjs:
+        for inspection in prefetched_ahj.get_inspections():
+            fresh_inspection = AHJInspection.objects.get(InspectionID=inspection.InspectionID)
+            assert inspection.get_contacts() == fresh_inspection.get_contacts()
+
+
+@pytest.mark.parametrize(
+    'is_public_view', [
+        True,
+        False
+    ]
+)
+@pytest.mark.django_db
+def test_ahj_serializer__same_output_and_queries_for_any_page_size(is_public_view, ahjs_with_children):
+    context = {'is_public_view': is_public_view}
+    enum_registry.load()
+    one_ahj = list(AHJ.objects.filter(AHJPK=ahjs_with_children[0].AHJPK))
+    with CaptureQueriesContext(connection) as one_ahj_queries:
+        one_ahj_data = AHJSerializer(one_ahj, many=True, context=context).data
+    all_ahjs = list(AHJ.objects.filter(AHJPK__in=[ahj.AHJPK for ahj in ahjs_with_children]).order_by('AHJPK'))
+    with CaptureQueriesContext(connection) as all_ahjs_queries:
+        all_ahjs_data = AHJSerializer(all_ahjs, many=True, context=context).data
+    assert len(one_ahj_queries) == len(all_ahjs_queries)
+    assert all_ahjs_data[0] == one_ahj_data[0]
+    for ahj, ahj_data in zip(ahjs_with_children, all_ahjs_data):
+        assert ahj_data == AHJSerializer(AHJ.objects.get(AHJPK=ahj.AHJPK), context=context).data
+
+
+def create_comment_thread(ahj, users, depth, replies_per_comment):
+    """
+    Creates a comment on the AHJ with replies_per_comment replies
+    to it and to each of its replies, down to depth levels.
+    """
+    comment = Comment.objects.create(UserID=users[0], AHJPK=ahj.AHJPK, CommentText='Comment')
+    level = [comment]
+    for i in range(depth):
+        level = [Comment.objects.create(UserID=users[j % len(users)], ReplyingTo=parent.CommentID, CommentText='Reply')
+                 for parent in level for j in range(replies_per_comment)]
+    return comment
+
+
+@pytest.fixture
+def commenting_users(create_user, create_minimal_obj):
+    users = [create_user() for i in range(2)]
+    ahj = create_minimal_obj('AHJ')
+    AHJUserMaintains.objects.create(AHJPK=ahj, UserID=users[0], MaintainerStatus=True)
+    APIToken.objects.create(user=users[1])
+    return users
+
+
+@pytest.mark.django_db
+def test_prefetch_comment_threads__matches_serializer(create_minimal_obj, commenting_users):
+    ahj = create_minimal_obj('AHJ')
+    comment = create_comment_thread(ahj, commenting_users, depth=3, replies_per_comment=2)
+    context = {'is_public_view': False}
+    expected = CommentSerializer(Comment.objects.get(CommentID=comment.CommentID), context=context).data
+    comments = [Comment.objects.get(CommentID=comment.CommentID)]
+    prefetch_comment_threads(comments)
+    enum_registry.load()
+    with CaptureQueriesContext(connection) as queries:
+        data = CommentSerializer(comments[0], context=context).data
+    assert data == expected
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_prefetch_comment_threads__queries_do_not_depend_on_thread_size(create_minimal_obj, commenting_users):
+    ahj = create_minimal_obj('AHJ')
+    small = create_comment_thread(ahj, commenting_users, depth=2, replies_per_comment=1)
+    large = create_comment_thread(ahj, commenting_users, depth=2, replies_per_comment=4)
+    query_counts = []
+    for comment in [small, large]:
+        with CaptureQueriesContext(connection) as queries:
+            prefetch_comment_threads([Comment.objects.get(CommentID=comment.CommentID)])
+        query_counts.append(len(queries))
+    assert query_counts[0] == query_counts[1]
+
+
+@pytest.mark.django_db
+def test_prefetch_comment_threads__limits(create_minimal_obj, commenting_users):
+    ahj = create_minimal_obj('AHJ')
+    comment = create_comment_thread(ahj, commenting_users, depth=3, replies_per_comment=3)
+    comments = [Comment.objects.get(CommentID=comment.CommentID)]
+    prefetch_comment_threads(comments, max_depth=2, max_replies=2)
+    data = CommentSerializer(comments[0]).data
+    assert data['ReplyCount'] == 3 and len(data['Replies']) == 2
+    reply = data['Replies'][0]
+    assert reply['ReplyCount'] == 3 and len(reply['Replies']) == 2
+    assert reply['Replies'][0]['ReplyCount'] == 3 and reply['Replies'][0]['Replies'] == []
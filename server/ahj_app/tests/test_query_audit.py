@@ -0,0 +1,19 @@
+from ahj_app.query_audit import audit_queries, get_full_scans, get_hot_queries
+from fixtures import *
+import pytest
+
+
+def test_get_full_scans():
+    plan = [{'table': 'AHJ', 'type': 'ALL', 'rows': 30000},
+            {'table': 'Address', 'type': 'eq_ref', 'rows': 1},
+            {'table': 'Edit', 'type': 'index', 'rows': 500},
+            {'table': '<derived2>', 'type': 'ALL', 'rows': 10},
+            {'table': None, 'type': None, 'rows': None}]
+    assert [row['table'] for row in get_full_scans(plan)] == ['AHJ', 'Edit']
+
+
+@pytest.mark.django_db
+def test_audit_queries():
+    results = audit_queries(repeat=1)
+    assert [result['name'] for result in results] == list(get_hot_queries())
+    assert all(result['seconds'] is not None for result in results)
@@ -0,0 +1,71 @@
+from django.core.cache import caches
+from django.urls import reverse
+from ahj_app.models import *
+from ahj_app.response_cache import RESPONSE_CACHE_ALIAS, get_data_version, increment_data_version
+from fixtures import *
+import pytest
+import uuid
+
+
+@pytest.fixture
+def response_cache(settings):
+    settings.AHJ_RESPONSE_CACHE_ENABLED = True
+    cache = caches[RESPONSE_CACHE_ALIAS]
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_get_single_ahj__cached_until_data_version_changes(ahj_obj, response_cache, client_with_credentials):
+    url = reverse('single_ahj')
+    response = client_with_credentials.get(url, {'AHJPK': ahj_obj.AHJPK})
+    assert response.status_code == 200 and response['ETag']
+    # QuerySet.update does not bump the data version
+    AHJ.objects.filter(AHJPK=ahj_obj.AHJPK).update(AHJName='Changed')
+    cached = client_with_credentials.get(url, {'AHJPK': ahj_obj.AHJPK})
+    assert cached.data == response.data and cached['ETag'] == response['ETag']
+    increment_data_version()
+    response = client_with_credentials.get(url, {'AHJPK': ahj_obj.AHJPK})
+    assert response.data['AHJName']['Value'] == 'Changed' and response['ETag'] != cached['ETag']
+
+
+@pytest.mark.django_db
+def test_get_single_ahj__if_none_match(ahj_obj, response_cache, client_with_credentials):
+    url = reverse('single_ahj')
+    etag = client_with_credentials.get(url, {'AHJPK': ahj_obj.AHJPK})['ETag']
+    response = client_with_credentials.get(url, {'AHJPK': ahj_obj.AHJPK}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304 and response['ETag'] == etag
+    increment_data_version()
+    response = client_with_credentials.get(url, {'AHJPK': ahj_obj.AHJPK}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_get_single_ahj__errors_not_cached(ahj_obj, response_cache, client_with_credentials):
+    url = reverse('single_ahj')
+    response = client_with_credentials.get(url, {'AHJPK': ahj_obj.AHJPK + 1})
+    assert response.status_code == 400 and not response.has_header('ETag')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_data_version__bumped_by_ahj_changes(document_signals):
+    version = get_data_version()
+    ahj = AHJ.objects.create(AHJID=uuid.uuid4())
+    assert get_data_version() > version
+    version = get_data_version()
+    ahj.AHJName = 'Changed'
+    ahj.save()
+    assert get_data_version() > version
+
+
+@pytest.mark.django_db(transaction=True)
+def test_data_version__private_changes_keep_public_version(document_signals, create_user):
+    ahj = AHJ.objects.create(AHJID=uuid.uuid4())
+    user = create_user()
+    version, public_version = get_data_version(), get_data_version(is_public_view=True)
+    Comment.objects.create(UserID=user, AHJPK=ahj.AHJPK, CommentText='Comment')
+    assert get_data_version() > version and get_data_version(is_public_view=True) == public_version
+    ahj.AHJName = 'Changed'
+    ahj.save()
+    assert get_data_version(is_public_view=True) > public_version
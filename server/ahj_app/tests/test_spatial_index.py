@@ -0,0 +1,67 @@
+from django.contrib.gis.geos import Polygon as geosPolygon
+from ahj_app import spatial_index
+from ahj_app.models import Polygon
+from ahj_app.spatial_index import IndexedPolygon, PolygonIndex, STRtree
+from fixtures import *
+import pytest
+import random
+
+
+@pytest.mark.parametrize(
+    'num_items', [
+        0,
+        1,
+        10,
+        11,
+        500
+    ]
+)
+def test_str_tree__query_point_matches_brute_force(num_items):
+    rand = random.Random(num_items)
+    items = []
+    for i in range(num_items):
+        x, y = rand.uniform(-180, 170), rand.uniform(-90, 80)
+        items.append(((x, y, x + rand.uniform(0, 10), y + rand.uniform(0, 10)), i))
+    tree = STRtree(items)
+    assert tree.size == num_items
+    for i in range(100):
+        x, y = rand.uniform(-180, 180), rand.uniform(-90, 90)
+        expected = [item for (xmin, ymin, xmax, ymax), item in items if xmin <= x <= xmax and ymin <= y <= ymax]
+        assert sorted(tree.query_point(x, y)) == sorted(expected)
+
+
+def square(x, y, size):
+    return geosPolygon(((x, y), (x, y + size), (x + size, y + size), (x + size, y), (x, y)))
+
+
+def test_polygon_index__only_polygons_in_containing_states():
+    polygon_index = PolygonIndex([
+        IndexedPolygon(1, None, square(0, 0, 10)),
+        IndexedPolygon(2, 1, square(0, 0, 5)),
+        IndexedPolygon(3, 1, square(5, 5, 5)),
+        IndexedPolygon(4, None, square(20, 20, 10)),
+        IndexedPolygon(5, 4, square(0, 0, 5))  # A polygon outside of its state
+    ])
+    assert polygon_index.get_polygon_ids_containing(2, 2) == {1, 2}
+    assert polygon_index.get_polygon_ids_containing(7, 7) == {1, 3}
+    assert polygon_index.get_polygon_ids_containing(25, 25) == {4}
+    assert polygon_index.get_polygon_ids_containing(50, 50) == set()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_polygon_index__reloaded_when_polygons_change(settings, monkeypatch):
+    settings.SPATIAL_INDEX_ENABLED = True
+    settings.SPATIAL_INDEX_CHECK_INTERVAL_SECONDS = 0
+    spatial_index.connect_signals()
+    reloads = []
+    monkeypatch.setattr(spatial_index, 'load_polygon_index_in_background', lambda: reloads.append(True))
+    try:
+        polygon_index = spatial_index.load_polygon_index()
+        assert spatial_index.get_polygon_index() is polygon_index and reloads == []
+        Polygon.objects.create(Name='Polygon', GEOID='1', Polygon=MultiPolygon(square(0, 0, 10)), LandArea=1, WaterArea=0,
+                               InternalPLatitude=5, InternalPLongitude=5)
+        spatial_index.get_polygon_index()
+        assert reloads == [True]
+    finally:
+        spatial_index.disconnect_signals()
+        spatial_index.clear_polygon_index()
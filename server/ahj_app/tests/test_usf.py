@@ -0,0 +1,147 @@
+from django.contrib.gis.geos import MultiPolygon
+from django.contrib.gis.geos import Polygon as geosPolygon
+from ahj_app.models import *
+from ahj_app.usf import add_enum_values, get_polygon_fields, load_ahj_data_csv, pair_ahjs_to_polygons, translate_polygons
+from fixtures import *
+import csv
+import pytest
+import uuid
+
+
+def create_temp_row(model, GEOID, NAME, **kwargs):
+    mpoly = MultiPolygon(geosPolygon(((0, 0), (0, 1), (1, 1), (0, 0))))
+    return model.objects.create(GEOID=GEOID, NAME=NAME, ALAND=1, AWATER=1, INTPTLAT='+40.0000000', INTPTLON='-111.0000000',
+                                mpoly=mpoly, **kwargs)
+
+
+@pytest.fixture
+def temp_rows():
+    create_temp_row(StateTemp, '49', 'Utah')
+    create_temp_row(StateTemp, '06', 'California')
+    for GEOID, NAME in [('49035', 'Salt Lake'), ('06085', 'Santa Clara'), ('49049', 'Utah')]:
+        create_temp_row(CountyTemp, GEOID, NAME, STATEFP=GEOID[:2], NAMELSAD=NAME + ' County')
+
+
+def assert_translated():
+    assert {state.FIPSCode for state in StatePolygon.objects.all()} == {'49', '06'}
+    counties = CountyPolygon.objects.select_related('PolygonID', 'StatePolygonID')
+    assert {(county.PolygonID.GEOID, county.StatePolygonID.FIPSCode, county.LSAreaCodeName) for county in counties} == \
+           {('49035', '49', 'Salt Lake County'), ('06085', '06', 'Santa Clara County'), ('49049', '49', 'Utah County')}
+    assert Polygon.objects.count() == 5
+    assert Polygon.history.count() == 5 and CountyPolygon.history.count() == 3
+
+
+@pytest.mark.django_db
+def test_translate_polygons(temp_rows):
+    report = translate_polygons(layers=['states', 'counties'], chunk_size=2)
+    assert report['states'][0] == 2 and report['counties'][0] == 3
+    assert_translated()
+
+
+@pytest.mark.django_db
+def test_translate_polygons__resumes(temp_rows):
+    translate_polygons(layers=['states'])
+    polygon = Polygon.objects.create(**get_polygon_fields(CountyTemp.objects.get(GEOID='49035')))
+    CountyPolygon.objects.create(PolygonID=polygon, StatePolygonID=StatePolygon.objects.get(FIPSCode='49'), LSAreaCodeName='Salt Lake County')
+    report = translate_polygons(layers=['counties'])
+    assert report['counties'][0] == 2
+    assert CountyPolygon.objects.filter(PolygonID__GEOID='49035').count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_translate_polygons__parallel(temp_rows):
+    translate_polygons(layers=['states', 'counties'], workers=2, chunk_size=1)
+    assert_translated()
+
+
+
+def create_polygon(model, GEOID, Name, **kwargs):
+    polygon = Polygon.objects.create(Name=Name, GEOID=GEOID, Polygon=MultiPolygon(geosPolygon(((0, 0), (0, 1), (1, 1), (0, 0)))),
+                                     LandArea=1, WaterArea=1, InternalPLatitude=0, InternalPLongitude=0)
+    return model.objects.create(PolygonID=polygon, **kwargs)
+
+
+def create_ahj(AHJName, StateProvince):
+    return AHJ.objects.create(AHJID=uuid.uuid4(), AHJName=AHJName, AddressID=Address.objects.create(StateProvince=StateProvince))
+
+
+@pytest.fixture
+def polygons():
+    utah = create_polygon(StatePolygon, '49', 'Utah', FIPSCode='49')
+    california = create_polygon(StatePolygon, '06', 'California', FIPSCode='06')
+    return {
+        'Utah': utah,
+        'Salt Lake County': create_polygon(CountyPolygon, '49035', 'Salt Lake', StatePolygonID=utah, LSAreaCodeName='Salt Lake County'),
+        'Salt Lake City': create_polygon(CityPolygon, '4967000', 'Salt Lake City', StatePolygonID=utah, LSAreaCodeName='Salt Lake City'),
+        'Salt Lake City CA': create_polygon(CityPolygon, '0667000', 'Salt Lake City', StatePolygonID=california, LSAreaCodeName='Salt Lake City')
+    }
+
+
+@pytest.mark.django_db
+def test_pair_ahjs_to_polygons(polygons, django_assert_max_num_queries):
+    utah = create_ahj('Utah state', 'UT')
+    county = create_ahj('Salt Lake County', 'UT')
+    city = create_ahj('SALT LAKE CITY', 'UT')
+    unmatched = create_ahj('Nowhere', 'UT')
+    unknown_state = create_ahj('Salt Lake City', 'Utah')
+    report = pair_ahjs_to_polygons()
+    assert report['paired'] == 3 and report['changed'] == 3
+    assert report['unmatched'] == [(unmatched.AHJPK, 'Nowhere', 'UT'), (unknown_state.AHJPK, 'Salt Lake City', 'Utah')]
+    for ahj, name in [(utah, 'Utah'), (county, 'Salt Lake County'), (city, 'Salt Lake City')]:
+        assert AHJ.objects.get(AHJPK=ahj.AHJPK).PolygonID_id == polygons[name].PolygonID_id
+    assert AHJ.history.filter(AHJPK=city.AHJPK).latest().PolygonID_id == polygons['Salt Lake City'].PolygonID_id
+    with django_assert_max_num_queries(5):
+        assert pair_ahjs_to_polygons()['changed'] == 0
+
+
+AHJ_DATA_CSV_ROWS = [
+    {'AHJID.Value': 'a1', 'AHJName.Value': 'Salt Lake County', 'AHJLevelCode.Value': '50', 'BuildingCode.Value': '2021IBC',
+     'DataSourceComments.Value': 'From the county website', 'Address.StateProvince.Value': 'UT',
+     'Address.Location.Description.Value': 'Office', 'Contacts[0].FirstName.Value': 'Ann',
+     'Contacts[0].Address.City.Value': 'Salt Lake City', 'DocumentSubmissionMethods[0].Value': 'Email',
+     'DocumentSubmissionMethods[1].Value': 'InPerson'},
+    {'AHJID.Value': 'a2', 'AHJName.Value': 'Utah County', 'AHJLevelCode.Value': '050', 'Address.StateProvince.Value': 'UT'},
+    {'AHJID.Value': 'a3', 'AHJName.Value': 'Santa Clara County', 'AHJLevelCode.Value': '050', 'Address.StateProvince.Value': 'CA',
+     'Contacts[0].FirstName.Value': 'Bob'}
+]
+
+
+@pytest.fixture
+def ahj_data_csv(tmp_path, create_user, settings):
+    settings.ADMIN_ACCOUNT_EMAIL = create_user().Email
+    add_enum_values()
+    path = tmp_path / 'ahjregistrydata.csv'
+    fieldnames = sorted({field for row in AHJ_DATA_CSV_ROWS for field in row})
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(AHJ_DATA_CSV_ROWS)
+    return str(path)
+
+
+def assert_ahj_data_loaded():
+    ahjs = {ahj.AHJID: ahj for ahj in AHJ.objects.select_related('AddressID__LocationID', 'AHJLevelCode', 'BuildingCode')}
+    assert set(ahjs) == {'a1', 'a2', 'a3'}
+    assert ahjs['a1'].AHJLevelCode.Value == '050' and ahjs['a1'].BuildingCode.Value == '2021IBC'
+    assert ahjs['a1'].AddressID.StateProvince == 'UT' and ahjs['a1'].AddressID.LocationID.Description == 'Office'
+    assert ahjs['a2'].AddressID.LocationID is None
+    contacts = {contact.FirstName: contact for contact in Contact.objects.select_related('AddressID')}
+    assert contacts['Ann'].ParentID == ahjs['a1'].AHJPK and contacts['Ann'].AddressID.City == 'Salt Lake City'
+    assert contacts['Bob'].ParentID == ahjs['a3'].AHJPK and contacts['Bob'].ContactStatus is True
+    assert {use.DocumentSubmissionMethodID.Value for use in AHJDocumentSubmissionMethodUse.objects.filter(AHJPK=ahjs['a1'])} == {'Email', 'InPerson'}
+    edit = Edit.objects.get()
+    assert (edit.AHJPK_id, edit.SourceColumn, edit.NewValue, edit.DataSourceComment) == \
+           (ahjs['a1'].AHJPK, 'BuildingCode', '2021IBC', 'From the county website')
+    assert AHJ.history.count() == 3 and Address.history.count() == 5
+
+
+@pytest.mark.django_db
+def test_load_ahj_data_csv(ahj_data_csv):
+    assert load_ahj_data_csv(path=ahj_data_csv, chunk_size=2) == 3
+    assert_ahj_data_loaded()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_ahj_data_csv__parallel(ahj_data_csv):
+    assert load_ahj_data_csv(path=ahj_data_csv, workers=2) == 3
+    assert_ahj_data_loaded()
@@ -124,6 +124,7 @@ def test_get_str_address__empty_input():
        )
    ]
 )
+@pytest.mark.django_db
 def test_get_location_gecode_address_str(address, expected_output):
     location = get_location_gecode_address_str(address)
     if location['Latitude']['Value'] is not None and location['Longitude']['Value'] is not None:
@@ -335,6 +336,27 @@ def test_filter_ahjs__search_filters_and_location(ahj_filter_ahjs, ahj_filter_lo
     assert len(ahj_list) == 1
     assert ahj_list[0].AHJPK == 3
 
+@pytest.mark.parametrize(
+    'location', [
+        'POINT(25.0, 25.0)',
+        'POINT(5.0, 5.0)',
+        'POINT(105.0, 105.0)',
+        'POINT(50.0, 50.0)'
+    ]
+)
+@pytest.mark.django_db
+def test_filter_ahjs__location_search_with_spatial_index(location, ahj_filter_ahjs):
+    sql_ahjpks = sorted(ahj.AHJPK for ahj in filter_ahjs(location=location))
+    spatial_index.load_polygon_index()
+    try:
+        indexed_ahjpks = sorted(ahj.AHJPK for ahj in filter_ahjs(location=location))
+    finally:
+        spatial_index.clear_polygon_index()
+    assert indexed_ahjpks == sql_ahjpks
+
+def test_parse_str_location():
+    assert parse_str_location(get_str_location({'Longitude': {'Value': -121.5}, 'Latitude': {'Value': 38.25}})) == (-121.5, 38.25)
+
 
 @pytest.mark.django_db
 def test_filter_dict_keys():
@@ -0,0 +1,147 @@
+from django.contrib.gis.geos import MultiPolygon
+from django.contrib.gis.geos import Polygon as geosPolygon
+from django.urls import reverse
+from ahj_app.models import *
+from ahj_app import vector_tiles
+from fixtures import *
+import os
+import pytest
+import uuid
+
+
+def read_varint(data, i):
+    value, shift = 0, 0
+    while True:
+        byte = data[i]
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        i += 1
+        if byte < 0x80:
+            return value, i
+
+
+def read_message(data):
+    fields = []
+    i = 0
+    while i < len(data):
+        key, i = read_varint(data, i)
+        if key & 7 == 0:
+            value, i = read_varint(data, i)
+        else:
+            length, i = read_varint(data, i)
+            value, i = data[i:i + length], i + length
+        fields.append((key >> 3, value))
+    return fields
+
+
+def read_packed(data):
+    values, i = [], 0
+    while i < len(data):
+        value, i = read_varint(data, i)
+        values.append(value)
+    return values
+
+
+def decode_tile(tile):
+    """
+    Returns a dict of each layer's name to the properties of its features.
+    """
+    layers = {}
+    for _, layer_data in read_message(tile):
+        layer = read_message(layer_data)
+        keys = [value.decode() for field, value in layer if field == 3]
+        values = []
+        for field, value in layer:
+            if field == 4:
+                value_field, value = read_message(value)[0]
+                values.append(value.decode() if value_field == 1 else value)
+        features = []
+        for field, feature_data in layer:
+            if field == 2:
+                feature = dict(read_message(feature_data))
+                tags = read_packed(feature[2])
+                assert feature[3] == 3 and len(read_packed(feature[4])) > 0
+                features.append({keys[tags[i]]: values[tags[i + 1]] for i in range(0, len(tags), 2)})
+        layers[dict(layer)[1].decode()] = features
+    return layers
+
+
+def create_polygon(model, Name, bbox, **kwargs):
+    polygon = Polygon.objects.create(Name=Name, GEOID='', Polygon=MultiPolygon(geosPolygon.from_bbox(bbox), srid=4326),
+                                     LandArea=1, WaterArea=1, InternalPLatitude=0, InternalPLongitude=0)
+    return model.objects.create(PolygonID=polygon, **kwargs)
+
+
+@pytest.fixture
+def tile_polygons():
+    utah = create_polygon(StatePolygon, 'Utah', (-114, 37, -109, 42), FIPSCode='49')
+    county = create_polygon(CountyPolygon, 'Salt Lake', (-112.2, 40.4, -111.5, 40.9), StatePolygonID=utah, LSAreaCodeName='Salt Lake County')
+    ahj = AHJ.objects.create(AHJID=uuid.uuid4(), AHJName='Salt Lake County', PolygonID=county.PolygonID)
+    return {'state': utah, 'county': county, 'ahj': ahj}
+
+
+@pytest.fixture
+def tile_cache_dir(settings, tmp_path):
+    settings.VECTOR_TILE_CACHE_DIR = str(tmp_path)
+    return tmp_path
+
+
+"""
+Salt Lake County at zoom 5
+"""
+COUNTY_TILE = (5, 6, 12)
+
+
+@pytest.mark.parametrize(
+    'z, x, y, expected_output', [
+        (0, 0, 0, True),
+        (16, 65535, 65535, True),
+        (17, 0, 0, False),
+        (2, 4, 0, False),
+        (2, 0, -1, False)
+    ]
+)
+def test_is_valid_tile(z, x, y, expected_output):
+    assert vector_tiles.is_valid_tile(z, x, y) == expected_output
+
+
+@pytest.mark.django_db
+def test_render_tile__layers_by_zoom(tile_polygons):
+    assert list(decode_tile(vector_tiles.render_tile(0, 0, 0))) == ['state']
+    layers = decode_tile(vector_tiles.render_tile(*COUNTY_TILE))
+    assert layers['state'][0]['numAHJs'] == 1
+    county = layers['county'][0]
+    assert county['AHJPK'] == tile_polygons['ahj'].AHJPK and county['Name'] == 'Salt Lake'
+    assert county['numBuildingCodes'] == 0
+
+
+@pytest.mark.django_db
+def test_render_tile__outside_polygons(tile_polygons):
+    assert vector_tiles.render_tile(5, 0, 0) == b''
+
+
+@pytest.mark.django_db
+def test_get_tile__cached_until_ahj_changes(tile_polygons, tile_cache_dir):
+    path = os.path.join(tile_cache_dir, '5', '6', '12.mvt')
+    tile = vector_tiles.get_tile(*COUNTY_TILE)
+    vector_tiles.get_tile(5, 0, 0)
+    assert open(path, 'rb').read() == tile
+    tile_polygons['ahj'].AHJName = 'Salt Lake'
+    tile_polygons['ahj'].save()
+    assert not os.path.exists(path)
+    assert os.path.exists(os.path.join(tile_cache_dir, '5', '0', '0.mvt'))
+
+
+@pytest.mark.django_db
+def test_vector_tile(tile_polygons, tile_cache_dir, client_with_webpage_credentials):
+    z, x, y = COUNTY_TILE
+    response = client_with_webpage_credentials.get(reverse('vector-tile', kwargs={'z': z, 'x': x, 'y': y}))
+    assert response.status_code == 200
+    assert response['Content-Type'] == vector_tiles.MVT_CONTENT_TYPE
+    assert 'county' in decode_tile(response.content)
+
+
+@pytest.mark.django_db
+def test_vector_tile__invalid_tile(client_with_webpage_credentials):
+    response = client_with_webpage_credentials.get(reverse('vector-tile', kwargs={'z': 1, 'x': 2, 'y': 0}))
+    assert response.status_code == 404
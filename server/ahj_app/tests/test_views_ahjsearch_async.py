@@ -0,0 +1,45 @@
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from ahj_app import geocoding
+from ahj_app.models import GeocodeCache
+from fixtures import *
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def stub_geocoder(settings):
+    settings.GEOCODER = 'stub'
+    geocoding.reset_geocode_cache_stats()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_geocode_address_async():
+    assert async_to_sync(geocoding.geocode_address_async)('40.76, -111.89') == (40.76, -111.89)
+    assert async_to_sync(geocoding.geocode_address_async)('40.76 -111.89') == (40.76, -111.89)
+    assert async_to_sync(geocoding.geocode_address_async)('112 Baker St') is None
+    stats = geocoding.get_geocode_cache_stats()
+    assert stats['hits'] == 1 and stats['misses'] == 2
+    assert GeocodeCache.objects.count() == 2
+
+
+@pytest.mark.parametrize(
+    'url_name, async_url_name, data', [
+        ('ahj-geo-address', 'ahj-geo-address-async', {'Address': {'AddrLine1': {'Value': '40.76, -111.89'}}}),
+        ('ahj-geo-address', 'ahj-geo-address-async', {'Address': {'AddrLine1': {'Value': ''}}}),
+        ('ahj-public', 'ahj-public-async', {'Address': {'AddrLine1': {'Value': '40.76, -111.89'}}}),
+        ('ahj-private', 'ahj-private-async', {'Address': '40.76, -111.89'})
+    ]
+)
+@pytest.mark.django_db(transaction=True)
+def test_async_views__match_sync_views(url_name, async_url_name, data, client_with_credentials):
+    response = client_with_credentials.post(reverse(async_url_name), data, format='json')
+    expected = client_with_credentials.post(reverse(url_name), data, format='json')
+    assert response.status_code == expected.status_code
+    assert response.json() == expected.json()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_ahj_geo_address_async__unauthenticated_not_geocoded(api_client):
+    response = api_client.post(reverse('ahj-geo-address-async'), {'Address': {'AddrLine1': {'Value': '40.76, -111.89'}}}, format='json')
+    assert response.status_code in (401, 403)
+    assert GeocodeCache.objects.count() == 0
@@ -1,12 +1,18 @@
 from django.urls import path, include
-from . import views_ahjsearch, views_ahjsearch_api, views_users, views_misc, views_edits, views_datavis
+from . import views_ahjsearch, views_ahjsearch_api, views_ahjsearch_async, views_users, views_misc, views_edits, views_datavis
 
 
 urlpatterns = [
     path('ahj/',                                 views_ahjsearch_api.ahj_list,                            name='ahj-public'),
+    path('ahj/async/',                           views_ahjsearch_async.ahj_list,                          name='ahj-public-async'),
+    path('ahj/export/',                          views_ahjsearch_api.ahj_export,                          name='ahj-export'),
     path('ahj-private/',                         views_ahjsearch.webpage_ahj_list,                        name='ahj-private'),
+    path('ahj-private/async/',                   views_ahjsearch_async.webpage_ahj_list,                  name='ahj-private-async'),
+    path('ahj-private/autocomplete/',            views_ahjsearch.ahj_autocomplete,                        name='ahj-autocomplete'),
     path('geo/address/',                         views_ahjsearch_api.ahj_geo_address,                     name='ahj-geo-address'),
+    path('geo/address/async/',                   views_ahjsearch_async.ahj_geo_address,                   name='ahj-geo-address-async'),
     path('geo/location/',                        views_ahjsearch_api.ahj_geo_location,                    name='ahj-geo-location'),
+    path('geo/location/batch/',                  views_ahjsearch_api.ahj_geo_location_batch,              name='ahj-geo-location-batch'),
     path('ahj-one/',                             views_ahjsearch.get_single_ahj,                          name='single_ahj'),
     path('ahj/set-maintainer/',                  views_users.set_ahj_maintainer,                          name='ahj-set-maintainer'),
     path('ahj/remove-maintainer/',               views_users.remove_ahj_maintainer,                       name='ahj-remove-maintainer'),
@@ -21,9 +27,11 @@ urlpatterns = [
     path('user/comments/',                       views_misc.user_comments,                                name='user-comments'),
     path('user/active/',                         views_users.get_active_user,                             name='active-user-info'),
     path('user-one/<str:username>/',             views_users.get_single_user,                             name='single-user-info'),
+    path('ahj/comment/replies/',                 views_misc.comment_replies,                              name='comment-replies'),
     path('ahj/comment/submit/',                  views_misc.comment_submit,                               name="comment-submit"),
     path('data-vis/data-map/',                   views_datavis.data_map,                                  name='data-map'),
     path('data-vis/data-map/polygon/',           views_datavis.data_map_get_polygon,                      name='data-map-polygon'),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt',    views_datavis.vector_tile,                               name='vector-tile'),
     path('contact/',                             views_misc.send_support_email,                           name='send-support-email'),
     path('auth/form-validator/',                 views_misc.form_validator,                               name='form-validator'),
     path('auth/users/reset_password_confirm/',   views_users.ConfirmPasswordReset.as_view({'post': 'reset_password_confirm'}),    name='confirm-reset-password'),
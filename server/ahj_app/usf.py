@@ -4,10 +4,24 @@ File of helper methods for uploading 2020 Census Bureau shapefile polygons and A
 
 import csv
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from django.contrib.gis.utils import LayerMapping
+from django.db import connection, transaction
+from django.db.models import Max
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 from .models import *
 from .models_field_enums import *
 from .utils import ENUM_FIELDS, get_enum_value_row
+from .coverage import rebuild_coverage
+from .documents import invalidate_ahj_documents, invalidate_all_ahj_documents
+from .geo_grid import rebuild_geo_grid
+from .polygon_hierarchy import rebuild_polygon_hierarchy
+from .spatial_index import bump_polygon_version
+from .vector_tiles import clear_tile_cache
+from . import enum_registry
 
 BASE_DIR = os.path.expanduser('~/AHJRegistryData/')
 BASE_DIR_SHP = BASE_DIR + '2020CensusPolygons/'
@@ -139,69 +153,171 @@ def get_state_polygon_type_fields(obj, polygon):
     }
 
 
-def get_other_polygon_type_fields(obj, polygon):
+def get_other_polygon_type_fields(obj, polygon, state_polygons):
+    """
+    state_polygons is a dict of FIPSCode to StatePolygon (see get_state_polygons_by_fips).
+    """
     return {
         'PolygonID': polygon,
-        'StatePolygonID': StatePolygon.objects.get(FIPSCode=obj.GEOID[:2]),
+        'StatePolygonID': state_polygons[obj.GEOID[:2]],
         'LSAreaCodeName': obj.NAMELSAD
     }
 
 
+def get_state_polygons_by_fips():
+    return {state.FIPSCode: state for state in StatePolygon.objects.all()}
+
+
 """
 Moves the shapefile data from the temporary tables (StateTemp, ...)
 to the Polygon tables (Polygon, StatePolygon, ...)
+
+The rows of a temporary table are translated in chunks. Each chunk's
+polygons and polygon type rows are inserted with bulk_create_with_history
+in one transaction, so an interrupted translation can be run again and
+continues with the rows not yet translated. Each layer can be translated
+by several threads, each translating the rows of one state at a time.
+NOTE: PolygonIDs are allocated by this process because MySQL does not return
+the primary keys of bulk inserted rows, so only one translation may run at a time.
 """
 
+POLYGON_LAYERS = OrderedDict([
+    ('states', (StateTemp, StatePolygon)),
+    ('counties', (CountyTemp, CountyPolygon)),
+    ('cities', (CityTemp, CityPolygon)),
+    ('countysubdivisions', (CousubTemp, CountySubdivisionPolygon))
+])
+
+TRANSLATE_CHUNK_SIZE = 200
+
+
+class PolygonIDAllocator:
+    """
+    Hands out unused PolygonIDs to the threads translating polygons.
+    """
+    def __init__(self):
+        self.next_id = (Polygon.objects.aggregate(max_id=Max('PolygonID'))['max_id'] or 0) + 1
+        self.lock = threading.Lock()
+
+    def allocate(self, count):
+        with self.lock:
+            first_id = self.next_id
+            self.next_id += count
+        return range(first_id, first_id + count)
+
+
+def get_translated_geoids(polygon_type_model, state_fips=None):
+    translated = polygon_type_model.objects.all()
+    if state_fips is not None:
+        translated = translated.filter(PolygonID__GEOID__startswith=state_fips)
+    return set(translated.values_list('PolygonID__GEOID', flat=True))
 
-def translate_polygons():
-    translate_states()
-    translate_counties()
-    translate_cities()
-    translate_countysubdivisions()
+
+def translate_chunk(temp_rows, polygon_type_model, allocator, state_polygons):
+    """
+    Inserts the polygons and polygon type rows of a list of temporary table rows.
+    """
+    polygon_ids = allocator.allocate(len(temp_rows))
+    polygons = [Polygon(PolygonID=polygon_id, **get_polygon_fields(row)) for polygon_id, row in zip(polygon_ids, temp_rows)]
+    if polygon_type_model is StatePolygon:
+        type_rows = [StatePolygon(**get_state_polygon_type_fields(row, polygon)) for row, polygon in zip(temp_rows, polygons)]
+    else:
+        type_rows = [polygon_type_model(**get_other_polygon_type_fields(row, polygon, state_polygons))
+                     for row, polygon in zip(temp_rows, polygons)]
+    with transaction.atomic():
+        bulk_create_with_history(polygons, Polygon)
+        bulk_create_with_history(type_rows, polygon_type_model)
+
+
+def translate_layer_rows(temp_model, polygon_type_model, allocator, state_polygons,
+                         state_fips=None, chunk_size=TRANSLATE_CHUNK_SIZE):
+    """
+    Translates the rows of a temporary table that were not translated yet,
+    limited to one state if state_fips is given. Returns the number of rows translated.
+    """
+    translated_geoids = get_translated_geoids(polygon_type_model, state_fips=state_fips)
+    temp_rows = temp_model.objects.order_by('pk')
+    if state_fips is not None:
+        temp_rows = temp_rows.filter(GEOID__startswith=state_fips)
+    count = 0
+    after_pk = 0
+    while True:
+        chunk = list(temp_rows.filter(pk__gt=after_pk)[:chunk_size])
+        if len(chunk) == 0:
+            return count
+        after_pk = chunk[-1].pk
+        chunk = [row for row in chunk if row.GEOID not in translated_geoids]
+        if len(chunk) != 0:
+            translate_chunk(chunk, polygon_type_model, allocator, state_polygons)
+            count += len(chunk)
+
+
+def translate_layer_rows_in_thread(*args, **kwargs):
+    try:
+        return translate_layer_rows(*args, **kwargs)
+    finally:
+        # Each thread opens its own database connection
+        connection.close()
+
+
+def translate_layer(layer, workers=1, chunk_size=TRANSLATE_CHUNK_SIZE, allocator=None):
+    """
+    Translates the rows of a layer of POLYGON_LAYERS not translated yet.
+    If workers is greater than 1, that many threads translate the layer one state at a time.
+    Returns the number of rows translated.
+    """
+    temp_model, polygon_type_model = POLYGON_LAYERS[layer]
+    allocator = allocator if allocator is not None else PolygonIDAllocator()
+    state_polygons = get_state_polygons_by_fips() if polygon_type_model is not StatePolygon else {}
+    if workers <= 1:
+        return translate_layer_rows(temp_model, polygon_type_model, allocator, state_polygons, chunk_size=chunk_size)
+    state_fips_codes = sorted({geoid[:2] for geoid in temp_model.objects.values_list('GEOID', flat=True)})
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = executor.map(lambda state_fips: translate_layer_rows_in_thread(temp_model, polygon_type_model, allocator, state_polygons,
+                                                                               state_fips=state_fips, chunk_size=chunk_size),
+                              state_fips_codes)
+        return sum(counts)
+
+
+def translate_polygons(layers=None, workers=1, chunk_size=TRANSLATE_CHUNK_SIZE):
+    """
+    Translates the given layers of POLYGON_LAYERS, or every layer, and prints the throughput of each.
+    States are always translated first because the other layers reference them.
+    Returns a dict of layer to (rows translated, seconds).
+    """
+    layers = [layer for layer in POLYGON_LAYERS if layers is None or layer in layers]
+    allocator = PolygonIDAllocator()
+    report = OrderedDict()
+    for layer in layers:
+        start = time.monotonic()
+        count = translate_layer(layer, workers=workers, chunk_size=chunk_size, allocator=allocator)
+        report[layer] = (count, time.monotonic() - start)
+    # bulk_create does not send the signals that recount the coverage and invalidate the cached tiles
+    if any(count != 0 for count, _ in report.values()):
+        rebuild_coverage()
+        clear_tile_cache()
+        rebuild_polygon_hierarchy()
+        rebuild_geo_grid()
+        bump_polygon_version()
+    for layer, (count, seconds) in report.items():
+        print('translate_polygons {0}: {1} rows in {2:.1f}s ({3:.1f} rows/s)'.format(layer, count, seconds, count / seconds if seconds > 0 else 0))
+    return report
 
 
 def translate_states():
-    states = StateTemp.objects.all()
-    count = states.count()
-    i = 0
-    for state in states:
-        polygon = Polygon.objects.create(**get_polygon_fields(state))
-        StatePolygon.objects.create(**get_state_polygon_type_fields(state, polygon))
-        print("pair_polygons_ahjs {1}: {0:.0%}".format(i/count, StateTemp.__name__))
-        i += 1
+    return translate_layer('states')
 
 
 def translate_counties():
-    counties = CountyTemp.objects.all()
-    count = counties.count()
-    i = 0
-    for county in counties:
-        polygon = Polygon.objects.create(**get_polygon_fields(county))
-        CountyPolygon.objects.create(**get_other_polygon_type_fields(county, polygon))
-        print("pair_polygons_ahjs {1}: {0:.0%}".format(i/count, CountyTemp.__name__))
-        i += 1
+    return translate_layer('counties')
 
 
 def translate_cities():
-    cities = CityTemp.objects.all()
-    count = cities.count()
-    i = 0
-    for city in cities:
-        polygon = Polygon.objects.create(**get_polygon_fields(city))
-        CityPolygon.objects.create(**get_other_polygon_type_fields(city, polygon))
-        print("pair_polygons_ahjs {1}: {0:.0%}".format(i/count, CityPolygon.__name__))
-        i += 1
+    return translate_layer('cities')
 
 
 def translate_countysubdivisions():
-    cousubs = CousubTemp.objects.all()
-    count = cousubs.count()
-    i = 0
-    for cousub in cousubs:
-        polygon = Polygon.objects.create(**get_polygon_fields(cousub))
-        CountySubdivisionPolygon.objects.create(**get_other_polygon_type_fields(cousub, polygon))
-        print("pair_polygons_ahjs {1}: {0:.0%}".format(i/count, CountySubdivisionPolygon.__name__))
-        i += 1
+    return translate_layer('countysubdivisions')
 
 
 def add_enum_values():
@@ -213,6 +329,8 @@ def add_enum_values():
         model.objects.all().delete()
         model.objects.bulk_create(list(map(lambda choice: model(Value=choice[0]),
                                            model._meta.get_field('Value').choices)))
+    # bulk_create does not send the signals that clear the enum registry
+    enum_registry.clear()
 
 
 def is_zero_depth_field(name):
@@ -268,26 +386,6 @@ def build_field_val_dict(row):
     return result
 
 
-def create_address(address_dict):
-    location_dict = address_dict.pop('Location', None)
-    if location_dict is not None:
-        address_dict['LocationID'] = create_location(location_dict)
-    return Address.objects.create(**address_dict)
-
-
-def create_location(location_dict):
-    return Location.objects.create(**location_dict)
-
-
-def create_contact(contact_dict):
-    address_dict = contact_dict.pop('Address', None)
-    if address_dict is not None:
-        contact_dict['AddressID'] = create_address(address_dict)
-    else:
-        contact_dict['AddressID'] = Address.objects.create()
-    return Contact.objects.create(**contact_dict)
-
-
 def enum_values_to_primary_key(ahj_dict):
     """
     Replace enum values in a dict with the row of the value in its enum model.
@@ -308,9 +406,9 @@ def enum_values_to_primary_key(ahj_dict):
     return ahj_dict
 
 
-def create_edit_objects(ahj_obj, field_string, userID, DSC, newVal):
+def get_edit_fields(ahj_obj, field_string, userID, DSC, newVal):
     """
-    Currently only creates edits for string fields on an AHJ.
+    Currently only builds edits for string fields on an AHJ.
     This is a helper for adding DataSourceComments.
     """
     edit_dict = {}
@@ -326,7 +424,7 @@ def create_edit_objects(ahj_obj, field_string, userID, DSC, newVal):
     edit_dict['ChangedBy'] = userID
     edit_dict['DataSourceComment'] = DSC
     edit_dict['EditType'] = 'U'
-    return Edit.objects.create(**edit_dict)
+    return edit_dict
 
 
 def create_admin_user():
@@ -350,69 +448,156 @@ def create_admin_user():
     print(f'API TOKEN: {api_token}')
 
 
-def load_ahj_data_csv():
-    user = User.objects.get(Email=settings.ADMIN_ACCOUNT_EMAIL)
-    with open(BASE_DIR + 'AHJRegistryData/ahjregistrydata.csv') as file:
-        reader = csv.DictReader(file, delimiter=',', quotechar='"')
-        i = 1
-        for row in reader:
-            ahj_dict = build_field_val_dict(row)
-            enum_values_to_primary_key(ahj_dict)
-
-            address_dict = ahj_dict.pop('Address', None)
-            if address_dict is not None:
-                ahj_dict['AddressID'] = create_address(address_dict)
-            else:
-                ahj_dict['AddressID'] = Address.objects.create()
-
-            dsc = ahj_dict.pop('DataSourceComments', '')
-            dsms = ahj_dict.pop('DocumentSubmissionMethods', [])
-            pims = ahj_dict.pop('PermitIssueMethods', [])
-            errs = ahj_dict.pop('EngineeringReviewRequirements', [])
-            contacts_dict = ahj_dict.pop('Contacts', [])
-
-            ahj = AHJ.objects.create(**ahj_dict)
+"""
+Bulk loading of the AHJ data CSV.
+The whole CSV is parsed first, with enum values resolved by the enum registry.
+The rows of each table are then built with their primary keys assigned, since
+MySQL does not return the keys of bulk created rows, and inserted in the order
+of AHJ_LOAD_MODELS with bulk_create_with_history, chunk_size AHJs per transaction.
+"""
 
-            for contact_dict in contacts_dict:
-                contact_dict['ParentTable'] = 'AHJ'
-                contact_dict['ParentID'] = ahj.AHJPK
-                contact_dict['ContactStatus'] = True
-                create_contact(contact_dict)
+AHJ_DATA_CSV_PATH = BASE_DIR + 'AHJRegistryData/ahjregistrydata.csv'
 
-            for dsm in dsms:
-                AHJDocumentSubmissionMethodUse.objects.create(AHJPK=ahj, DocumentSubmissionMethodID=dsm, MethodStatus=1)
+AHJ_LOAD_CHUNK_SIZE = 500
 
-            for pim in pims:
-                AHJPermitIssueMethodUse.objects.create(AHJPK=ahj, PermitIssueMethodID=pim, MethodStatus=1)
+"""
+The tables the AHJ data is loaded into, in the order they reference each other
+"""
+AHJ_LOAD_MODELS = [Location, Address, AHJ, Contact, AHJDocumentSubmissionMethodUse, AHJPermitIssueMethodUse,
+                   EngineeringReviewRequirement, Edit]
 
-            for err in errs:
-                err['AHJPK'] = ahj
-                err['EngineeringReviewRequirementStatus'] = 1
-                EngineeringReviewRequirement.objects.create(**err)
+"""
+The code fields an approved edit with the DataSourceComments of an AHJ is created for
+"""
+DATA_SOURCE_COMMENT_FIELDS = ['BuildingCode', 'FireCode', 'ResidentialCode', 'ElectricCode', 'WindCode']
 
-            if dsc != '':
-                if ahj.BuildingCode is not None:
-                    bcVal = BuildingCode.objects.get(BuildingCodeID=ahj.BuildingCode.BuildingCodeID).Value
-                    create_edit_objects(ahj, 'BuildingCode', user, dsc, bcVal)
 
-                if ahj.FireCode is not None:
-                    fcVal = FireCode.objects.get(FireCodeID=ahj.FireCode.FireCodeID).Value
-                    create_edit_objects(ahj, 'FireCode', user, dsc, fcVal)
+def read_ahj_data_csv(path):
+    """
+    Returns the AHJ objects of the rows of an AHJ data CSV, with their enum values replaced by enum rows.
+    """
+    with open(path) as file:
+        reader = csv.DictReader(file, delimiter=',', quotechar='"')
+        return [enum_values_to_primary_key(build_field_val_dict(row)) for row in reader]
 
-                if ahj.ResidentialCode is not None:
-                    rcVal = ResidentialCode.objects.get(ResidentialCodeID=ahj.ResidentialCode.ResidentialCodeID).Value
-                    create_edit_objects(ahj, 'ResidentialCode', user, dsc, rcVal)
 
-                if ahj.ElectricCode is not None:
-                    ecVal = ElectricCode.objects.get(ElectricCodeID=ahj.ElectricCode.ElectricCodeID).Value
-                    create_edit_objects(ahj, 'ElectricCode', user, dsc, ecVal)
+def get_ahj_state(ahj_dict):
+    address_dict = ahj_dict.get('Address', None)
+    return address_dict.get('StateProvince', '') if address_dict is not None else ''
 
-                if ahj.WindCode is not None:
-                    wcVal = WindCode.objects.get(WindCodeID=ahj.WindCode.WindCodeID).Value
-                    create_edit_objects(ahj, 'WindCode', user, dsc, wcVal)
 
-            print('AHJ {0}: {1}'.format(ahj.AHJID, i))
-            i += 1
+class AHJRowBuilder:
+    """
+    Builds the rows of the loaded AHJs with their primary keys assigned,
+    into a dict of model to rows for each chunk of AHJs.
+    """
+    def __init__(self, user):
+        self.user = user
+        self.next_pks = {model: (model.objects.aggregate(max_pk=Max(model._meta.pk.name))['max_pk'] or 0) + 1
+                         for model in AHJ_LOAD_MODELS}
+
+    def add(self, rows, model, **fields):
+        fields[model._meta.pk.attname] = self.next_pks[model]
+        self.next_pks[model] += 1
+        row = model(**fields)
+        rows[model].append(row)
+        return row
+
+    def add_address(self, rows, address_dict):
+        location_dict = address_dict.pop('Location', None)
+        if location_dict is not None:
+            address_dict['LocationID'] = self.add(rows, Location, **location_dict)
+        return self.add(rows, Address, **address_dict)
+
+    def add_ahj(self, rows, ahj_dict):
+        address_dict = ahj_dict.pop('Address', None)
+        ahj_dict['AddressID'] = self.add_address(rows, address_dict if address_dict is not None else {})
+
+        dsc = ahj_dict.pop('DataSourceComments', '')
+        dsms = ahj_dict.pop('DocumentSubmissionMethods', [])
+        pims = ahj_dict.pop('PermitIssueMethods', [])
+        errs = ahj_dict.pop('EngineeringReviewRequirements', [])
+        contacts_dict = ahj_dict.pop('Contacts', [])
+
+        ahj = self.add(rows, AHJ, **ahj_dict)
+
+        for contact_dict in contacts_dict:
+            address_dict = contact_dict.pop('Address', None)
+            contact_dict['AddressID'] = self.add_address(rows, address_dict if address_dict is not None else {})
+            contact_dict['ParentTable'] = 'AHJ'
+            contact_dict['ParentID'] = ahj.AHJPK
+            contact_dict['ContactStatus'] = True
+            self.add(rows, Contact, **contact_dict)
+
+        for dsm in dsms:
+            self.add(rows, AHJDocumentSubmissionMethodUse, AHJPK=ahj, DocumentSubmissionMethodID=dsm, MethodStatus=1)
+
+        for pim in pims:
+            self.add(rows, AHJPermitIssueMethodUse, AHJPK=ahj, PermitIssueMethodID=pim, MethodStatus=1)
+
+        for err in errs:
+            err['AHJPK'] = ahj
+            err['EngineeringReviewRequirementStatus'] = 1
+            self.add(rows, EngineeringReviewRequirement, **err)
+
+        if dsc != '':
+            for field in DATA_SOURCE_COMMENT_FIELDS:
+                if getattr(ahj, field + '_id') is not None:
+                    self.add(rows, Edit, **get_edit_fields(ahj, field, self.user, dsc, enum_registry.get_field_value(ahj, field)))
+
+    def build_chunk(self, ahj_dicts):
+        rows = OrderedDict((model, []) for model in AHJ_LOAD_MODELS)
+        for ahj_dict in ahj_dicts:
+            self.add_ahj(rows, ahj_dict)
+        return rows
+
+
+def insert_ahj_chunks(chunks):
+    for rows in chunks:
+        with transaction.atomic():
+            for model, model_rows in rows.items():
+                if len(model_rows) != 0:
+                    bulk_create_with_history(model_rows, model)
+
+
+def insert_ahj_chunks_in_thread(chunks):
+    try:
+        insert_ahj_chunks(chunks)
+    finally:
+        # Each thread opens its own database connection
+        connection.close()
+
+
+def load_ahj_data_csv(path=AHJ_DATA_CSV_PATH, workers=1, chunk_size=AHJ_LOAD_CHUNK_SIZE):
+    """
+    Loads the AHJs of an AHJ data CSV, and prints the throughput.
+    If workers is greater than 1, that many threads insert the AHJs, one state at a time.
+    Returns the number of AHJs loaded.
+    """
+    start = time.monotonic()
+    user = User.objects.get(Email=settings.ADMIN_ACCOUNT_EMAIL)
+    ahj_dicts = read_ahj_data_csv(path)
+    # The rows of every state are built here, so the threads do not share primary keys
+    groups = OrderedDict()
+    for ahj_dict in ahj_dicts:
+        groups.setdefault(get_ahj_state(ahj_dict) if workers > 1 else None, []).append(ahj_dict)
+    builder = AHJRowBuilder(user)
+    group_chunks = [[builder.build_chunk(group[i:i + chunk_size]) for i in range(0, len(group), chunk_size)]
+                    for group in groups.values()]
+    if workers <= 1:
+        for chunks in group_chunks:
+            insert_ahj_chunks(chunks)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(insert_ahj_chunks_in_thread, group_chunks))
+    # bulk_create does not send the signals that recount the coverage and invalidate the stored documents and tiles
+    if len(ahj_dicts) != 0:
+        rebuild_coverage()
+        invalidate_all_ahj_documents()
+        clear_tile_cache()
+    seconds = time.monotonic() - start
+    print('load_ahj_data_csv: {0} AHJs in {1:.1f}s ({2:.1f} AHJs/s)'.format(len(ahj_dicts), seconds, len(ahj_dicts) / seconds if seconds > 0 else 0))
+    return len(ahj_dicts)
 
 
 def get_empty_loc():
@@ -569,78 +754,101 @@ abbr_to_state_fips = dict(map(reversed, state_fips_to_abbr.items()))
 
 """
 Helpers to assign an AHJ to its polygon by AHJName and polygon name
+
+An AHJ is paired with the state polygon named its AHJName without the
+trailing ' state', or else with the county, city, or county subdivision
+polygon (in that order of preference) in the AHJ's state whose
+LSAreaCodeName is its AHJName, ignoring case. The polygon names are loaded
+into dicts once, every AHJ is matched in memory, and only the AHJs whose
+polygon changed are written.
 """
 
+PAIRING_POLYGON_MODELS = [CountyPolygon, CityPolygon, CountySubdivisionPolygon]
 
-def pair_all():
-    AHJ.objects.all().update(PolygonID=None)
-    pair_polygons(CountyPolygon)
-    pair_polygons(CityPolygon)
-    pair_polygons(CountySubdivisionPolygon)
-    pair_state_polygons()
-
-
-def pair_polygons(model):
-    polgyons = model.objects.all()
-    ahjs = AHJ.objects.filter(PolygonID=None).order_by('AddressID__StateProvince')
-    i = 0
-    total = len(ahjs)
-    # Pair polygons
-    current_state_fips = ''
-    temp_polygons = model.objects.none()
-    for ahj in ahjs:
-        addr = Address.objects.get(AddressID=ahj.AddressID.AddressID)
-        temp_state_fips = abbr_to_state_fips[addr.StateProvince]
-        if current_state_fips != temp_state_fips:
-            current_state_fips = temp_state_fips
-            temp_polygons = polgyons.filter(PolygonID__GEOID__startswith=current_state_fips).order_by('LSAreaCodeName')
-        polygon_index = binary_search(temp_polygons, ahj.AHJName)
-        if polygon_index != -1:
-            polygon = temp_polygons[polygon_index]
-            ahj.PolygonID = polygon.PolygonID
-            ahj.save()
-        i += 1
-        print("pair_polygons_ahjs {1}: {0:.0%}".format(i/total, model.__name__))
-
-
-def pair_state_polygons():
-    # Pair states
-    states = StatePolygon.objects.all()
-    i = 0
-    total = len(states)
-    for state in states:
-        ahj = AHJ.objects.get(AHJName=state.PolygonID.Name + ' state')
-        ahj.PolygonID = state.PolygonID
-        ahj.save()
-        i += 1
-        print("pair_polygons_ahjs {1}: {0:.0%}".format(i/total, StatePolygon.__name__))
 
+def get_polygon_name_map(model):
+    """
+    Returns a dict of (state FIPS, lowercased LSAreaCodeName) to the PolygonID of
+    the polygons of a polygon type table. The lowest PolygonID is kept for duplicate names.
+    """
+    name_map = {}
+    for geoid, name, polygon_id in model.objects.order_by('PolygonID').values_list('PolygonID__GEOID', 'LSAreaCodeName', 'PolygonID'):
+        name_map.setdefault((geoid[:2], name.lower()), polygon_id)
+    return name_map
 
-# Iterative Binary Search Function
-# It returns index of x in given array arr if present,
-# else returns -1
-def binary_search(arr, x):
-    low = 0
-    high = len(arr) - 1
-    mid = 0
-    x = x.lower()
 
-    while low <= high:
-        mid = (high + low) // 2
-        # Check if x is present at mid
-        if arr[mid].LSAreaCodeName.lower() < x:
-            low = mid + 1
+def get_state_polygon_name_map():
+    """
+    Returns a dict of the lowercased name of the AHJ of each state to its PolygonID.
+    """
+    return {(name + ' state').lower(): polygon_id
+            for name, polygon_id in StatePolygon.objects.order_by('-PolygonID').values_list('PolygonID__Name', 'PolygonID')}
 
-        # If x is greater, ignore left half
-        elif arr[mid].LSAreaCodeName.lower() > x:
-            high = mid - 1
 
-        # If x is smaller, ignore right half
+def match_ahj_polygon(ahj_name, state_province, state_name_map, name_maps):
+    """
+    Returns the PolygonID an AHJ is paired with, or None if no polygon matches.
+    """
+    name = ahj_name.lower()
+    if name in state_name_map:
+        return state_name_map[name]
+    state_fips = abbr_to_state_fips.get(state_province)
+    if state_fips is None:
+        return None
+    for name_map in name_maps:
+        polygon_id = name_map.get((state_fips, name))
+        if polygon_id is not None:
+            return polygon_id
+    return None
+
+
+def pair_ahjs_to_polygons(batch_size=1000):
+    """
+    Pairs every AHJ with its polygon.
+    Returns a dict of the number of AHJs 'paired', the number whose polygon 'changed',
+    and the (AHJPK, AHJName, StateProvince) of the 'unmatched' AHJs.
+    """
+    state_name_map = get_state_polygon_name_map()
+    name_maps = [get_polygon_name_map(model) for model in PAIRING_POLYGON_MODELS]
+    changed = []
+    unmatched = []
+    paired = 0
+    # NOTE: Whole rows are loaded because the history rows of changed AHJs copy every field
+    ahjs = AHJ.objects.select_related('AddressID').order_by('AHJPK')
+    for ahj in ahjs:
+        state_province = ahj.AddressID.StateProvince if ahj.AddressID is not None else ''
+        polygon_id = match_ahj_polygon(ahj.AHJName, state_province, state_name_map, name_maps)
+        if polygon_id is None:
+            unmatched.append((ahj.AHJPK, ahj.AHJName, state_province))
         else:
-            return mid
+            paired += 1
+        if ahj.PolygonID_id != polygon_id:
+            ahj.PolygonID_id = polygon_id
+            changed.append(ahj)
+    if len(changed) == 0:
+        return {'paired': paired, 'changed': 0, 'unmatched': unmatched}
+    with transaction.atomic():
+        bulk_update_with_history(changed, AHJ, ['PolygonID'], batch_size=batch_size)
+        # bulk_update does not send the signals that invalidate the documents, coverage, and tiles
+        invalidate_ahj_documents([ahj.AHJPK for ahj in changed])
+        rebuild_coverage()
+    clear_tile_cache()
+    return {'paired': paired, 'changed': len(changed), 'unmatched': unmatched}
+
+
+def write_unmatched_ahjs_csv(unmatched, path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['AHJPK', 'AHJName', 'StateProvince'])
+        writer.writerows(unmatched)
 
-            # If we reach here, then the element was not present
-    return -1
+
+def pair_all():
+    report = pair_ahjs_to_polygons()
+    print('pair_all: {0} AHJs paired, {1} changed, {2} unmatched'.format(report['paired'], report['changed'], len(report['unmatched'])))
+    for ahjpk, ahj_name, state_province in report['unmatched']:
+        print('pair_all unmatched: {0} {1} ({2})'.format(ahjpk, ahj_name, state_province))
+    return report
 
 
 BASE_DIR_USER = BASE_DIR + 'UserData/'
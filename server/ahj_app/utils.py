@@ -1,11 +1,12 @@
 import json
 import re
 
-from django.apps import apps
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
 
 from .serializers import *
-import googlemaps
+from . import enum_registry, geo_grid, geocoding, name_index, polygon_hierarchy, spatial_index
 from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
 
 
@@ -36,9 +37,6 @@ ENUM_PLURALS_TRANSLATE = {
 }
 
 
-gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_KEY)
-
-
 def get_ob_value_primitive(ob_json, field_name, throw_exception=True, exception_return_value=None):
     try:
         if isinstance(ob_json[field_name], list):
@@ -66,6 +64,14 @@ def get_str_location(location):
         raise ValueError(f'Invalid Latitude or Longitude, got (Latitude:\'{lat}\', Longitude:\'{lng}\')')
 
 
+def parse_str_location(str_location):
+    """
+    Returns the (longitude, latitude) of a location string made by get_str_location.
+    """
+    lng, lat = str_location[len('POINT('):-len(')')].split(', ')
+    return float(lng), float(lat)
+
+
 def get_str_address(address):
     return \
         get_ob_value_primitive(address, 'AddrLine1', exception_return_value='') + ' ' + \
@@ -90,31 +96,75 @@ def get_location_gecode_address_str(address):
             'Value': None
         }
     }
-    geo_res = []
+    geo_res = None
     if bool(address): # Check if address is non-falsey 
-        geo_res = gmaps.geocode(address)
-    if len(geo_res) != 0:
-        latitude = geo_res[0]['geometry']['location']['lat']
-        longitude = geo_res[0]['geometry']['location']['lng']
-        location['Latitude']['Value'] = latitude
-        location['Longitude']['Value'] = longitude
+        geo_res = geocoding.geocode_address(address)
+    if geo_res is not None:
+        location['Latitude']['Value'], location['Longitude']['Value'] = geo_res
     return location
 
 def get_elevation(Address):
-    loc = get_location_gecode_address_str(Address)
-    location = { 'lat': loc['Latitude']['Value'], 'lng': loc['Longitude']['Value'] }
-    elev = gmaps.elevation((loc['Latitude']['Value'],loc['Longitude']['Value']))
-    loc['Elevation'] = {'Value': 0}
-    loc['Elevation']['Value'] = elev[0]['elevation']
+    """
+    Returns the Location of an address as in get_location_gecode_address_str, with its Elevation.
+    """
+    loc = {
+        'Latitude': {
+            'Value': None
+        },
+        'Longitude': {
+            'Value': None
+        },
+        'Elevation': {
+            'Value': None
+        }
+    }
+    geo_res = None
+    if bool(Address):
+        geo_res = geocoding.geocode_address_with_elevation(Address)
+    if geo_res is not None:
+        loc['Latitude']['Value'], loc['Longitude']['Value'], loc['Elevation']['Value'] = geo_res
     return loc
 
+def create_addr_string(Address):
+    addr = Address.AddrLine1
+    if addr != '' and Address.AddrLine2 != '':
+        addr += ', ' + Address.AddrLine2
+    elif Address.AddrLine2 != '':
+        addr += Address.AddrLine2
+    if addr != '' and Address.AddrLine3!= '':
+        addr += ', ' + Address.AddrLine3
+    elif Address.AddrLine3 != '':
+        addr += Address.AddrLine3
+    if addr != '' and Address.City != '':
+        addr += ', ' + Address.City
+    elif Address.City != '':
+        addr += Address.City
+    if addr != '' and Address.County != '':
+        addr += ', ' + Address.County
+    elif Address.County != '':
+        addr += Address.County
+    if addr != '' and Address.StateProvince != '':
+        addr += ', ' + Address.StateProvince
+    elif Address.StateProvince != '':
+        addr += Address.StateProvince
+    if addr != '' and Address.Country != '':
+        addr += ', ' + Address.Country
+    elif Address.Country != '':
+        addr += Address.Country
+    if addr != '' and Address.ZipPostalCode != '':
+        addr += ', ' + Address.ZipPostalCode
+    elif Address.ZipPostalCode != '':
+        addr += Address.ZipPostalCode
+
+    return addr
+
 def get_enum_value_row(enum_field, enum_value):
     """
     Finds the row of the enum table given the field name and its enum value.
     """
     # Translate plural, if given
     enum_field = ENUM_PLURALS_TRANSLATE[enum_field] if enum_field in ENUM_PLURALS_TRANSLATE else enum_field
-    return apps.get_model('ahj_app', enum_field).objects.get(Value=enum_value)
+    return enum_registry.get_row(enum_field, enum_value)
 
 
 def get_enum_value_row_else_null(enum_field, enum_value):
@@ -237,9 +287,90 @@ def get_multipolygon_wkt(multipolygon):
     return multipolygon.wkt.replace(" ", "", 1)
 
 
+def get_polygon_id_query_cond(polygon_ids, query_params: dict):
+    """
+    Returns a condition on the AHJ table that its PolygonID is one of polygon_ids.
+    If polygon_ids is empty, the condition matches no AHJs.
+    """
+    if len(polygon_ids) == 0:
+        return ' False AND '
+    return get_list_query_cond('PolygonID', sorted(polygon_ids), query_params)
+
+
+def get_indexed_polygon_ids_containing(location):
+    """
+    Returns the PolygonIDs of the polygons containing a location string
+    using the in-process spatial index, or None if the index is not loaded.
+    """
+    polygon_index = spatial_index.get_polygon_index()
+    if polygon_index is None:
+        return None
+    lng, lat = parse_str_location(location)
+    return polygon_index.get_polygon_ids_containing(lng, lat)
+
+
+def get_polygon_ids_containing_location(location):
+    """
+    Returns the PolygonIDs of the polygons containing a location string, found without
+    the subqueries of filter_ahjs, and how they were found: 'spatial_index', 'grid' if
+    the geo grid answered alone, 'exact' if it tested polygons crossing the location's cell,
+    or 'hierarchy'. Returns (None, 'sql') if none of these is loaded or enabled.
+    """
+    polygon_ids = get_indexed_polygon_ids_containing(location)
+    if polygon_ids is not None:
+        return polygon_ids, 'spatial_index'
+    lng, lat = parse_str_location(location)
+    if settings.GEO_GRID_ENABLED:
+        polygon_ids, tested = geo_grid.get_polygon_ids_containing(lng, lat)
+        return polygon_ids, 'exact' if tested else 'grid'
+    if settings.POLYGON_HIERARCHY_ENABLED:
+        return polygon_hierarchy.get_polygon_ids_containing(lng, lat), 'hierarchy'
+    return None, 'sql'
+
+
+def get_ahjpk_query_cond(ahjpks, query_params: dict):
+    """
+    Returns a condition on the AHJ table that its AHJPK is one of ahjpks.
+    If ahjpks is empty, the condition matches no AHJs.
+    """
+    if len(ahjpks) == 0:
+        return ' False AND '
+    param_names = []
+    for i, ahjpk in enumerate(sorted(ahjpks)):
+        query_params[f'name_AHJPK{i}'] = ahjpk
+        param_names.append(f'%(name_AHJPK{i})s')
+    return 'AHJ.AHJPK IN (' + ', '.join(param_names) + ') AND '
+
+
+def get_indexed_ahjpks_containing(AHJName):
+    """
+    Returns the AHJPKs of the AHJs whose names contain AHJName using the
+    in-process name index, or None if the index is not loaded.
+    """
+    index = name_index.get_name_index()
+    if index is None:
+        return None
+    return index.get_ahjpks_containing(AHJName)
+
+
+def order_ahj_list_name_match(ahj_list, AHJName):
+    """
+    Orders AHJs by how well their names match AHJName, best first,
+    if the name index is loaded. Otherwise the order is unchanged.
+    AHJs the index does not match keep their order after the matches.
+    """
+    index = name_index.get_name_index()
+    if index is None:
+        return ahj_list
+    ranks = {entry.AHJPK: rank for rank, (entry, score) in enumerate(index.search(AHJName))}
+    ahj_list.sort(key=lambda ahj: ranks.get(ahj.AHJPK, len(ranks)))
+    return ahj_list
+
+
 def filter_ahjs(AHJName=None, AHJID=None, AHJPK=None, AHJCode=None, AHJLevelCode=None,
                 BuildingCode=[], ElectricCode=[], FireCode=[], ResidentialCode=[], WindCode=[],
-                StateProvince=None, location=None, polygon=None):
+                StateProvince=None, location=None, polygon=None, after_AHJPK=None, limit=None,
+                location_polygon_ids=None):
     """
     Main Idea: This functional view uses raw SQL queries to
     get the information out of the databases. To make this
@@ -256,13 +387,33 @@ def filter_ahjs(AHJName=None, AHJID=None, AHJPK=None, AHJCode=None, AHJLevelCode
     are simply expanded as where clauses on the final
     condition. AHJName is a slight exception to this as
     we match any names that contain the string that was
-    given (case insensitive). Lastly, the StateProvince
+    given (case insensitive), found in the name index when
+    it is loaded (see name_index.py). Lastly, the StateProvince
     also requires extra logic because it will modify the
     query to also join on the Address table.
+
+    When a limit is given, the AHJs are ordered by AHJPK and
+    at most limit AHJs with an AHJPK greater than after_AHJPK
+    are returned. This is used for keyset pagination, which
+    reads each page with an index range scan on the primary key
+    instead of counting the results and skipping an offset.
+
+    location_polygon_ids may be given the PolygonIDs containing
+    location already found by get_polygon_ids_containing_location.
     """
     full_query_string = ''' SELECT * FROM AHJ '''
     query_params = {}
-    if location is not None or polygon is not None:
+    # Initialize empty where clause filtering
+    where_clauses = ''
+    # NOTE: When the spatial index is loaded, or the geo grid or polygon hierarchy is enabled,
+    # the polygons containing a location are found without the subqueries below
+    indexed_polygon_ids = None
+    if location is not None and polygon is None:
+        indexed_polygon_ids = location_polygon_ids if location_polygon_ids is not None else \
+                              get_polygon_ids_containing_location(location)[0]
+    if indexed_polygon_ids is not None:
+        where_clauses += get_polygon_id_query_cond(indexed_polygon_ids, query_params)
+    elif location is not None or polygon is not None:
         if polygon is not None:
             intersects = 'ST_INTERSECTS(Polygon, ST_GeomFromText(\'' + polygon + '\'))'
         else:
@@ -316,8 +467,6 @@ def filter_ahjs(AHJName=None, AHJID=None, AHJPK=None, AHJCode=None, AHJLevelCode
         # Change the stem of the query string
         full_query_string = polygon_query
 
-    # Initialize empty where clause filtering
-    where_clauses = ''
     # NOTE: StateProvince is located in the Address table,
     # so the StateProvince query needs to join a table and
     # include a where condition
@@ -328,7 +477,12 @@ def filter_ahjs(AHJName=None, AHJID=None, AHJPK=None, AHJCode=None, AHJLevelCode
         where_clauses += ' Address.StateProvince=%(StateProvince)s AND '
 
     # Match a partially matching string for name
-    where_clauses += get_name_query_cond('AHJName', AHJName, query_params)
+    # NOTE: When the name index is loaded, the AHJs whose names contain it are found in memory
+    name_ahjpks = get_indexed_ahjpks_containing(AHJName) if AHJName else None
+    if name_ahjpks is not None:
+        where_clauses += get_ahjpk_query_cond(name_ahjpks, query_params)
+    else:
+        where_clauses += get_name_query_cond('AHJName', AHJName, query_params)
 
     # Append additional clauses onto condition when NOT NULL, (checked by `basic_query_cond`
     where_clauses += get_basic_query_cond('AHJPK', AHJPK, query_params)
@@ -342,18 +496,107 @@ def filter_ahjs(AHJName=None, AHJID=None, AHJPK=None, AHJCode=None, AHJLevelCode
     where_clauses += get_list_query_cond('ResidentialCode', [e.pk for e in get_enum_value_row_else_null('ResidentialCode', ResidentialCode) if e is not None], query_params)
     where_clauses += get_list_query_cond('WindCode', [e.pk for e in get_enum_value_row_else_null('WindCode', WindCode) if e is not None], query_params)
 
+    if after_AHJPK is not None:
+        query_params['after_AHJPK'] = after_AHJPK
+        where_clauses += ' AHJ.AHJPK > %(after_AHJPK)s AND '
+
     # NOTE: we append a 'True' at the end to always make the query valid
     # because the get_x_query_cond appends an `AND` to the condition
-    full_query_string += ' WHERE ' + where_clauses + ' True;'
+    full_query_string += ' WHERE ' + where_clauses + ' True'
+    if limit is not None:
+        query_params['limit'] = limit
+        full_query_string += ' ORDER BY AHJ.AHJPK LIMIT %(limit)s'
+    full_query_string += ';'
     #print(AHJ.objects.raw('EXPLAIN ' + full_query_string, query_params))
     return AHJ.objects.raw(full_query_string, query_params)
 
 def order_ahj_list_AHJLevelCode_PolygonLandArea(ahj_list):
     ahj_list.sort(key=lambda ahj: int(ahj.PolygonID.LandArea) if ahj.PolygonID is not None else 0) # Sort first by landarea ascending
-    ahj_list.sort(reverse=True, key=lambda ahj: int(ahj.AHJLevelCode.Value) if ahj.AHJLevelCode != '' and ahj.AHJLevelCode is not None else 0) # Then sort by numerical value AHJLevelCode descending
+    ahj_list.sort(reverse=True, key=lambda ahj: int(enum_registry.get_value('AHJLevelCode', ahj.AHJLevelCode_id) or 0)) # Then sort by numerical value AHJLevelCode descending
     return ahj_list
 
 
+"""
+Number of points or polygons resolved per query when searching many locations at once
+"""
+LOCATION_BATCH_QUERY_CHUNK_SIZE = 500
+
+
+def query_polygon_ids_containing_locations(str_locations):
+    """
+    Returns a dict of each location string to the PolygonIDs of the polygons
+    containing it, resolving all of the locations with one query.
+    """
+    query_params = {}
+    points = []
+    for i, str_location in enumerate(str_locations):
+        query_params[f'lng{i}'], query_params[f'lat{i}'] = parse_str_location(str_location)
+        points.append(f'SELECT {i} AS PointIndex, POINT(%(lng{i})s, %(lat{i})s) AS Point')
+    query = '''
+        SELECT Points.PointIndex, Polygon.PolygonID,
+            StatePolygon.PolygonID IS NOT NULL AS IsState,
+            COALESCE(CountyPolygon.StatePolygonID,
+                     CityPolygon.StatePolygonID,
+                     CountySubdivisionPolygon.StatePolygonID) AS StatePolygonID
+        FROM (''' + ' UNION ALL '.join(points) + ''') AS Points
+        JOIN Polygon ON ST_CONTAINS(Polygon.Polygon, Points.Point)
+        LEFT JOIN StatePolygon ON Polygon.PolygonID = StatePolygon.PolygonID
+        LEFT JOIN CountyPolygon ON Polygon.PolygonID = CountyPolygon.PolygonID
+        LEFT JOIN CityPolygon ON Polygon.PolygonID = CityPolygon.PolygonID
+        LEFT JOIN CountySubdivisionPolygon ON Polygon.PolygonID = CountySubdivisionPolygon.PolygonID
+        '''
+    with connection.cursor() as cursor:
+        cursor.execute(query, query_params)
+        rows = dictfetchall(cursor)
+    containing = {i: [] for i in range(len(str_locations))}
+    for row in rows:
+        if row['IsState']:
+            containing[row['PointIndex']].append((row['PolygonID'], None))
+        elif row['StatePolygonID'] is not None:
+            containing[row['PointIndex']].append((row['PolygonID'], row['StatePolygonID']))
+    return {str_location: spatial_index.get_polygon_ids_in_containing_states(containing[i])
+            for i, str_location in enumerate(str_locations)}
+
+
+def get_polygon_ids_containing_locations(str_locations):
+    """
+    Returns a dict of each location string to the PolygonIDs that
+    filter_ahjs would search for AHJs located at it.
+    Uses the spatial index if it is loaded, otherwise one query per chunk of locations.
+    """
+    polygon_index = spatial_index.get_polygon_index()
+    if polygon_index is not None:
+        return {str_location: polygon_index.get_polygon_ids_containing(*parse_str_location(str_location))
+                for str_location in str_locations}
+    polygon_ids = {}
+    for i in range(0, len(str_locations), LOCATION_BATCH_QUERY_CHUNK_SIZE):
+        polygon_ids.update(query_polygon_ids_containing_locations(str_locations[i:i + LOCATION_BATCH_QUERY_CHUNK_SIZE]))
+    return polygon_ids
+
+
+def get_ahj_lists_containing_locations(str_locations, ahjs_to_search=None):
+    """
+    Returns a dict of each distinct location string to the list of AHJs located at it,
+    ordered by order_ahj_list_AHJLevelCode_PolygonLandArea.
+    If ahjs_to_search is given, only AHJs whose AHJID is in it are included.
+    """
+    str_locations = list(dict.fromkeys(str_locations))
+    location_polygon_ids = get_polygon_ids_containing_locations(str_locations)
+    polygon_ids = sorted(set().union(*location_polygon_ids.values()))
+    polygon_ahjs = {}
+    for i in range(0, len(polygon_ids), LOCATION_BATCH_QUERY_CHUNK_SIZE):
+        ahjs = AHJ.objects.filter(PolygonID__in=polygon_ids[i:i + LOCATION_BATCH_QUERY_CHUNK_SIZE]) \
+                          .select_related('AHJLevelCode', 'PolygonID') \
+                          .defer('PolygonID__Polygon') \
+                          .order_by('AHJPK')
+        for ahj in ahjs:
+            if ahjs_to_search is None or ahj.AHJID in ahjs_to_search:
+                polygon_ahjs.setdefault(ahj.PolygonID_id, []).append(ahj)
+    return {str_location: order_ahj_list_AHJLevelCode_PolygonLandArea(
+                [ahj for polygon_id in sorted(location_polygon_ids[str_location]) for ahj in polygon_ahjs.get(polygon_id, [])])
+            for str_location in str_locations}
+
+
 def get_public_api_serializer_context():
     context = {'is_public_view': True}
     return context
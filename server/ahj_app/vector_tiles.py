@@ -0,0 +1,429 @@
+"""
+Mapbox Vector Tiles of the jurisdiction polygons for the data map.
+
+A tile holds one layer per polygon type of TILE_LAYERS. Each polygon in the
+tile is drawn from its simplified geometry for the tile's zoom, clipped to the
+tile, and has the AHJ it is paired with and the code coverage flags of the
+data_map endpoint as properties. The tiles are encoded with a minimal
+protobuf writer following the Mapbox Vector Tile 2.1 specification.
+
+Rendered tiles are cached on disk under VECTOR_TILE_CACHE_DIR as z/x/y.mvt.
+The cached tiles covering a polygon are deleted when the polygon or an AHJ
+paired with it changes. Polygons and AHJs changed in bulk clear the cache.
+"""
+import math
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Envelope
+from django.contrib.gis.geos import GEOSException, GeometryCollection, MultiPolygon, Polygon as GEOSPolygon
+from django.db.models.signals import post_save, pre_delete, pre_save
+
+from .coverage import CODE_FIELDS, COVERAGE_FIELDS
+from .models import AHJ, CityPolygon, CountyPolygon, CountySubdivisionPolygon, Polygon, StateCoverage, StatePolygon
+from .polygon_detail import get_simplified_geometries
+
+MVT_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+"""
+Size of a tile in tile coordinates, and the margin drawn around it so
+polygon edges are not visible at tile boundaries
+"""
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+MAX_ZOOM = 16
+
+"""
+Layer name, polygon model, and lowest zoom of each layer of a tile
+"""
+TILE_LAYERS = [
+    ('state', StatePolygon, 0),
+    ('county', CountyPolygon, 5),
+    ('city', CityPolygon, 8),
+    ('countysubdivision', CountySubdivisionPolygon, 8)
+]
+
+"""
+Highest zoom drawn at each polygon detail level, the full geometry is drawn above them
+"""
+ZOOM_DETAILS = [
+    (5, 'low'),
+    (9, 'medium'),
+    (12, 'high')
+]
+
+"""
+Protobuf encoding
+"""
+
+
+def encode_varint(value):
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def encode_varint_field(field_number, value):
+    return encode_varint(field_number << 3) + encode_varint(value)
+
+
+def encode_bytes_field(field_number, data):
+    return encode_varint(field_number << 3 | 2) + encode_varint(len(data)) + data
+
+
+def encode_packed_field(field_number, values):
+    return encode_bytes_field(field_number, b''.join(encode_varint(value) for value in values))
+
+
+def encode_value(value):
+    """
+    Encodes a property value of a feature as a Value message.
+    """
+    if isinstance(value, str):
+        return encode_bytes_field(1, value.encode('utf-8'))
+    if isinstance(value, bool):
+        return encode_varint_field(7, int(value))
+    if value >= 0:
+        return encode_varint_field(5, value)
+    return encode_varint_field(6, zigzag(value))
+
+
+"""
+Tile coordinates
+"""
+
+
+def lonlat_to_world(lon, lat):
+    """
+    Returns the Web Mercator position of a point as fractions of the world's
+    width and height, measured from the top left corner.
+    """
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    lat_radians = math.radians(lat)
+    return (lon + 180) / 360, (1 - math.log(math.tan(lat_radians) + 1 / math.cos(lat_radians)) / math.pi) / 2
+
+
+def world_to_lonlat(world_x, world_y):
+    return world_x * 360 - 180, math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * world_y))))
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def get_tile_bounds(z, x, y, buffer=TILE_BUFFER):
+    """
+    Returns the bounding box of a tile and its buffer in longitude and latitude.
+    """
+    margin = buffer / TILE_EXTENT
+    min_lon, max_lat = world_to_lonlat((x - margin) / 2 ** z, (y - margin) / 2 ** z)
+    max_lon, min_lat = world_to_lonlat((x + 1 + margin) / 2 ** z, (y + 1 + margin) / 2 ** z)
+    return GEOSPolygon.from_bbox((max(min_lon, -180), min_lat, min(max_lon, 180), max_lat))
+
+
+def get_tile_ranges(extent, z):
+    """
+    Returns the ranges of the x and y of the tiles at a zoom whose buffered bounds intersect an extent.
+    """
+    min_lon, min_lat, max_lon, max_lat = extent
+    min_x, min_y = lonlat_to_world(min_lon, max_lat)
+    max_x, max_y = lonlat_to_world(max_lon, min_lat)
+    tiles = 2 ** z
+    # Widened by one tile so the buffers of neighbouring tiles are included
+    return (range(max(int(min_x * tiles) - 1, 0), min(int(max_x * tiles) + 2, tiles)),
+            range(max(int(min_y * tiles) - 1, 0), min(int(max_y * tiles) + 2, tiles)))
+
+
+def get_zoom_detail(z):
+    for max_zoom, detail in ZOOM_DETAILS:
+        if z <= max_zoom:
+            return detail
+    return 'full'
+
+
+"""
+Geometry encoding
+"""
+
+
+def iter_polygons(geometry):
+    """
+    Yields the polygons of a clipped geometry, which may also hold lines and points.
+    """
+    if isinstance(geometry, GEOSPolygon):
+        yield geometry
+    elif isinstance(geometry, (MultiPolygon, GeometryCollection)):
+        for part in geometry:
+            yield from iter_polygons(part)
+
+
+def ring_area(points):
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1])) / 2
+
+
+def encode_geometry(geometry, z, x, y):
+    """
+    Returns the commands drawing a clipped geometry in a tile, or an empty list if nothing of it is visible.
+    Exterior rings are drawn clockwise and interior rings counterclockwise, as the specification requires.
+    """
+    scale = 2 ** z * TILE_EXTENT
+    commands = []
+    cursor_x, cursor_y = 0, 0
+    for polygon in iter_polygons(geometry):
+        for ring_index, ring in enumerate(polygon):
+            points = []
+            for lon, lat in ring.coords[:-1]:
+                world_x, world_y = lonlat_to_world(lon, lat)
+                point = (round(world_x * scale) - x * TILE_EXTENT, round(world_y * scale) - y * TILE_EXTENT)
+                if len(points) == 0 or points[-1] != point:
+                    points.append(point)
+            while len(points) > 1 and points[0] == points[-1]:
+                points.pop()
+            area = ring_area(points) if len(points) >= 3 else 0
+            if area == 0:
+                # Interior rings of a polygon whose exterior ring vanished are skipped with it
+                if ring_index == 0:
+                    break
+                continue
+            if (area > 0) != (ring_index == 0):
+                points.reverse()
+            commands += [1 << 3 | 1, zigzag(points[0][0] - cursor_x), zigzag(points[0][1] - cursor_y)]
+            commands.append((len(points) - 1) << 3 | 2)
+            for (previous_x, previous_y), (point_x, point_y) in zip(points, points[1:]):
+                commands += [zigzag(point_x - previous_x), zigzag(point_y - previous_y)]
+            commands.append(1 << 3 | 7)
+            cursor_x, cursor_y = points[-1]
+    return commands
+
+
+def clip(geometry, bounds):
+    try:
+        return geometry.intersection(bounds)
+    except GEOSException:
+        # Repairs self-intersections left by simplification or by the source data
+        return geometry.buffer(0).intersection(bounds)
+
+
+def encode_layer(name, features):
+    """
+    Encodes a layer from a list of (id, properties, commands) of its features.
+    """
+    keys = {}
+    values = {}
+    encoded_features = []
+    for feature_id, properties, commands in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        encoded_features.append(encode_bytes_field(2, encode_varint_field(1, feature_id) + encode_packed_field(2, tags) +
+                                                      encode_varint_field(3, 3) + encode_packed_field(4, commands)))
+    return encode_bytes_field(3, encode_varint_field(15, 2) + encode_bytes_field(1, name.encode('utf-8')) +
+                                 b''.join(encoded_features) +
+                                 b''.join(encode_bytes_field(3, key.encode('utf-8')) for key in keys) +
+                                 b''.join(encode_bytes_field(4, encode_value(value)) for _, value in values) +
+                                 encode_varint_field(5, TILE_EXTENT))
+
+
+"""
+Feature properties
+"""
+
+
+def get_ahj_properties(polygon_ids):
+    """
+    Returns a dict of PolygonID to the AHJ paired with the polygon and whether it has each code.
+    """
+    properties = {}
+    ahjs = AHJ.objects.filter(PolygonID__in=polygon_ids).order_by('AHJPK').values('PolygonID', 'AHJPK', 'AHJName', *CODE_FIELDS)
+    for ahj in ahjs:
+        if ahj['PolygonID'] in properties:
+            continue
+        properties[ahj['PolygonID']] = dict({'AHJPK': ahj['AHJPK'], 'AHJName': ahj['AHJName']},
+                                            **{'num' + field + 's': int(ahj[field] is not None) for field in CODE_FIELDS})
+    return properties
+
+
+def get_state_properties(state_polygon_ids):
+    """
+    Returns a dict of the PolygonID of each state to its counts of AHJs and codes, as served by data_map.
+    """
+    rows = StateCoverage.objects.filter(StatePolygonID__in=state_polygon_ids).values('StatePolygonID', *COVERAGE_FIELDS)
+    return {row['StatePolygonID']: {'n' + field[1:]: row[field] for field in COVERAGE_FIELDS} for row in rows}
+
+
+"""
+Tile rendering
+"""
+
+
+def get_layer_features(model, z, x, y, bounds):
+    """
+    Returns the (PolygonID, properties, commands) of the polygons of a layer within a tile.
+    """
+    detail = get_zoom_detail(z)
+    # NOTE: The bounds are given without an SRID like the polygons of filter_ahjs
+    polygons = (Polygon.objects.filter(**{model._meta.model_name + '__isnull': False})
+                               .extra(where=['ST_INTERSECTS(Polygon.Polygon, ST_GeomFromText(%s))'], params=[bounds.wkt])
+                               .order_by('PolygonID'))
+    if detail == 'full':
+        rows = list(polygons.values_list('PolygonID', 'Name', 'Polygon'))
+    else:
+        names = list(polygons.values_list('PolygonID', 'Name'))
+        geometries = get_simplified_geometries([polygon_id for polygon_id, _ in names], detail)
+        rows = [(polygon_id, name, geometries[polygon_id]) for polygon_id, name in names if polygon_id in geometries]
+    polygon_ids = [polygon_id for polygon_id, _, _ in rows]
+    ahj_properties = get_ahj_properties(polygon_ids)
+    state_properties = get_state_properties(polygon_ids) if model is StatePolygon else {}
+    features = []
+    for polygon_id, name, geometry in rows:
+        commands = encode_geometry(clip(geometry, bounds), z, x, y)
+        if len(commands) == 0:
+            continue
+        properties = {'PolygonID': polygon_id, 'Name': name}
+        properties.update(ahj_properties.get(polygon_id, {}))
+        properties.update(state_properties.get(polygon_id, {}))
+        features.append((polygon_id, properties, commands))
+    return features
+
+
+def render_tile(z, x, y):
+    """
+    Returns the encoded tile of the polygons at z/x/y.
+    """
+    bounds = get_tile_bounds(z, x, y)
+    tile = b''
+    for name, model, min_zoom in TILE_LAYERS:
+        if z < min_zoom:
+            continue
+        features = get_layer_features(model, z, x, y, bounds)
+        if len(features) != 0:
+            tile += encode_layer(name, features)
+    return tile
+
+
+"""
+Tile cache
+"""
+
+
+def get_cache_dir():
+    return getattr(settings, 'VECTOR_TILE_CACHE_DIR', None)
+
+
+def get_tile(z, x, y):
+    """
+    Returns the encoded tile at z/x/y, from the tile cache if it was rendered before.
+    Raises ValueError if there is no such tile.
+    """
+    if not is_valid_tile(z, x, y):
+        raise ValueError(f'Invalid tile {z}/{x}/{y}, zoom must be at most {MAX_ZOOM}')
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return render_tile(z, x, y)
+    path = os.path.join(cache_dir, str(z), str(x), f'{y}.mvt')
+    try:
+        with open(path, 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        pass
+    tile = render_tile(z, x, y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written to a temporary file first so a concurrent request never reads part of a tile
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(tile)
+    os.replace(temp_path, path)
+    return tile
+
+
+def list_dir_ints(path):
+    try:
+        return [int(name.split('.')[0]) for name in os.listdir(path) if name.split('.')[0].isdigit()]
+    except FileNotFoundError:
+        return []
+
+
+def invalidate_tiles(extent):
+    """
+    Deletes the cached tiles at every zoom that intersect an extent (min_lon, min_lat, max_lon, max_lat).
+    """
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return
+    for z in list_dir_ints(cache_dir):
+        x_range, y_range = get_tile_ranges(extent, z)
+        for x in list_dir_ints(os.path.join(cache_dir, str(z))):
+            if x not in x_range:
+                continue
+            for y in list_dir_ints(os.path.join(cache_dir, str(z), str(x))):
+                if y in y_range:
+                    try:
+                        os.remove(os.path.join(cache_dir, str(z), str(x), f'{y}.mvt'))
+                    except FileNotFoundError:
+                        pass
+
+
+def invalidate_polygon_tiles(polygon_ids):
+    """
+    Deletes the cached tiles drawing the given polygons. The tiles of the states
+    containing them are deleted too, because their properties count the AHJs within them.
+    """
+    polygon_ids = {polygon_id for polygon_id in polygon_ids if polygon_id is not None}
+    cache_dir = get_cache_dir()
+    if len(polygon_ids) == 0 or cache_dir is None or not os.path.isdir(cache_dir):
+        return
+    for _, model, _ in TILE_LAYERS[1:]:
+        polygon_ids |= set(model.objects.filter(PolygonID__in=polygon_ids).values_list('StatePolygonID', flat=True))
+    envelopes = Polygon.objects.filter(PolygonID__in=polygon_ids).annotate(envelope=Envelope('Polygon')).values_list('envelope', flat=True)
+    for envelope in envelopes:
+        invalidate_tiles(envelope.extent)
+
+
+def clear_tile_cache():
+    cache_dir = get_cache_dir()
+    if cache_dir is not None:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def record_old_ahj_polygon(sender, instance, **kwargs):
+    """
+    Records the polygon an AHJ was paired with before it is saved,
+    so the tiles drawing the AHJ there are deleted too.
+    """
+    cache_dir = get_cache_dir()
+    if kwargs.get('raw', False) or instance.pk is None or cache_dir is None or not os.path.isdir(cache_dir):
+        return
+    instance._old_tile_polygon_id = AHJ.objects.filter(AHJPK=instance.pk).values_list('PolygonID', flat=True).first()
+
+
+def invalidate_ahj_tiles(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    invalidate_polygon_tiles({instance.PolygonID_id, getattr(instance, '_old_tile_polygon_id', None)})
+
+
+def invalidate_polygon_instance_tiles(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    invalidate_polygon_tiles({instance.PolygonID})
+
+
+def connect_signals():
+    pre_save.connect(record_old_ahj_polygon, sender=AHJ, dispatch_uid='vector_tiles_ahj_pre_save')
+    post_save.connect(invalidate_ahj_tiles, sender=AHJ, dispatch_uid='vector_tiles_ahj_save')
+    pre_delete.connect(invalidate_ahj_tiles, sender=AHJ, dispatch_uid='vector_tiles_ahj_delete')
+    post_save.connect(invalidate_polygon_instance_tiles, sender=Polygon, dispatch_uid='vector_tiles_polygon_save')
+    pre_delete.connect(invalidate_polygon_instance_tiles, sender=Polygon, dispatch_uid='vector_tiles_polygon_delete')
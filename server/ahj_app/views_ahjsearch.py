@@ -1,13 +1,17 @@
+from django.conf import settings
 from rest_framework import status
 from rest_framework.decorators import api_view, throttle_classes
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from rest_framework.throttling import AnonRateThrottle
 
+from .documents import serialize_ahj, serialize_ahjs
 from .models import AHJ
-from .serializers import AHJSerializer
+from .name_index import get_name_index
+from .pagination import paginate_ahj_search
+from .polygon_detail import get_detail
+from .response_cache import cache_ahj_response
 from .utils import get_multipolygon, get_multipolygon_wkt, get_str_location, \
-    filter_ahjs, order_ahj_list_AHJLevelCode_PolygonLandArea, get_location_gecode_address_str
+    order_ahj_list_AHJLevelCode_PolygonLandArea, get_location_gecode_address_str
 
 
 @api_view(['POST'])
@@ -16,6 +20,11 @@ def webpage_ahj_list(request):
     """
     Functional view for the WebPageAHJList
     """
+    try:
+        polygon_detail = get_detail(request.query_params.get('detail', None), settings.AHJ_POLYGON_DETAIL_DEFAULT)
+    except ValueError as e:
+        return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+
     # By default select all the AHJs
     # filter by the latitude, longitude
     json_location = get_location_gecode_address_str(request.data.get('Address', None))
@@ -26,7 +35,7 @@ def webpage_ahj_list(request):
         polygon_wkt = get_multipolygon_wkt(multipolygon=polygon)
     str_location = get_str_location(location=json_location)
 
-    ahjs = filter_ahjs(
+    search = dict(
         AHJName=request.data.get('AHJName', None),
         AHJID=request.data.get('AHJID', None),
         AHJPK=request.data.get('AHJPK', None),
@@ -48,10 +57,8 @@ def webpage_ahj_list(request):
         polygon_center = polygon.centroid
         json_location = {'Latitude': {'Value': polygon_center[1]}, 'Longitude': {'Value': polygon_center[0]}}
 
-    serializer = AHJSerializer
-    paginator = LimitOffsetPagination()
-    context = {'is_public_view': request.data.get('use_public_view', False)}
-    page = paginator.paginate_queryset(ahjs, request)
+    paginator, page = paginate_ahj_search(search, request)
+    context = {'is_public_view': request.data.get('use_public_view', False), 'polygon_detail': polygon_detail}
 
     if str_location is not None or polygon is not None:
         """
@@ -59,7 +66,7 @@ def webpage_ahj_list(request):
         """
         page = order_ahj_list_AHJLevelCode_PolygonLandArea(page)
 
-    payload = serializer(page, many=True, context=context).data
+    payload = serialize_ahjs(page, context=context)
 
     return paginator.get_paginated_response({
         'Location': json_location,
@@ -68,12 +75,50 @@ def webpage_ahj_list(request):
 
 
 @api_view(['GET'])
+@cache_ahj_response(is_public_view=False)
 def get_single_ahj(request):
     """
     Endpoint to get a single ahj given an AHJPK
     """
     try:
+        polygon_detail = get_detail(request.query_params.get('detail', None), settings.AHJ_POLYGON_DETAIL_DEFAULT)
         ahj = AHJ.objects.get(AHJPK=request.query_params.get('AHJPK'))
-        return Response(AHJSerializer(ahj).data, status=status.HTTP_200_OK)
+        return Response(serialize_ahj(ahj, context={'polygon_detail': polygon_detail}), status=status.HTTP_200_OK)
     except Exception as e:
         return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+
+
+"""
+Maximum number of AHJs returned by ahj_autocomplete
+"""
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+"""
+Searches shorter than this match too many names to be useful suggestions
+"""
+AUTOCOMPLETE_MIN_LENGTH = 2
+
+
+@api_view(['GET'])
+def ahj_autocomplete(request):
+    """
+    Suggests AHJs whose names match the 'q' query parameter, best match first.
+    Answered from the name index when it is loaded (see name_index.py).
+    """
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = min(int(request.query_params.get('limit', 10)), AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        return Response('Invalid limit, must be an integer', status=status.HTTP_400_BAD_REQUEST)
+    if len(query) < AUTOCOMPLETE_MIN_LENGTH or limit <= 0:
+        return Response([], status=status.HTTP_200_OK)
+    index = get_name_index()
+    if index is not None:
+        suggestions = [{'AHJPK': entry.AHJPK, 'AHJID': entry.AHJID, 'AHJName': entry.AHJName, 'StateProvince': entry.StateProvince}
+                       for entry, score in index.search(query, limit=limit)]
+    else:
+        suggestions = [{'AHJPK': ahjpk, 'AHJID': ahjid, 'AHJName': name, 'StateProvince': state or ''}
+                       for ahjpk, ahjid, name, state in AHJ.objects.filter(AHJName__icontains=query)
+                                                                   .order_by('AHJName', 'AHJPK')
+                                                                   .values_list('AHJPK', 'AHJID', 'AHJName', 'AddressID__StateProvince')[:limit]]
+    return Response(suggestions, status=status.HTTP_200_OK)
@@ -3,19 +3,25 @@ import datetime
 
 
 from django.apps import apps
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 from rest_framework import status
 from rest_framework.decorators import permission_classes, authentication_classes, api_view
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from .authentication import APITokenAuth
+from .documents import serialize_ahjs
+from .export import iter_ahj_export_lines
 from .models import APIToken
-from .serializers import AHJSerializer
+from .pagination import paginate_ahj_search
+from .response_cache import GEO_LOOKUP_HEADER, cache_ahj_response
 from .utils import order_ahj_list_AHJLevelCode_PolygonLandArea, filter_ahjs, get_str_location, \
-    get_public_api_serializer_context, get_ob_value_primitive, get_str_address, get_location_gecode_address_str, check_address_empty
+    get_public_api_serializer_context, get_ob_value_primitive, get_str_address, get_location_gecode_address_str, check_address_empty, \
+    get_ahj_lists_containing_locations, get_polygon_ids_containing_location
 
 
 
@@ -26,6 +32,7 @@ def deactivate_expired_api_tokens():
 @api_view(['POST'])
 @authentication_classes([APITokenAuth])
 @permission_classes([IsAuthenticated])
+@cache_ahj_response(is_public_view=True)
 def ahj_list(request):
     """
     Functional view for the AHJList
@@ -52,7 +59,7 @@ def ahj_list(request):
                 str_location = get_str_location(location=json_location)
     except TypeError:
         return Response('Invalid Address, all values must be strings', status=status.HTTP_400_BAD_REQUEST)
-    ahjs = filter_ahjs(
+    search = dict(
         AHJName=get_ob_value_primitive(request.data, 'AHJName', throw_exception=False),
         AHJID=get_ob_value_primitive(request.data, 'AHJID', throw_exception=False),
         AHJCode=get_ob_value_primitive(request.data, 'AHJCode', throw_exception=False),
@@ -65,14 +72,12 @@ def ahj_list(request):
         StateProvince=get_ob_value_primitive(request.data, 'StateProvince', throw_exception=False),
         location=str_location)
 
-    serializer = AHJSerializer
-    paginator = LimitOffsetPagination()
+    paginator, page = paginate_ahj_search(search, request)
     context = get_public_api_serializer_context()
-    page = paginator.paginate_queryset(ahjs, request)
 
     if str_location is not None:
         page = order_ahj_list_AHJLevelCode_PolygonLandArea(page)
-    payload = serializer(page, many=True, context=context).data
+    payload = serialize_ahjs(page, context=context)
 
     # Mimics implementation of LimitOffsetPagination.get_paginated_response(data)
     return Response(OrderedDict([
@@ -86,6 +91,7 @@ def ahj_list(request):
 @api_view(['POST'])
 @authentication_classes([APITokenAuth])
 @permission_classes([IsAuthenticated])
+@cache_ahj_response(is_public_view=True)
 def ahj_geo_location(request):
     ahjs_to_search = request.data.get('ahjs_to_search', None)
 
@@ -102,7 +108,9 @@ def ahj_geo_location(request):
     except (TypeError, KeyError, ValueError) as e:
         return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
 
-    ahjs = filter_ahjs(location=str_location)
+    # The response reports whether the polygons containing the location were read from the geo grid or tested
+    polygon_ids, geo_lookup = get_polygon_ids_containing_location(str_location)
+    ahjs = filter_ahjs(location=str_location, location_polygon_ids=polygon_ids)
 
     # Only include ahjs whose AHJID is in ahjs_to_search, if ahjs_to_search was given
     if ahjs_to_search is None:
@@ -110,12 +118,53 @@ def ahj_geo_location(request):
     else:
         ahj_result = [ahj for ahj in ahjs if ahj.AHJID in ahjs_to_search]
     ahj_result = order_ahj_list_AHJLevelCode_PolygonLandArea(ahj_result)
-    return Response(AHJSerializer(ahj_result, many=True, context=get_public_api_serializer_context()).data, status=status.HTTP_200_OK)
+    return Response(serialize_ahjs(ahj_result, context=get_public_api_serializer_context()), status=status.HTTP_200_OK,
+                    headers={GEO_LOOKUP_HEADER: geo_lookup})
 
 
 @api_view(['POST'])
 @authentication_classes([APITokenAuth])
 @permission_classes([IsAuthenticated])
+def ahj_geo_location_batch(request):
+    """
+    Finds the AHJs of every Location in a list of Orange Button Locations.
+    Returns a list of the ordered AHJ list of each Location, in the order the Locations were sent.
+    """
+    ahjs_to_search = request.data.get('ahjs_to_search', None)
+
+    ob_locations = request.data.get('Locations', None)
+    if not isinstance(ob_locations, list) or len(ob_locations) == 0:
+        return Response('Locations must be a non-empty list of Locations.', status=status.HTTP_400_BAD_REQUEST)
+    if len(ob_locations) > settings.GEO_LOCATION_BATCH_MAX_SIZE:
+        return Response(f'At most {settings.GEO_LOCATION_BATCH_MAX_SIZE} Locations can be sent per request.', status=status.HTTP_400_BAD_REQUEST)
+
+    str_locations = []
+    for i, ob_location in enumerate(ob_locations):
+        try:
+            # Each entry may be an Orange Button Location or an object containing one
+            if isinstance(ob_location, dict) and 'Location' in ob_location:
+                ob_location = ob_location['Location']
+            str_location = get_str_location(ob_location)
+        except (TypeError, KeyError, ValueError, AttributeError) as e:
+            return Response(f'Locations[{i}]: {e}', status=status.HTTP_400_BAD_REQUEST)
+        if str_location is None:
+            return Response(f'Locations[{i}]: Location field(s) cannot be empty.', status=status.HTTP_400_BAD_REQUEST)
+        str_locations.append(str_location)
+
+    location_ahjs = get_ahj_lists_containing_locations(str_locations, ahjs_to_search=ahjs_to_search)
+
+    # Serialize each AHJ once, no matter how many Locations it was found at
+    distinct_ahjs = list({ahj.AHJPK: ahj for ahjs in location_ahjs.values() for ahj in ahjs}.values())
+    ahj_payloads = dict(zip([ahj.AHJPK for ahj in distinct_ahjs],
+                            serialize_ahjs(distinct_ahjs, context=get_public_api_serializer_context())))
+    return Response([[ahj_payloads[ahj.AHJPK] for ahj in location_ahjs[str_location]] for str_location in str_locations],
+                    status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@authentication_classes([APITokenAuth])
+@permission_classes([IsAuthenticated])
+@cache_ahj_response(is_public_view=True)
 def ahj_geo_address(request):
     ahjs_to_search = request.data.get('ahjs_to_search', None)
 
@@ -141,4 +190,37 @@ def ahj_geo_address(request):
     else:
         ahj_result = [ahj for ahj in ahjs if ahj.AHJID in ahjs_to_search]
     ahj_result = order_ahj_list_AHJLevelCode_PolygonLandArea(ahj_result)
-    return Response(AHJSerializer(ahj_result, many=True, context=get_public_api_serializer_context()).data, status=status.HTTP_200_OK)
+    return Response(serialize_ahjs(ahj_result, context=get_public_api_serializer_context()), status=status.HTTP_200_OK)
+
+
+def parse_since(since):
+    """
+    Parses an ISO 8601 date or datetime to an aware datetime.
+    Naive datetimes are in the current time zone. Raises ValueError if it is invalid.
+    """
+    since_datetime = parse_datetime(since)
+    if since_datetime is None:
+        since_date = parse_date(since)
+        if since_date is None:
+            raise ValueError('Invalid since, must be an ISO 8601 date or datetime')
+        since_datetime = datetime.datetime.combine(since_date, datetime.time())
+    if timezone.is_naive(since_datetime):
+        since_datetime = timezone.make_aware(since_datetime)
+    return since_datetime
+
+
+@api_view(['GET'])
+@authentication_classes([APITokenAuth])
+@permission_classes([IsAuthenticated])
+def ahj_export(request):
+    """
+    Streams the public view of every AHJ as JSON Lines, ordered by AHJPK.
+    The 'since' query parameter limits the export to the AHJs changed since then,
+    followed by a {"AHJID": {"Value": ...}, "Deleted": true} line for each AHJ deleted since then.
+    """
+    since = request.query_params.get('since', None)
+    try:
+        since = parse_since(since) if since is not None else None
+    except ValueError as e:
+        return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+    return StreamingHttpResponse(iter_ahj_export_lines(since=since), content_type='application/x-ndjson')
@@ -0,0 +1,118 @@
+"""
+Async variants of the search endpoints that geocode an address.
+
+ahj_list, ahj_geo_address and webpage_ahj_list block a thread for the
+whole round trip to the geocoder when an address is not in the geocode
+cache. Their async variants run the same DRF views in three steps:
+
+- In a thread, the request is authenticated, checked, and throttled, and
+  the address to geocode is read from its body.
+- On the event loop, the address is geocoded with geocode_address_async,
+  which stores the result in the geocode cache.
+- In a thread, the DRF view handles the request, finding the address in
+  the geocode cache, and its response is rendered.
+
+Under an ASGI server, a worker then serves many geocoding requests at once,
+while at most settings.ASYNC_DB_MAX_THREADS threads run database work (see
+async_db.py). Under WSGI, the views work but gain nothing.
+"""
+from . import views_ahjsearch, views_ahjsearch_api
+from .async_db import run_sync
+from .geocoding import geocode_address_async
+from .utils import check_address_empty, get_str_address
+
+
+def get_ahj_list_address(request):
+    """
+    Returns the address ahj_list geocodes: the sent Address, unless a Location was sent.
+    """
+    if request.data.get('Location', None) is not None:
+        return None
+    ob_address = request.data.get('Address', None)
+    return get_str_address(ob_address) if ob_address is not None else None
+
+
+def get_geo_address(request):
+    """
+    Returns the address ahj_geo_address geocodes, or None if it has no address fields.
+    """
+    ob_address = request.data.get('Address', None)
+    str_address = get_str_address(ob_address if ob_address is not None else request.data)
+    return str_address if check_address_empty(str_address) is not None else None
+
+
+def get_webpage_address(request):
+    address = request.data.get('Address', None)
+    return address if isinstance(address, str) else None
+
+
+def start_view(view, request, get_address):
+    """
+    Runs the DRF checks of a function view on a request, as APIView.dispatch does before calling the view.
+    Returns the APIView, the DRF request, and the address to geocode, or a response if a check failed.
+    """
+    api_view = view.cls(**view.initkwargs)
+    api_view.setup(request)
+    api_view.args, api_view.kwargs = (), {}
+    drf_request = api_view.initialize_request(request)
+    api_view.request = drf_request
+    api_view.headers = api_view.default_response_headers
+    try:
+        api_view.initial(drf_request)
+    except Exception as exc:
+        return api_view, drf_request, None, finish_view(api_view, drf_request, exc=exc)
+    try:
+        address = get_address(drf_request)
+    except Exception:
+        # The view reports the invalid request
+        address = None
+    return api_view, drf_request, address, None
+
+
+def finish_view(api_view, drf_request, exc=None):
+    """
+    Calls the function view of an APIView started by start_view, or handles exc,
+    and returns the rendered response.
+    """
+    try:
+        if exc is not None:
+            raise exc
+        method = drf_request.method.lower()
+        if method in api_view.http_method_names:
+            handler = getattr(api_view, method, api_view.http_method_not_allowed)
+        else:
+            handler = api_view.http_method_not_allowed
+        response = handler(drf_request)
+    except Exception as exc:
+        response = api_view.handle_exception(exc)
+    api_view.response = api_view.finalize_response(drf_request, response)
+    return api_view.response.render()
+
+
+async def run_view_async(view, request, get_address):
+    api_view, drf_request, address, response = await run_sync(start_view, view, request, get_address)
+    if response is not None:
+        return response
+    if address:
+        await geocode_address_async(address)
+    return await run_sync(finish_view, api_view, drf_request)
+
+
+def async_view(view, get_address):
+    """
+    Returns the async variant of a DRF function view geocoding the address returned by get_address.
+    """
+    async def view_async(request):
+        return await run_view_async(view, request, get_address)
+    view_async.__name__ = view.__name__ + '_async'
+    view_async.__doc__ = f'Async variant of {view.__name__}'
+    # DRF views are exempt from Django's CSRF check, and check CSRF when authenticating by session
+    view_async.csrf_exempt = True
+    return view_async
+
+
+ahj_list = async_view(views_ahjsearch_api.ahj_list, get_ahj_list_address)
+
+ahj_geo_address = async_view(views_ahjsearch_api.ahj_geo_address, get_geo_address)
+
+webpage_ahj_list = async_view(views_ahjsearch.webpage_ahj_list, get_webpage_address)
@@ -1,17 +1,25 @@
 from collections import OrderedDict
 
+from django.conf import settings
 from django.db import connection
+from django.http import HttpResponse
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from .models import Polygon
+from .polygon_detail import get_detail
 from .serializers import PolygonSerializer
 from .utils import dictfetchall
+from .vector_tiles import MVT_CONTENT_TYPE, get_tile
 
 
 @api_view(['GET'])
 def data_map(request):
+    """
+    Returns the code coverage of each state, or of each polygon of the state given by StatePK.
+    The counts are read from the tables maintained by coverage.py.
+    """
     try:
         state_pk = request.query_params.get('StatePK', None)
         polygon_columns = 'Polygon.PolygonID, InternalPLatitude, InternalPLongitude, Name'
@@ -23,34 +31,20 @@ def data_map(request):
                                'IF(ElectricCode IS NULL,0,1) as numElectricCodes,'
                                'IF(FireCode IS NULL,0,1) as numFireCodes,'
                                'IF(ResidentialCode IS NULL,0,1) as numResidentialCodes,'
-                               'IF(WindCode IS NULL,0,1) as numWindCodes FROM '
-                               '(SELECT PolygonID FROM CountyPolygon WHERE StatePolygonID=%(StatePK)s '
-                               'UNION SELECT PolygonID FROM CityPolygon WHERE StatePolygonID=%(StatePK)s '
-                               'UNION SELECT PolygonID FROM CountySubdivisionPolygon WHERE StatePolygonID=%(StatePK)s) '
-                               'as polygons_of_state '
-                               'JOIN Polygon ON Polygon.PolygonID=polygons_of_state.PolygonID '
-                               'LEFT JOIN AHJ ON Polygon.PolygonID=AHJ.PolygonID;',
+                               'IF(WindCode IS NULL,0,1) as numWindCodes FROM PolygonCoverage '
+                               'JOIN Polygon ON Polygon.PolygonID=PolygonCoverage.PolygonID '
+                               'LEFT JOIN AHJ ON Polygon.PolygonID=AHJ.PolygonID '
+                               'WHERE PolygonCoverage.StatePolygonID=%(StatePK)s;',
                                params={'StatePK': state_pk})
                 results = dictfetchall(cursor)
         else:
             with connection.cursor() as cursor:
-                cursor.execute('SELECT numAHJs, numBuildingCodes, numElectricCodes, numFireCodes,'
-                               f'numResidentialCodes, numWindCodes, {polygon_columns} FROM '
-                               '(SELECT COUNT(*) as numAHJs,'
-                               'SUM(BuildingCode IS NOT NULL) as numBuildingCodes,'
-                               'SUM(ElectricCode IS NOT NULL) as numElectricCodes,'
-                               'SUM(FireCode IS NOT NULL) as numFireCodes,'
-                               'SUM(ResidentialCode IS NOT NULL) as numResidentialCodes,'
-                               'SUM(WindCode IS NOT NULL) as numWindCodes,'
-                               'StatePolygonID FROM '
-                               '(SELECT PolygonID, StatePolygonID FROM CountyPolygon '
-                               'UNION SELECT PolygonID, StatePolygonID FROM CityPolygon '
-                               'UNION SELECT PolygonID, StatePolygonID FROM CountySubdivisionPolygon) '
-                               'as polygons_of_state '
-                               'LEFT JOIN AHJ ON polygons_of_state.PolygonID=AHJ.PolygonID GROUP BY StatePolygonID) '
-                               'as all_states '
-                               'RIGHT JOIN StatePolygon ON all_states.StatePolygonID=StatePolygon.PolygonID '
-                               'JOIN Polygon ON StatePolygon.PolygonID=Polygon.PolygonID;')
+                cursor.execute('SELECT NumAHJs as numAHJs, NumBuildingCodes as numBuildingCodes,'
+                               'NumElectricCodes as numElectricCodes, NumFireCodes as numFireCodes,'
+                               'NumResidentialCodes as numResidentialCodes, NumWindCodes as numWindCodes,'
+                               f'{polygon_columns} FROM StatePolygon '
+                               'JOIN Polygon ON StatePolygon.PolygonID=Polygon.PolygonID '
+                               'LEFT JOIN StateCoverage ON StatePolygon.PolygonID=StateCoverage.StatePolygonID;')
                 results = dictfetchall(cursor)
         return Response([OrderedDict(result) for result in results], status=status.HTTP_200_OK)
     except Exception as e:
@@ -60,9 +54,25 @@ def data_map(request):
 @api_view(['GET'])
 def data_map_get_polygon(request):
     """
-    Returns a polygon in GeoJSON given its ID
+    Returns a polygon in GeoJSON given its ID, with its geometry
+    at the detail level given by the 'detail' parameter
     """
     try:
-        return Response(PolygonSerializer(Polygon.objects.get(PolygonID=request.query_params.get('PolygonID', None))).data, status=status.HTTP_200_OK)
+        polygon_detail = get_detail(request.query_params.get('detail', None), settings.DATA_MAP_POLYGON_DETAIL_DEFAULT)
+        polygons = Polygon.objects.all() if polygon_detail == 'full' else Polygon.objects.defer('Polygon')
+        polygon = polygons.get(PolygonID=request.query_params.get('PolygonID', None))
+        return Response(PolygonSerializer(polygon, context={'polygon_detail': polygon_detail}).data, status=status.HTTP_200_OK)
     except Exception as e:
         return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+def vector_tile(request, z, x, y):
+    """
+    Returns the Mapbox Vector Tile of the jurisdiction polygons at z/x/y
+    """
+    try:
+        tile = get_tile(z, x, y)
+    except ValueError as e:
+        return Response(str(e), status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(tile, content_type=MVT_CONTENT_TYPE)
@@ -1,4 +1,6 @@
 import datetime
+import time
+from collections import OrderedDict
 
 from django.apps import apps
 from django.db import transaction
@@ -7,15 +9,21 @@ from rest_framework import status
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from simple_history.utils import bulk_update_with_history
 
+from . import enum_registry
 from .authentication import WebpageTokenAuth
+from .coverage import get_ahj_coverage_values, update_coverage
+from .documents import get_rows_ahjpks, invalidate_ahj_documents
+from .geocode_jobs import enqueue_geocode_jobs
 
-from .models import AHJ, Edit, Location, AHJUserMaintains
+from .models import AHJ, Edit, AHJUserMaintains
 from .serializers import AHJSerializer, EditSerializer, ContactSerializer, \
     EngineeringReviewRequirementSerializer, PermitIssueMethodUseSerializer, DocumentSubmissionMethodUseSerializer, \
     FeeStructureSerializer, AHJInspectionSerializer
 from .usf import ENUM_FIELDS, get_enum_value_row
-from .utils import get_elevation, get_enum_value_row_else_null
+from .utils import get_enum_value_row_else_null
+from .vector_tiles import invalidate_polygon_tiles
 
 
 def add_edit(edit_dict: dict, ReviewStatus='P', ApprovedBy=None, DateEffective=None):
@@ -41,82 +49,16 @@ def add_edit(edit_dict: dict, ReviewStatus='P', ApprovedBy=None, DateEffective=N
     return edit
 
 
-def create_addr_string(Address):
-    addr = Address.AddrLine1
-    if addr != '' and Address.AddrLine2 != '':
-        addr += ', ' + Address.AddrLine2
-    elif Address.AddrLine2 != '':
-        addr += Address.AddrLine2
-    if addr != '' and Address.AddrLine3!= '':
-        addr += ', ' + Address.AddrLine3
-    elif Address.AddrLine3 != '':
-        addr += Address.AddrLine3
-    if addr != '' and Address.City != '':
-        addr += ', ' + Address.City
-    elif Address.City != '':
-        addr += Address.City
-    if addr != '' and Address.County != '':
-        addr += ', ' + Address.County
-    elif Address.County != '':
-        addr += Address.County
-    if addr != '' and Address.StateProvince != '':
-        addr += ', ' + Address.StateProvince
-    elif Address.StateProvince != '':
-        addr += Address.StateProvince
-    if addr != '' and Address.Country != '':
-        addr += ', ' + Address.Country
-    elif Address.Country != '':
-        addr += Address.Country
-    if addr != '' and Address.ZipPostalCode != '':
-        addr += ', ' + Address.ZipPostalCode
-    elif Address.ZipPostalCode != '':
-        addr += Address.ZipPostalCode
-
-    return addr
-
-
-def addr_string_from_dict(Address):
-    addr = Address["AddrLine1"]
-    if addr != '' and Address["AddrLine2"] != '':
-        addr += ', ' + Address["AddrLine2"]
-    elif Address["AddrLine2"] != '':
-        addr += Address["AddrLine2"]
-    if addr != '' and Address["AddrLine3"] != '':
-        addr += ', ' + Address["AddrLine3"]
-    elif Address["AddrLine3"] != '':
-        addr += Address["AddrLine3"]
-    if addr != '' and Address["City"] != '':
-        addr += ', ' + Address["City"]
-    elif Address["City"] != '':
-        addr += Address["City"]
-    if addr != '' and Address["County"] != '':
-        addr += ', ' + Address["County"]
-    elif Address["County"] != '':
-        addr += Address["County"]
-    if addr != '' and Address["StateProvince"] != '':
-        addr += ', ' + Address["StateProvince"]
-    elif Address["StateProvince"] != '':
-        addr += Address["StateProvince"]
-    if addr != '' and Address["Country"] != '':
-        addr += ', ' + Address["Country"]
-    elif Address["Country"] != '':
-        addr += Address["Country"]
-    if addr != '' and Address["ZipPostalCode"] != '':
-        addr += ', ' + Address["ZipPostalCode"]
-    elif Address["ZipPostalCode"] != '':
-        addr += Address["ZipPostalCode"]
-
-    return addr
-
-
 def edit_get_source_column_value(edit):
     """
     Gets the current value of the source column of the edited row.
     """
     row = edit.get_edited_row()
-    current_value = getattr(row, edit.SourceColumn)
     if edit.SourceColumn in ENUM_FIELDS:
-        current_value = current_value.Value if current_value is not None else ''
+        current_value = enum_registry.get_field_value(row, edit.SourceColumn)
+        current_value = current_value if current_value is not None else ''
+    else:
+        current_value = getattr(row, edit.SourceColumn)
     return current_value
 
 
@@ -130,41 +72,133 @@ def edit_get_old_new_value(edit, old_new_field):
     return edit_value
 
 
-def apply_edits(ready_edits=None):
+"""
+Number of edited rows written per transaction by apply_edits
+"""
+APPLY_EDITS_CHUNK_SIZE = 500
+
+
+def get_row_changes(approved_edits, rejected_addition_edits):
+    """
+    Groups edits by their SourceTable and SourceRow.
+    Returns an OrderedDict of SourceTable to an OrderedDict of SourceRow to a dict
+    of each edited column to its last (value, edit). Rejected additions set the
+    relation status column of their row to False after the approved edits.
+    """
+    changes = OrderedDict()
+    for edit in approved_edits:
+        value = edit_get_old_new_value(edit, 'NewValue')
+        changes.setdefault(edit.SourceTable, OrderedDict()).setdefault(edit.SourceRow, {})[edit.SourceColumn] = (value, edit)
+    status_fields = {}
+    for edit in rejected_addition_edits:
+        if edit.SourceTable not in status_fields:
+            status_fields[edit.SourceTable] = apps.get_model('ahj_app', edit.SourceTable)().get_relation_status_field()
+        changes.setdefault(edit.SourceTable, OrderedDict()).setdefault(edit.SourceRow, {})[status_fields[edit.SourceTable]] = (False, edit)
+    return changes
+
+
+def get_ahj_polygon_changes(old_values, rows):
+    """
+    Returns the PolygonIDs whose coverage and vector tiles change with the given AHJ rows,
+    where old_values is a dict of each row's AHJPK to its values before it was edited.
+    """
+    coverage_polygon_ids = set()
+    tile_polygon_ids = set()
+    for row in rows:
+        old_polygon_id = old_values[row.AHJPK][0]
+        tile_polygon_ids |= {old_polygon_id, row.PolygonID_id}
+        if old_values[row.AHJPK] != get_ahj_coverage_values(row):
+            coverage_polygon_ids |= {old_polygon_id, row.PolygonID_id}
+    return coverage_polygon_ids, tile_polygon_ids
+
+
+def apply_row_changes(model_name, row_changes, report, chunk_size=APPLY_EDITS_CHUNK_SIZE):
+    """
+    Applies the changes of get_row_changes to the rows of one table,
+    writing chunk_size rows and their history rows per transaction.
+    Returns the edited Address rows, whose locations must be geocoded.
+    """
+    model = apps.get_model('ahj_app', model_name)
+    pk_name = model._meta.pk.name
+    row_pks = list(row_changes)
+    edited_addresses = []
+    for i in range(0, len(row_pks), chunk_size):
+        chunk_pks = row_pks[i:i + chunk_size]
+        with transaction.atomic():
+            rows = {getattr(row, pk_name): row for row in model.objects.select_for_update().filter(**{pk_name + '__in': chunk_pks})}
+            old_values = {row.AHJPK: get_ahj_coverage_values(row) for row in rows.values()} if model is AHJ else {}
+            edited_rows = []
+            fields = set()
+            for row_pk in chunk_pks:
+                row = rows.get(row_pk)
+                if row is None:
+                    report['missing'] += len(row_changes[row_pk])
+                    continue
+                for column, (value, edit) in row_changes[row_pk].items():
+                    setattr(row, column, value)
+                    fields.add(column)
+                    # The history row of the edited row is attributed to the approver of its last edit
+                    row._history_user = edit.ApprovedBy
+                edited_rows.append(row)
+            if len(edited_rows) == 0:
+                continue
+            bulk_update_with_history(edited_rows, model, sorted(fields), batch_size=chunk_size)
+            # bulk_update does not send the signals that invalidate the documents, coverage, and tiles
+            invalidate_ahj_documents(get_rows_ahjpks(model_name, edited_rows))
+            if model is AHJ:
+                coverage_polygon_ids, tile_polygon_ids = get_ahj_polygon_changes(old_values, edited_rows)
+                update_coverage(coverage_polygon_ids)
+                invalidate_polygon_tiles(tile_polygon_ids)
+        report['rows'] += len(edited_rows)
+        if model_name == 'Address':
+            edited_addresses += edited_rows
+    return edited_addresses
+
+
+def get_day_range(day):
+    """
+    Returns the start of the given day and of the next day in the current time zone.
+    """
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+    end = timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()))
+    return start, end
+
+
+def get_edits_effective_on(day, review_status):
+    """
+    Returns the reviewed edits with the given ReviewStatus whose DateEffective is on the given day,
+    in the order they take effect. DateEffective is compared to the bounds of the day
+    rather than with __date, which wraps the column in DATE() so its index cannot be used.
+    """
+    start, end = get_day_range(day)
+    return Edit.objects.filter(ReviewStatus=review_status, DateEffective__gte=start, DateEffective__lt=end) \
+                       .exclude(ApprovedBy=None).select_related('ApprovedBy').order_by('DateEffective', 'EditID')
+
+
+def apply_edits(ready_edits=None, chunk_size=APPLY_EDITS_CHUNK_SIZE):
     """
     Applies the changes of a list of edits.
     If a list is not provided, it applies all edits whose DateEffective is today.
     For rejected edit additions, this sets the SourceColumn of the edited row to False.
+    When several edits change the same column of a row, the last one is applied.
+    The geocoding of edited addresses is queued (see geocode_jobs.py).
+    Returns a dict of the number of 'edits' applied, the number of 'rows' written,
+    the number of edits whose row was 'missing', and the 'seconds' taken.
     """
+    start = time.monotonic()
     if ready_edits is None:
-        ready_edits = Edit.objects.filter(ReviewStatus='A',
-                                          DateEffective__date=datetime.date.today()).exclude(ApprovedBy=None)
-    for edit in ready_edits:
-        row = edit.get_edited_row()
-        edit_value = edit_get_old_new_value(edit, 'NewValue')
-        setattr(row, edit.SourceColumn, edit_value)
-        row.save()
-        if edit.SourceTable == "Address":
-            """
-            Geocode Address objects to set Location fields.
-            """
-            addr_string = create_addr_string(row)
-            if addr_string != '':
-                loc = get_elevation(create_addr_string(row))
-                location = Location.objects.get(LocationID=row.LocationID.LocationID)
-                location.Elevation = loc['Elevation']['Value']
-                location.Longitude = loc['Longitude']['Value']
-                location.Latitude = loc['Latitude']['Value']
-                location.save()
-
+        ready_edits = get_edits_effective_on(datetime.date.today(), 'A')
     # If an addition edit is rejected, set its status false
-    rejected_addition_edits = Edit.objects.filter(ReviewStatus='R',
-                                                  EditType='A',
-                                                  DateEffective__date=datetime.date.today()).exclude(ApprovedBy=None)
-    for edit in rejected_addition_edits:
-        row = edit.get_edited_row()
-        setattr(row, row.get_relation_status_field(), False)
-        row.save()
+    rejected_addition_edits = get_edits_effective_on(datetime.date.today(), 'R').filter(EditType='A')
+    ready_edits = list(ready_edits)
+    rejected_addition_edits = list(rejected_addition_edits)
+    report = {'edits': len(ready_edits) + len(rejected_addition_edits), 'rows': 0, 'missing': 0}
+    edited_addresses = []
+    for model_name, row_changes in get_row_changes(ready_edits, rejected_addition_edits).items():
+        edited_addresses += apply_row_changes(model_name, row_changes, report, chunk_size=chunk_size)
+    enqueue_geocode_jobs(edited_addresses)
+    report['seconds'] = time.monotonic() - start
+    return report
 
 
 def revert_edit(user, edit):
@@ -323,15 +357,13 @@ def create_row(model, obj):
             NOTE: This assumes the field name matches the name of its model!
             For example, a serialized 'Contact' has the field 'Address', and Address is a model
             """
+            rel_row = create_row(apps.get_model('ahj_app', field), value)
             if field == "Address":
                 """
-                Geocode Address objects to set Location fields.
+                Queue the geocoding of Address objects to set Location fields.
                 """
-                addr = get_elevation(addr_string_from_dict(value))
-                value["Location"]["Longitude"] = addr["Longitude"]["Value"]
-                value["Location"]["Latitude"] = addr["Latitude"]["Value"]
-                value["Location"]["Elevation"] = addr["Elevation"]["Value"]
-            rel_one_to_one.append(create_row(apps.get_model('ahj_app', field), value))
+                enqueue_geocode_jobs([rel_row])
+            rel_one_to_one.append(rel_row)
         elif type(value) is list:
             plurals_to_singular = {'Contacts': 'Contact'}
             if field in plurals_to_singular:
@@ -483,9 +515,11 @@ def edit_update(request):
                 e['AHJPK'] = AHJ.objects.get(AHJPK=e['AHJPK'])
                 model = apps.get_model('ahj_app', e['SourceTable'])
                 row = model.objects.get(pk=e['SourceRow'])
-                old_value = getattr(row, e['SourceColumn'])
                 if e['SourceColumn'] in ENUM_FIELDS:
-                    old_value = old_value.Value if old_value is not None else ''
+                    old_value = enum_registry.get_field_value(row, e['SourceColumn'])
+                    old_value = old_value if old_value is not None else ''
+                else:
+                    old_value = getattr(row, e['SourceColumn'])
                 e['OldValue'] = old_value
                 e['User'] = request.user
                 e['EditType'] = 'U'
@@ -1,12 +1,17 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.core.mail import send_mail
 from django.conf import settings
+from django.http import HttpResponse
 
 from .authentication import WebpageTokenAuth
+from .metrics import render_prometheus
 from .models import User, Comment, Edit
+from .permissions import IsSuperuser
+from .prefetch import prefetch_comment_threads
 from .utils import CommentSerializer, EditSerializer
 
 
@@ -28,12 +33,33 @@ def user_comments(request):
     Endpoint to get all the comments made by a specific user.
     """
     try:
-        comments = Comment.objects.filter(UserID=request.query_params.get('UserID'))
+        comments = list(Comment.objects.filter(UserID=request.query_params.get('UserID')))
+        prefetch_comment_threads(comments)
         return Response(CommentSerializer(comments, many=True).data, status=status.HTTP_200_OK)
     except Exception as e:
         return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+def comment_replies(request):
+    """
+    Endpoint to get a page of the replies to a comment, newest first.
+    Used to read the replies not serialized under a comment because of
+    the COMMENT_THREAD_MAX_DEPTH and COMMENT_THREAD_MAX_REPLIES limits.
+    """
+    comment_id = request.query_params.get('CommentID', None)
+    if comment_id is None:
+        return Response('Missing CommentID', status=status.HTTP_400_BAD_REQUEST)
+    try:
+        replies = Comment.objects.filter(ReplyingTo=int(comment_id)).order_by('-Date', '-CommentID')
+    except ValueError:
+        return Response('Invalid CommentID', status=status.HTTP_400_BAD_REQUEST)
+    paginator = LimitOffsetPagination()
+    page = paginator.paginate_queryset(replies, request)
+    prefetch_comment_threads(page)
+    return paginator.get_paginated_response(CommentSerializer(page, many=True).data)
+
+
 @api_view(['POST'])
 @authentication_classes([WebpageTokenAuth])
 @permission_classes([IsAuthenticated])
@@ -49,6 +75,7 @@ def comment_submit(request):
     comment = Comment.objects.create(UserID=User.objects.get(Email=request.user),
                                      AHJPK=AHJPK,
                                      CommentText=comment_text, ReplyingTo=ReplyingTo)
+    prefetch_comment_threads([comment])
     # send the serialized comment back to the front-end
     return Response(CommentSerializer(comment).data, status=status.HTTP_200_OK)
 
@@ -79,3 +106,12 @@ def send_support_email(request):
         return Response(status=status.HTTP_200_OK)
     except Exception as e:
         return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsSuperuser])
+def metrics(request):
+    """
+    Endpoint serving the request metrics of this process in the Prometheus text format
+    """
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -13,6 +13,7 @@ from django.db import transaction
 from django.conf import settings
 
 from .authentication import WebpageTokenAuth
+from .documents import invalidate_ahj_documents, get_user_ahjpks
 from .models import AHJUserMaintains, AHJ, User, APIToken, Contact, PreferredContactMethod
 from .permissions import IsSuperuser
 from .serializers import UserSerializer
@@ -84,6 +85,7 @@ def user_update(request):
     user = request.user
     User.objects.filter(UserID=user.UserID).update(**user_data)
     Contact.objects.filter(ContactID=user.ContactID.ContactID).update(**contact_data)
+    invalidate_ahj_documents(get_user_ahjpks([user.UserID]), public=False)
     return Response('Success', status=status.HTTP_200_OK)
 
 
@@ -117,6 +119,7 @@ def set_ahj_maintainer(request):
         maintainer_record = AHJUserMaintains.objects.filter(AHJPK=ahj, UserID=user)
         if maintainer_record.exists():
             maintainer_record.update(MaintainerStatus=True)
+            invalidate_ahj_documents(get_user_ahjpks([user.UserID]), public=False)
         else:
             AHJUserMaintains.objects.create(UserID=user, AHJPK=ahj, MaintainerStatus=True)
         return Response(UserSerializer(user).data, status=status.HTTP_200_OK)
@@ -138,6 +141,7 @@ def remove_ahj_maintainer(request):
         user = User.objects.get(Username=username)
         ahj = AHJ.objects.get(AHJPK=ahjpk)
         AHJUserMaintains.objects.filter(AHJPK=ahj, UserID=user).update(MaintainerStatus=False)
+        invalidate_ahj_documents(get_user_ahjpks([user.UserID]), public=False)
         return Response(UserSerializer(user).data, status=status.HTTP_200_OK)
     except Exception as e:
         return Response(str(e), status=status.HTTP_400_BAD_REQUEST)